@@ -0,0 +1,214 @@
+"""Seeds a test database with many events and reports query counts,
+timings and query plans for the calendar hot paths.
+
+Runs against a fresh test database created from the current Django settings,
+which is destroyed afterwards. Caches are replaced with a local memory cache.
+
+Usage:
+    python benchmarks/calendar_queries.py [--events 100000] [--runs 3]
+"""
+import argparse
+from datetime import timedelta
+import os
+from pathlib import Path
+import random
+import sys
+import time
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "testauth.settings")
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.core.cache import cache  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.test import RequestFactory  # noqa: E402
+from django.test.utils import (  # noqa: E402
+    CaptureQueriesContext,
+    override_settings,
+    setup_test_environment,
+)
+from django.utils import timezone  # noqa: E402
+
+from allianceauth.tests.auth_utils import AuthUtils  # noqa: E402
+
+from opcalendar.calendar import Calendar  # noqa: E402
+from opcalendar.importer import ImportSync  # noqa: E402
+from opcalendar.models import (  # noqa: E402
+    Event,
+    EventCategory,
+    EventHost,
+    EventVisibility,
+    IngameEvents,
+    Owner,
+    UserFeedToken,
+)
+from opcalendar import views  # noqa: E402
+
+LOCMEM_CACHES = {
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}
+}
+
+
+def seed(events: int) -> dict:
+    """creates events spread over two years around today"""
+    random.seed(42)
+    user = AuthUtils.create_user("Benchmark User")
+    AuthUtils.add_main_character_2(user, "Benchmark User", 90000001, 98000001)
+    user = AuthUtils.add_permission_to_user_by_name("opcalendar.basic_access", user)
+
+    hosts = [EventHost.objects.create(community="Host %s" % x) for x in range(5)]
+    categories = [
+        EventCategory.objects.create(name="Category %s" % x, ticker="C%s" % x)
+        for x in range(5)
+    ]
+    visibilities = [
+        EventVisibility.objects.create(name="Visibility %s" % x, include_in_feed=True)
+        for x in range(5)
+    ]
+    owner = Owner.objects.create()
+
+    now = timezone.now()
+    batch = []
+    for x in range(events):
+        start = now + timedelta(minutes=random.randint(-525600, 525600))
+        batch.append(
+            Event(
+                operation_type=random.choice(categories),
+                title="Event %s" % x,
+                host=random.choice(hosts),
+                doctrine="doctrine",
+                formup_system="Jita",
+                description="description",
+                start_time=start,
+                end_time=start + timedelta(hours=2),
+                fc="fc",
+                external=x % 3 == 0,
+                event_visibility=random.choice(visibilities + [None]),
+                user=user,
+            )
+        )
+    Event.objects.bulk_create(batch, batch_size=5000)
+
+    ingame_events = []
+    for x in range(events // 100):
+        start = now + timedelta(minutes=random.randint(-525600, 525600))
+        ingame_events.append(
+            IngameEvents(
+                event_id=x + 1,
+                owner=owner,
+                event_start_date=start,
+                event_end_date=start + timedelta(hours=1),
+                title="Ingame event %s" % x,
+                text="text",
+                owner_type="corporation",
+                owner_name="Corporation",
+                host=hosts[0],
+                importance="0",
+                duration="60",
+            )
+        )
+    IngameEvents.objects.bulk_create(ingame_events, batch_size=5000)
+
+    return {"user": user, "token": UserFeedToken.objects.create(user=user)}
+
+
+def measure(name: str, func, runs: int, clear_cache: bool = True) -> None:
+    timings = []
+    for _ in range(runs):
+        if clear_cache:
+            cache.clear()
+        with CaptureQueriesContext(connection) as context:
+            start = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - start)
+    print(
+        "{:<36} {:>8} {:>10.1f}".format(
+            name, len(context.captured_queries), min(timings) * 1000
+        )
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--events", type=int, default=100000)
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    setup_test_environment()
+    with override_settings(CACHES=LOCMEM_CACHES, DEBUG=True):
+        old_name = connection.creation.create_test_db(verbosity=0)
+        try:
+            print("Seeding {} events...".format(args.events))
+            data = seed(args.events)
+            user = data["user"]
+            now = timezone.localtime()
+            factory = RequestFactory()
+
+            def json_api():
+                request = factory.get("/opcalendar/events.json")
+                request.user = user
+                views.calendar_events_json(request)
+
+            def public_feed():
+                response = views.EventFeed()(factory.get("/opcalendar/feed.ics"))
+                b"".join(response.streaming_content)
+
+            def user_feed():
+                views.user_feed(factory.get("/"), data["token"].token)
+
+            def upcoming_events():
+                list(
+                    Event.objects.visible_to(user)
+                    .filter(start_time__gte=timezone.now())
+                    .order_by("start_time")[:20]
+                )
+                list(
+                    IngameEvents.objects.visible_to(user)
+                    .filter(event_start_date__gte=timezone.now())
+                    .order_by("event_start_date")[:20]
+                )
+
+            print("{:<36} {:>8} {:>10}".format("view", "queries", "best ms"))
+            measure(
+                "calendar month",
+                lambda: Calendar(now.year, now.month, user).formatmonth(),
+                args.runs,
+            )
+            measure(
+                "calendar month (cached)",
+                lambda: Calendar(now.year, now.month, user).formatmonth(),
+                args.runs,
+                clear_cache=False,
+            )
+            measure("events.json", json_api, args.runs)
+            measure("feed.ics", public_feed, args.runs)
+            measure("personal feed", user_feed, args.runs)
+            measure("personal feed (cached)", user_feed, args.runs, False)
+            measure("upcoming events (ops command)", upcoming_events, args.runs)
+            measure("NPSI import matching", ImportSync, args.runs)
+
+            month_start, month_end = Calendar(now.year, now.month)._month_range()
+            print("\nQuery plan calendar month:")
+            print(
+                Event.objects.visible_to(user)
+                .filter(start_time__gte=month_start, start_time__lt=month_end)
+                .explain()
+            )
+            print("\nQuery plan upcoming events:")
+            print(
+                Event.objects.filter(start_time__gte=timezone.now())
+                .order_by("start_time")[:20]
+                .explain()
+            )
+            print("\nQuery plan NPSI import matching:")
+            print(Event.objects.filter(external=True).values_list("pk").explain())
+
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""Measures the cost of loading the ESI client for opcalendar.
+
+Compares building a client from a full ESI spec with the trimmed spec
+bundled with opcalendar. Each measurement runs in a fresh process.
+
+Run from the repository root with the test settings available.
+
+Usage:
+    python benchmarks/esi_client_startup.py [FULL_SPEC]
+
+FULL_SPEC is the path to a full ESI spec,
+e.g. downloaded from https://esi.evetech.net/latest/swagger.json
+"""
+import json
+from pathlib import Path
+import subprocess
+import sys
+
+BUNDLED_SPEC = Path(__file__).parent.parent / "opcalendar" / "swagger.json"
+
+MEASURE = """
+import json, os, resource, sys, time
+import django
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "testauth.settings")
+django.setup()
+from esi.clients import read_spec
+rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+start = time.perf_counter()
+read_spec(sys.argv[1])
+duration = time.perf_counter() - start
+rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({"seconds": duration, "rss_kb": rss_after - rss_before}))
+"""
+
+
+def measure(spec_path: Path, runs: int = 3) -> dict:
+    results = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", MEASURE, str(spec_path)],
+            check=True,
+            cwd=Path(__file__).parent.parent,
+            capture_output=True,
+            text=True,
+        ).stdout
+        results.append(json.loads(output))
+
+    return {
+        "size_kb": spec_path.stat().st_size / 1024,
+        "seconds": min(x["seconds"] for x in results),
+        "rss_kb": min(x["rss_kb"] for x in results),
+    }
+
+
+def main():
+    specs = {"bundled": BUNDLED_SPEC}
+    if len(sys.argv) > 1:
+        specs["full"] = Path(sys.argv[1])
+
+    print("{:<10} {:>10} {:>10} {:>12}".format("spec", "size KB", "load s", "RSS KB"))
+    for name, path in specs.items():
+        result = measure(path)
+        print(
+            "{:<10} {:>10.0f} {:>10.3f} {:>12}".format(
+                name, result["size_kb"], result["seconds"], result["rss_kb"]
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
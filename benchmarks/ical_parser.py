@@ -0,0 +1,102 @@
+"""Compares parsing a large NPSI ical feed with ics.Calendar
+and with the streaming parser of opcalendar.
+
+Reports the best time and the peak memory of each parser.
+
+Usage:
+    python benchmarks/ical_parser.py [--events 10000] [--runs 3]
+"""
+import argparse
+from datetime import datetime, timedelta
+import io
+import os
+from pathlib import Path
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "testauth.settings")
+
+import django  # noqa: E402
+
+django.setup()
+
+from ics import Calendar, Event  # noqa: E402
+import pytz  # noqa: E402
+
+from opcalendar.ical_parser import parse_events  # noqa: E402
+
+
+def generate_feed(events: int) -> bytes:
+    """generates a feed with events spread over two years around today"""
+    now = datetime.now(pytz.utc).replace(minute=0, second=0, microsecond=0)
+    calendar = Calendar()
+    for x in range(events):
+        start = now + timedelta(hours=x * 17520 // events - 8760)
+        calendar.events.add(
+            Event(
+                name="Class %s [EU]" % x,
+                begin=start,
+                end=start + timedelta(hours=2),
+                description="Fleet %s<br>Bring your best ships, and a friend" % x,
+                location="Jita",
+            )
+        )
+    return calendar.serialize().encode("utf-8")
+
+
+def parse_ics(content: bytes) -> int:
+    return len(Calendar(content.decode("utf-8")).events)
+
+
+def parse_streaming(content: bytes, window: tuple = (None, None)) -> int:
+    return sum(1 for _ in parse_events(iter(io.BytesIO(content)), *window))
+
+
+def measure(name: str, func, runs: int) -> None:
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        count = func()
+        timings.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(
+        "{:<28} {:>8} {:>10.1f} {:>12.1f}".format(
+            name, count, min(timings) * 1000, peak / 1024 / 1024
+        )
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--events", type=int, default=10000)
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    content = generate_feed(args.events)
+    now = datetime.now(pytz.utc)
+    window = (now - timedelta(days=7), now + timedelta(days=365))
+    print(
+        "Feed with {} events, {:.1f} MB\n".format(
+            args.events, len(content) / 1024 / 1024
+        )
+    )
+
+    print("{:<28} {:>8} {:>10} {:>12}".format("parser", "events", "best ms", "peak MB"))
+    measure("ics.Calendar", lambda: parse_ics(content), args.runs)
+    measure("streaming", lambda: parse_streaming(content), args.runs)
+    measure(
+        "streaming, import window",
+        lambda: parse_streaming(content, window),
+        args.runs,
+    )
+
+
+if __name__ == "__main__":
+    main()
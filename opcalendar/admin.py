@@ -9,6 +9,7 @@ from opcalendar.models import (
     Owner,
     IngameEvents,
     EventVisibility,
+    UserFeedToken,
 )
 from .forms import EventVisibilityAdminForm, EventCategoryAdminForm
 
@@ -79,7 +80,12 @@ class EventImportAdmin(admin.ModelAdmin):
         "host",
         "event_visibility",
         "operation_type",
+        "last_import_at",
+        "last_error",
+        "consecutive_failures",
     )
+    list_filter = ("source", "last_error")
+    readonly_fields = ("last_import_at", "last_error", "consecutive_failures")
 
 
 @admin.register(EventVisibility)
@@ -150,7 +156,12 @@ class OwnerAdmin(admin.ModelAdmin):
         "event_visibility",
         "operation_type",
         "is_active",
+        "last_sync_at",
+        "last_error",
+        "consecutive_failures",
     )
+    list_filter = ("is_active", "last_error")
+    readonly_fields = ("last_sync_at", "last_error", "consecutive_failures")
 
 
 @admin.register(IngameEvents)
@@ -174,4 +185,15 @@ class EventAdmin(admin.ModelAdmin):
         "operation_type",
         "event_visibility",
         "external",
+        "signup_count",
     )
+
+
+@admin.register(UserFeedToken)
+class UserFeedTokenAdmin(admin.ModelAdmin):
+    list_display = ("user", "created_date")
+    search_fields = ("user__username",)
+    readonly_fields = ("user", "token", "created_date")
+
+    def has_add_permission(self, request):
+        return False
@@ -33,11 +33,61 @@ OPCALENDAR_DISPLAY_STRUCTURETIMERS = clean_setting(
 # whether we should inculde extractions from the moonmining plugin in the calendar
 OPCALENDAR_DISPLAY_MOONMINING = clean_setting("OPCALENDAR_DISPLAY_MOONMINING", True)
 
+# how long a rendered calendar month is cached in seconds
+OPCALENDAR_CALENDAR_CACHE_TIMEOUT = clean_setting(
+    "OPCALENDAR_CALENDAR_CACHE_TIMEOUT", 3600
+)
+
+# how many days of past events are included in the ical feed
+OPCALENDAR_FEED_LOOKBACK_DAYS = clean_setting("OPCALENDAR_FEED_LOOKBACK_DAYS", 30)
+
+# how many days of upcoming events are included in the ical feed
+OPCALENDAR_FEED_LOOKAHEAD_DAYS = clean_setting("OPCALENDAR_FEED_LOOKAHEAD_DAYS", 365)
+
 # whether we display external hosts in the discord ops command filters
 OPCALENDAR_DISCORD_OPS_DISPLAY_EXTERNAL = clean_setting(
     "OPCALENDAR_DISCORD_OPS_DISPLAY_EXTERNAL", False
 )
 
+# seconds the upcoming events of the discord ops command are cached per user
+OPCALENDAR_DISCORD_OPS_CACHE_TIMEOUT = clean_setting(
+    "OPCALENDAR_DISCORD_OPS_CACHE_TIMEOUT", 60
+)
+
+# timeout in seconds for fetching a single NPSI feed
+OPCALENDAR_IMPORT_TIMEOUT = clean_setting("OPCALENDAR_IMPORT_TIMEOUT", 30)
+
+# days of past events imported from NPSI feeds
+OPCALENDAR_IMPORT_LOOKBACK_DAYS = clean_setting("OPCALENDAR_IMPORT_LOOKBACK_DAYS", 7)
+
+# days of upcoming events imported from NPSI feeds
+OPCALENDAR_IMPORT_LOOKAHEAD_DAYS = clean_setting(
+    "OPCALENDAR_IMPORT_LOOKAHEAD_DAYS", 365
+)
+
+# failed imports in a row after which a NPSI feed is skipped for a while
+OPCALENDAR_IMPORT_FAILURE_THRESHOLD = clean_setting(
+    "OPCALENDAR_IMPORT_FAILURE_THRESHOLD", 3, min_value=1
+)
+
+# seconds a failing NPSI feed is skipped, doubles per further failure
+OPCALENDAR_IMPORT_BACKOFF_BASE = clean_setting("OPCALENDAR_IMPORT_BACKOFF_BASE", 3600)
+
+# max seconds a failing NPSI feed is skipped
+OPCALENDAR_IMPORT_BACKOFF_MAX = clean_setting("OPCALENDAR_IMPORT_BACKOFF_MAX", 86400)
+
+# max number of ingame event details fetched from ESI at the same time
+OPCALENDAR_ESI_MAX_WORKERS = clean_setting("OPCALENDAR_ESI_MAX_WORKERS", 4, min_value=1)
+
+# seconds over which the syncs of all ingame calendar owners are spread
+OPCALENDAR_OWNER_SYNC_SPREAD = clean_setting("OPCALENDAR_OWNER_SYNC_SPREAD", 240)
+
+# seconds to wait before retrying an owner with a token error, doubles per failure
+OPCALENDAR_OWNER_BACKOFF_BASE = clean_setting("OPCALENDAR_OWNER_BACKOFF_BASE", 300)
+
+# max seconds to wait before retrying an owner with a token error
+OPCALENDAR_OWNER_BACKOFF_MAX = clean_setting("OPCALENDAR_OWNER_BACKOFF_MAX", 86400)
+
 OPCALENDAR_EVE_UNI_URL = "https://portal.eveuniversity.org/api/getcalendar"
 OPCALENDAR_SPECTRE_URL = "https://www.spectre-fleet.space/engagement/events/rss"
 OPCALENDAR_FUNINC_URL = "https://calendar.google.com/calendar/ical/og3uh76l8ul3dfgbie03fbbgs8%40group.calendar.google.com/private-f466889b44741fd7249e99e21ac171ff/basic.ics"
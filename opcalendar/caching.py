@@ -0,0 +1,67 @@
+import hashlib
+from datetime import datetime
+
+from django.core.cache import cache
+from django.utils import timezone
+
+from allianceauth.services.hooks import get_extension_logger
+
+logger = get_extension_logger(__name__)
+
+CALENDAR_GENERATION_KEY = "opcalendar-calendar-generation"
+CALENDAR_LAST_MODIFIED_KEY = "opcalendar-calendar-last-modified"
+
+
+def _generation(key: str) -> int:
+    return cache.get_or_set(key, 1, None)
+
+
+def _bump(key: str) -> None:
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, None)
+    cache.set(CALENDAR_LAST_MODIFIED_KEY, timezone.now(), None)
+
+
+def _month_generation_key(year: int, month: int) -> str:
+    return "opcalendar-calendar-generation-{}-{}".format(year, month)
+
+
+def month_generation(year: int, month: int) -> str:
+    """returns the current cache generation for a calendar month"""
+    return "{}.{}".format(
+        _generation(CALENDAR_GENERATION_KEY),
+        _generation(_month_generation_key(year, month)),
+    )
+
+
+def invalidate_month(year: int, month: int) -> None:
+    """invalidates all cached data for a calendar month"""
+    logger.debug("Invalidating cached calendar for %s-%s", year, month)
+    _bump(_month_generation_key(year, month))
+
+
+def invalidate_month_of(value: datetime) -> None:
+    """invalidates all cached data for the calendar month of the given time"""
+    if value:
+        value = timezone.localtime(value)
+        invalidate_month(value.year, value.month)
+
+
+def invalidate_calendar() -> None:
+    """invalidates all cached calendar data"""
+    logger.debug("Invalidating all cached calendar data")
+    _bump(CALENDAR_GENERATION_KEY)
+
+
+def last_modified() -> datetime:
+    """returns when cached calendar data has been invalidated the last time"""
+    return cache.get_or_set(CALENDAR_LAST_MODIFIED_KEY, timezone.now, None)
+
+
+def fingerprint(values) -> str:
+    """returns a short stable fingerprint for a collection of ids"""
+    return hashlib.md5(
+        ",".join(str(x) for x in sorted(values)).encode("utf-8")
+    ).hexdigest()
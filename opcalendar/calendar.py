@@ -1,14 +1,18 @@
 import operator
 from calendar import HTMLCalendar
+from collections import defaultdict
 from datetime import date
 from itertools import chain
-from datetime import datetime
-from django.db.models import Q, F
+from datetime import datetime, timedelta
+from django.core.cache import cache
+from django.db.models import F
 from django.utils import timezone
 from allianceauth.services.hooks import get_extension_logger
 
-from .models import Event, IngameEvents
+from .caching import fingerprint, month_generation
+from .models import Event, EventVisibility, IngameEvents
 from .app_settings import (
+    OPCALENDAR_CALENDAR_CACHE_TIMEOUT,
     OPCALENDAR_DISPLAY_STRUCTURETIMERS,
     OPCALENDAR_DISPLAY_MOONMINING,
 )
@@ -29,44 +33,19 @@ class Calendar(HTMLCalendar):
         self.year = year
         self.month = month
         self.user = user
+        self.events_per_day = defaultdict(list)
         super(Calendar, self).__init__()
 
     # formats a day as a td
-    # filter events by day
-    def formatday(
-        self, day, events, ingame_events, structuretimer_events, moonmining_events
-    ):
-
-        structuretimers_per_day = []
-
-        moonmining_per_day = []
-
-        events_per_day = events.filter(start_time__day=day)
-
-        ingame_events_per_day = ingame_events.filter(event_start_date__day=day)
-
-        if structuretimers_active() and OPCALENDAR_DISPLAY_STRUCTURETIMERS:
-            structuretimers_per_day = structuretimer_events.filter(start_time__day=day)
-
-        if moonmining_active() and OPCALENDAR_DISPLAY_MOONMINING:
-            moonmining_per_day = moonmining_events.filter(chunk_arrival_at__day=day)
-
-        all_events_per_day = sorted(
-            chain(
-                events_per_day,
-                ingame_events_per_day,
-                structuretimers_per_day,
-                moonmining_per_day,
-            ),
-            key=operator.attrgetter("start_time"),
-        )
+    # events are read from the per day buckets built in formatmonth
+    def formatday(self, day):
 
         d = ""
 
         # Only events for current month
         if day != 0:
             # Parse events
-            for event in all_events_per_day:
+            for event in self.events_per_day.get(day, []):
 
                 if type(event).__name__ == "Timer":
                     OBJECTIVE_UNDEFINED = "UN"
@@ -90,139 +69,188 @@ class Calendar(HTMLCalendar):
                         f"</div>"
                     )
 
-                    logger.debug("Typer type is: %s " % event.get_objective_display())
-
                 if type(event).__name__ == "Extraction":
-                    # WIP currently only required view permission
-                    if self.user.has_perm(
-                        "moonmining.extractions_access"
-                    ) and self.user.has_perm("moonmining.extractions_access"):
-                        refinery = event.refinery.name
-                        system = (
-                            event.refinery.moon.eve_moon.eve_planet.eve_solar_system.name
-                        )
-
-                        structure = refinery.replace(system, "")
-
-                        d += (
-                            f'<a class="nostyling" href="/moonmining/extraction/{event.id}?new_page=yes">'
-                            f'<div class="event {"past-event" if datetime.now(timezone.utc) > event.chunk_arrival_at else "future-event"} event-moonmining">'
-                            f'<span>{event.chunk_arrival_at.strftime("%H:%M")} <i> Moon chunk arrival {event.refinery.moon.eve_moon.name}</i></span>'
-                            f"<span>{structure[3:]}</span>"
-                            f"</div>"
-                            f"</a>"
-                        )
+                    refinery = event.refinery.name
+                    system = (
+                        event.refinery.moon.eve_moon.eve_planet.eve_solar_system.name
+                    )
+
+                    structure = refinery.replace(system, "")
+
+                    d += (
+                        f'<a class="nostyling" href="/moonmining/extraction/{event.id}?new_page=yes">'
+                        f'<div class="event {"past-event" if datetime.now(timezone.utc) > event.chunk_arrival_at else "future-event"} event-moonmining">'
+                        f'<span>{event.chunk_arrival_at.strftime("%H:%M")} <i> Moon chunk arrival {event.refinery.moon.eve_moon.name}</i></span>'
+                        f"<span>{structure[3:]}</span>"
+                        f"</div>"
+                        f"</a>"
+                    )
                 if (
                     type(event).__name__ == "Event"
                     or type(event).__name__ == "IngameEvents"
                 ):
                     d += (
-                        f"<style>{event.get_event_styling}</style>"
                         f'<a class="nostyling" href="{event.get_html_url}">'
                         f'<div class="event {event.get_date_status} {event.get_visibility_class} {event.get_category_class}">'
                         f"{event.get_html_title}"
                         f"</div>"
                         f"</a>"
                     )
-            if date.today() == date(self.year, self.month, day):
+            if timezone.localdate() == date(self.year, self.month, day):
                 return f"<td class='today'><div class='date'>{day}</div> {d}</td>"
             return f"<td><div class='date'>{day}</div> {d}</td>"
         return "<td></td>"
 
     # formats a week as a tr
-    def formatweek(
-        self, theweek, events, ingame_events, structuretimer_events, moonmining_events
-    ):
+    def formatweek(self, theweek):
         week = ""
         for d, weekday in theweek:
-            week += self.formatday(
-                d, events, ingame_events, structuretimer_events, moonmining_events
-            )
+            week += self.formatday(d)
         return f"<tr> {week} </tr>"
 
-    # formats a month as a table
-    # filter events by year and month
+    def _fetch_month_events(self) -> list:
+        """Fetches all event sources for the month with one query per source"""
+        month_start, month_end = self._month_range()
 
-    def formatmonth(self, withyear=True):
-        # Get normal events
-        # Filter by groups and states
+        # Get normal events visible for the user
         events = (
-            Event.objects.filter(
-                start_time__year=self.year,
-                start_time__month=self.month,
-            )
-            .filter(
-                Q(event_visibility__restricted_to_group__in=self.user.groups.all())
-                | Q(event_visibility__restricted_to_group__isnull=True),
-            )
-            .filter(
-                Q(event_visibility__restricted_to_state=self.user.profile.state)
-                | Q(event_visibility__restricted_to_state__isnull=True),
-            )
+            Event.objects.visible_to(self.user)
+            .filter(start_time__gte=month_start, start_time__lt=month_end)
+            .for_display()
         )
-        # Get ingame events
-        # Filter by groups and states
+        # Get ingame events visible for the user
         ingame_events = (
-            IngameEvents.objects.filter(
-                event_start_date__year=self.year, event_start_date__month=self.month
-            )
+            IngameEvents.objects.visible_to(self.user)
+            .filter(event_start_date__gte=month_start, event_start_date__lt=month_end)
             .annotate(start_time=F("event_start_date"), end_time=F("event_end_date"))
-            .filter(
-                Q(
-                    owner__event_visibility__restricted_to_group__in=self.user.groups.all()
-                )
-                | Q(owner__event_visibility__restricted_to_group__isnull=True),
-            )
-            .filter(
-                Q(owner__event_visibility__restricted_to_state=self.user.profile.state)
-                | Q(owner__event_visibility__restricted_to_state__isnull=True),
-            )
+            .for_display()
         )
 
+        all_events = list(chain(events, ingame_events))
+
         # Check if structuretimers is active
         # Should we fetch timers
-
-        if structuretimers_active() and OPCALENDAR_DISPLAY_STRUCTURETIMERS:
-            structuretimer_events = (
-                Timer.objects.all()
-                .visible_to_user(self.user)
-                .annotate(start_time=F("date"))
-                .filter(date__year=self.year, date__month=self.month)
+        if self._show_structuretimers():
+            all_events += list(
+                self._month_timers().select_related(
+                    "eve_solar_system", "structure_type"
+                )
             )
-        else:
-            structuretimer_events = Event.objects.none()
 
         # Check if moonmining is active
         # Should we fetch extractions
-        if moonmining_active() and OPCALENDAR_DISPLAY_MOONMINING:
-            moonmining_events = (
+        if self._show_extractions():
+            all_events += list(
                 Extraction.objects.all()
                 .annotate(start_time=F("chunk_arrival_at"))
                 .filter(
-                    chunk_arrival_at__year=self.year, chunk_arrival_at__month=self.month
+                    chunk_arrival_at__gte=month_start, chunk_arrival_at__lt=month_end
+                )
+                .select_related(
+                    "refinery__moon__eve_moon__eve_planet__eve_solar_system"
                 )
             )
+
+        return all_events
+
+    def _show_structuretimers(self) -> bool:
+        return structuretimers_active() and OPCALENDAR_DISPLAY_STRUCTURETIMERS
+
+    def _show_extractions(self) -> bool:
+        # WIP currently only required view permission
+        return (
+            moonmining_active()
+            and OPCALENDAR_DISPLAY_MOONMINING
+            and self.user.has_perm("moonmining.extractions_access")
+        )
+
+    def _month_range(self) -> tuple:
+        """returns the half-open datetime range of the month in the current timezone"""
+        month_start = timezone.make_aware(datetime(self.year, self.month, 1))
+        if self.month == 12:
+            month_end = timezone.make_aware(datetime(self.year + 1, 1, 1))
         else:
-            moonmining_events = Event.objects.none()
+            month_end = timezone.make_aware(datetime(self.year, self.month + 1, 1))
+        return month_start, month_end
+
+    def _month_timers(self):
+        month_start, month_end = self._month_range()
+        return (
+            Timer.objects.all()
+            .visible_to_user(self.user)
+            .annotate(start_time=F("date"))
+            .filter(date__gte=month_start, date__lt=month_end)
+        )
 
-        logger.debug(
-            "Returning %s extractions, display setting is %s. List is: %s"
-            % (
-                moonmining_events.count(),
-                OPCALENDAR_DISPLAY_MOONMINING,
-                moonmining_events,
-            )
+    def _cache_key(self, withyear) -> str:
+        """Cache key for the rendered month.
+
+        Users with the same visible events share the same key.
+        """
+        visibility_ids = EventVisibility.objects.visible_ids_for_user(self.user)
+        key = "opcalendar-calendar-{}-{}-{}-{}-{}-{}-{}".format(
+            self.year,
+            self.month,
+            month_generation(self.year, self.month),
+            fingerprint(visibility_ids),
+            int(self._show_extractions()),
+            int(withyear),
+            timezone.localdate().isoformat(),
+        )
+        # Visible structure timers depend on the user and not on visibility filters
+        if self._show_structuretimers():
+            key += "-" + fingerprint(self._month_timers().values_list("pk", flat=True))
+        return key
+
+    # formats a month as a table
+    # filter events by year and month
+
+    def formatmonth(self, withyear=True):
+        key = self._cache_key(withyear)
+        cached = cache.get(key)
+
+        # The past and future event styling changes once the next event starts
+        if cached and cached["valid_until"] > timezone.now():
+            logger.debug("Returning cached calendar for %s-%s", self.year, self.month)
+            return cached["html"]
+
+        cal, valid_until = self._render_month(withyear)
+        cache.set(
+            key,
+            {"html": cal, "valid_until": valid_until},
+            OPCALENDAR_CALENDAR_CACHE_TIMEOUT,
         )
+        return cal
+
+    def _render_month(self, withyear=True):
+        """Renders the month and returns it together with the time
+        the rendered styling becomes outdated
+        """
+        now = timezone.now()
+        valid_until = now + timedelta(seconds=OPCALENDAR_CALENDAR_CACHE_TIMEOUT)
+
+        # Bucket all events of the month by day so that rendering
+        # the grid does not need any further queries
+        self.events_per_day = defaultdict(list)
+        for event in sorted(
+            self._fetch_month_events(), key=operator.attrgetter("start_time")
+        ):
+            self.events_per_day[timezone.localtime(event.start_time).day].append(event)
+            if now < event.start_time < valid_until:
+                valid_until = event.start_time
 
-        logger.debug("Returning %s ingame events" % ingame_events.count())
+        logger.debug(
+            "Returning %s events for %s-%s"
+            % (sum(len(x) for x in self.events_per_day.values()), self.year, self.month)
+        )
 
         cal = '<table class="calendar">\n'
         cal += f"{self.formatmonthname(self.year, self.month, withyear=withyear)}\n"
         cal += f"{self.formatweekheader()}\n"
 
         for week in self.monthdays2calendar(self.year, self.month):
-            cal += f"{self.formatweek(week, events, ingame_events, structuretimer_events, moonmining_events)}\n"
+            cal += f"{self.formatweek(week)}\n"
 
         cal += "</table>"
 
-        return cal
+        return cal, valid_until
@@ -8,24 +8,30 @@ from aadiscordbot.app_settings import get_site_url
 from allianceauth.services.modules.discord.models import DiscordUser
 
 # OPCALENDAR
+import hashlib
+import heapq
 import operator
+from opcalendar.embeds import ops_fields
 from opcalendar.models import Event, IngameEvents, EventHost
-from django.db.models import Q, F
-from itertools import chain
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.db import close_old_connections
+from django.db.models import F
+from itertools import islice
 from app_utils.urls import static_file_absolute_url
-from datetime import datetime
-import os
+from django.utils import timezone
 
 import logging
 
 from opcalendar.app_settings import (
+    OPCALENDAR_DISCORD_OPS_CACHE_TIMEOUT,
     OPCALENDAR_DISCORD_OPS_DISPLAY_EXTERNAL,
 )
 
 logger = logging.getLogger(__name__)
 
-# i dont want to do this, but the below object get wont work without it, investigate.
-os.environ["DJANGO_ALLOW_ASYNC_UNSAFE"] = "true"
+OPS_CACHE_KEY = "opcalendar-discord-ops-{}-{}"
+OPS_MAX_EVENTS = 20
 
 
 class Ops(commands.Cog):
@@ -43,13 +49,8 @@ class Ops(commands.Cog):
         """
         await ctx.trigger_typing()
 
-        # Get authod ID
-        id = ctx.message.author.id
-
         url = get_site_url()
 
-        today = datetime.today()
-
         user_argument = ctx.message.content[5:]
 
         if not user_argument:
@@ -59,14 +60,9 @@ class Ops(commands.Cog):
             host = user_argument
 
         # Get user if discord service is active
-        try:
-            discord_user = DiscordUser.objects.get(uid=id)
-
-            user = discord_user.user
-
-            discord_active = True
+        user = await _get_user(ctx.message.author.id)
 
-        except Exception:
+        if user is None:
             logger.error("Discord service is not active for user")
 
             embed = Embed(title="Command failed")
@@ -77,116 +73,111 @@ class Ops(commands.Cog):
             embed.description = "Activate the [discord service]({}/services) to access this command.".format(
                 url
             )
-            discord_active = False
 
             await ctx.reply(embed=embed)
+            return
 
-        if discord_active:
-            # Get normal events
-            # Filter by groups and states
-            events = (
-                Event.objects.filter(
-                    Q(event_visibility__restricted_to_group__in=user.groups.all())
-                    | Q(event_visibility__restricted_to_group__isnull=True),
-                )
-                .filter(
-                    Q(event_visibility__restricted_to_state=user.profile.state)
-                    | Q(event_visibility__restricted_to_state__isnull=True),
-                )
-                .filter(start_time__gte=today)
-            )
-            if user_argument:
-                events = events.filter(host__community=host)
-
-            # Get ingame events
-            # Filter by groups and states
-            ingame_events = (
-                IngameEvents.objects.annotate(
-                    start_time=F("event_start_date"),
-                    end_time=F("event_end_date"),
-                )
-                .filter(
-                    Q(
-                        owner__event_visibility__restricted_to_group__in=user.groups.all()
-                    )
-                    | Q(owner__event_visibility__restricted_to_group__isnull=True),
-                )
-                .filter(
-                    Q(owner__event_visibility__restricted_to_state=user.profile.state)
-                    | Q(owner__event_visibility__restricted_to_state__isnull=True),
-                )
-                .filter(start_time__gte=today)
-            )
+        fields = await _upcoming_event_fields(user, user_argument, url)
+        hosts = await _hosts()
 
-            hosts = EventHost.objects.all()
+        embed = Embed(title="Scheduled Opcalendar Events")
 
-            if not OPCALENDAR_DISCORD_OPS_DISPLAY_EXTERNAL:
-                hosts = hosts.filter(external=False)
+        embed.set_thumbnail(url=static_file_absolute_url("opcalendar/calendar.png"))
 
-            hosts = _hosts(hosts)
+        embed.colour = Color.blue()
 
-            if user_argument:
-                ingame_events = ingame_events.filter(host__community=host)
+        embed.description = "List view of the next 20 upcoming operations for {}. A calendar view is located in [here]({}/opcalendar).\n\nFiltering: To filter events for a specific host add the name after the command ie. `!ops my coalition`\n\nAvailable hosts: *{}*".format(
+            host, url, hosts
+        )
 
-            # Combine events, limit to 20 events
-            all_events = sorted(
-                chain(events, ingame_events),
-                key=operator.attrgetter("start_time"),
-            )[:20]
+        for name, value in fields:
+            embed.add_field(name=name, value=value, inline=False)
 
-            embed = Embed(title="Scheduled Opcalendar Events")
+        await ctx.author.send(embed=embed)
 
-            embed.set_thumbnail(url=static_file_absolute_url("opcalendar/calendar.png"))
+        embed = Embed(title="Events sent")
+        embed.colour = Color.green()
+        embed.description = "I have sent you a direct message about upcoming events."
 
-            embed.colour = Color.blue()
+        await ctx.reply(embed=embed)
 
-            embed.description = "List view of the next 20 upcoming operations for {}. A calendar view is located in [here]({}/opcalendar).\n\nFiltering: To filter events for a specific host add the name after the command ie. `!ops my coalition`\n\nAvailable hosts: *{}*".format(
-                host, url, hosts
-            )
 
-            # Format all events and ingame events
-            for event in all_events:
-                if type(event) == Event:
-                    embed.add_field(
-                        name="Event: {0} {1}".format(
-                            event.title, event.operation_type.ticker
-                        ),
-                        value="Host: {0}\nFC: {1}\nDoctrine: {2}\nLocation: {3}\nTime: {4}\n[Details]({5}/opcalendar/event/{6}/details/)\n".format(
-                            event.host,
-                            event.fc,
-                            event.doctrine,
-                            event.formup_system,
-                            event.start_time,
-                            url,
-                            event.id,
-                        ),
-                        inline=False,
-                    )
-                if type(event) == IngameEvents:
-                    embed.add_field(
-                        name="Ingame Event: {0}".format(event.title),
-                        value="Host: {0}\n Time:{1}\n[Details]({2}/opcalendar/ingame/event/{3}/details/)".format(
-                            event.owner_name,
-                            event.start_time,
-                            url,
-                            event.event_id,
-                        ),
-                        inline=False,
-                    )
-
-            await ctx.author.send(embed=embed)
-
-            embed = Embed(title="Events sent")
-            embed.colour = Color.green()
-            embed.description = (
-                "I have sent you a direct message about upcoming events."
-            )
-            discord_active = False
+def _db_task(func):
+    """runs a function with database queries in a thread pool
+    to keep the event loop of the bot free
+    """
 
-            await ctx.reply(embed=embed)
+    def _wrapped(*args, **kwargs):
+        close_old_connections()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+
+    return sync_to_async(_wrapped, thread_sensitive=False)
 
 
-def _hosts(hosts):
+@_db_task
+def _get_user(discord_id):
+    """returns the user for a discord ID or None if the service is not active"""
+    try:
+        return DiscordUser.objects.select_related("user").get(uid=discord_id).user
+    except DiscordUser.DoesNotExist:
+        return None
+
+
+@_db_task
+def _upcoming_event_fields(user, host: str, url: str) -> list:
+    """returns the embed fields of the next upcoming events visible for the user.
+
+    Results are cached per user and host filter for a short time.
+    """
+    # The filter is user input, which is no safe part of a cache key
+    cache_key = OPS_CACHE_KEY.format(
+        user.pk, hashlib.md5(host.encode("utf-8")).hexdigest()
+    )
+    fields = cache.get(cache_key)
+    if fields is not None:
+        return fields
+
+    now = timezone.now()
+
+    # Get normal events visible for the user
+    events = Event.objects.visible_to(user).for_display().filter(start_time__gte=now)
+    if host:
+        events = events.filter(host__community=host)
+    events = events.order_by("start_time")[:OPS_MAX_EVENTS]
+
+    # Get ingame events visible for the user
+    ingame_events = IngameEvents.objects.visible_to(user).filter(
+        event_start_date__gte=now
+    )
+    if host:
+        ingame_events = ingame_events.filter(host__community=host)
+    ingame_events = ingame_events.annotate(
+        start_time=F("event_start_date"),
+        end_time=F("event_end_date"),
+    ).order_by("event_start_date")[:OPS_MAX_EVENTS]
+
+    # Both sources are sorted already, merge them and keep the first ones
+    all_events = islice(
+        heapq.merge(events, ingame_events, key=operator.attrgetter("start_time")),
+        OPS_MAX_EVENTS,
+    )
+
+    fields = ops_fields(all_events, url)
+
+    cache.set(cache_key, fields, OPCALENDAR_DISCORD_OPS_CACHE_TIMEOUT)
+    return fields
+
+
+@_db_task
+def _hosts():
+    hosts = EventHost.objects.all()
+
+    if not OPCALENDAR_DISCORD_OPS_DISPLAY_EXTERNAL:
+        hosts = hosts.filter(external=False)
+
     hosts = [x.community for x in hosts]
 
     if hosts:
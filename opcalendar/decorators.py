@@ -16,7 +16,7 @@ def fetch_token_for_owner(scopes):
         def _wrapped_view(owner, *args, **kwargs):
             token, error = owner.token(scopes)
             if error:
-                raise TokenError
+                raise TokenError(error)
             return func(owner, token, *args, **kwargs)
 
         return _wrapped_view
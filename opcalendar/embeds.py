@@ -0,0 +1,227 @@
+"""Discord embeds for events and ingame events.
+
+All builders only read the relations listed in EVENT_RELATED_FIELDS and
+INGAME_EVENT_RELATED_FIELDS. Load events with these in select_related
+to build embeds for any number of events with a fixed number of queries.
+"""
+from collections import defaultdict
+import datetime
+
+from django.utils import timezone
+
+from allianceauth.services.hooks import get_extension_logger
+
+from .app_settings import get_site_url
+from .entities import resolve_entities
+from .models import Event, IngameEvents
+
+logger = get_extension_logger(__name__)
+
+RED = 16711710
+BLUE = 42751
+GREEN = 6684416
+
+CREATED = "created"
+UPDATED = "updated"
+DELETED = "deleted"
+
+COLORS = {CREATED: GREEN, UPDATED: BLUE, DELETED: RED}
+
+EVENT_RELATED_FIELDS = (
+    "eve_character",
+    "host",
+    "operation_type",
+    "event_visibility__webhook",
+)
+INGAME_EVENT_RELATED_FIELDS = ("owner__event_visibility__webhook",)
+
+EVENT_TITLES = {
+    CREATED: "New event: {}",
+    UPDATED: "Updated Event: {}",
+    DELETED: "Event deleted: {}",
+}
+IMPORTED_EVENT_TITLES = {
+    CREATED: "New NPSI event from API: {}",
+    UPDATED: "Updated Event: {}",
+    DELETED: "NPSI event deleted from API: {}",
+}
+INGAME_EVENT_TITLES = {
+    CREATED: "New ingame calendar event: {}",
+    UPDATED: "Ingame calendar event updated: {}",
+    DELETED: "Ingame calendar event deleted: {}",
+}
+
+
+def _eve_time(value: datetime.datetime) -> str:
+    return value.strftime("%Y-%m-%d %H:%M:%S")
+
+
+def event_embed(event: Event, action: str) -> dict:
+    """returns the embed for a manual or imported event"""
+    url = get_site_url() + "/opcalendar/event/%s/details/" % event.pk
+
+    if event.external:
+        fields = [{"name": "Community", "value": event.fc, "inline": True}]
+        if action != DELETED:
+            fields.append(
+                {
+                    "name": "Type",
+                    "value": event.operation_type.name,
+                    "inline": True,
+                }
+            )
+        fields.append(
+            {
+                "name": "Eve Time",
+                "value": _eve_time(event.start_time),
+                "inline": action == DELETED,
+            }
+        )
+        footer = {"icon_url": event.host.logo_url, "text": " %s" % event.host}
+
+    else:
+        main_char = event.eve_character
+        fields = [
+            {"name": "FC", "value": event.fc, "inline": True},
+            {"name": "Type", "value": event.operation_type.name, "inline": True},
+            {"name": "Formup", "value": event.formup_system, "inline": True},
+            {
+                "name": "Eve Time",
+                "value": _eve_time(event.start_time),
+                "inline": False,
+            },
+        ]
+        footer = {
+            "icon_url": main_char.portrait_url_64,
+            "text": " %s [%s], %s"
+            % (main_char.character_name, main_char.corporation_ticker, event.host),
+        }
+
+    titles = IMPORTED_EVENT_TITLES if event.external else EVENT_TITLES
+
+    return {
+        "title": titles[action].format(event.title),
+        "description": ("%s" % event.description),
+        "url": url,
+        "color": COLORS[action],
+        "fields": fields,
+        "footer": footer,
+    }
+
+
+def ingame_event_embed(event: IngameEvents, action: str, entity: dict = None) -> dict:
+    """returns the embed for an ingame event.
+
+    entity is the resolved owner of the event, see entities.resolve_entities
+    """
+    url = get_site_url() + "/opcalendar/ingame/event/{}/details/".format(event.pk)
+    ticker = "[{}]".format(entity["ticker"]) if entity and entity["ticker"] else ""
+
+    embed = {
+        "title": INGAME_EVENT_TITLES[action].format(event.title),
+        "description": ("%s" % event.text),
+        "url": url,
+        "color": COLORS[action],
+        "fields": [
+            {"name": "Owner", "value": event.owner_name, "inline": True},
+            {"name": "Eve Time", "value": _eve_time(event.event_start_date)},
+        ],
+        "footer": {"text": "{}  {}".format(event.owner_name, ticker)},
+    }
+    if entity and entity["logo_url"]:
+        embed["footer"]["icon_url"] = entity["logo_url"]
+
+    return embed
+
+
+def _visibility(event):
+    if isinstance(event, IngameEvents):
+        return event.owner.event_visibility
+    return event.event_visibility
+
+
+def _start_time(event) -> datetime.datetime:
+    if isinstance(event, IngameEvents):
+        return event.event_start_date
+    return event.start_time
+
+
+def send_embeds(events, action: str) -> None:
+    """queues the embeds for events on the webhooks of their visibility filters.
+
+    Events need to be loaded with the related fields of this module.
+    """
+    now = datetime.datetime.now(timezone.utc)
+    embeds = defaultdict(list)
+    webhooks = dict()
+    ingame_events = []
+
+    for event in events:
+        visibility = _visibility(event)
+        if not visibility or not visibility.webhook:
+            continue
+        if not visibility.webhook.enabled:
+            continue
+        if _start_time(event) < now and visibility.ignore_past_fleets:
+            logger.debug("Event %s is in the past, not sending webhook.", event)
+            continue
+
+        webhooks[visibility.webhook.pk] = visibility.webhook
+        if isinstance(event, IngameEvents):
+            ingame_events.append(event)
+        else:
+            try:
+                embeds[visibility.webhook.pk].append(event_embed(event, action))
+            except Exception:
+                logger.error("Failed to build embed for %s", event, exc_info=True)
+
+    # Look up all owners of ingame events at once
+    entities = resolve_entities(
+        (event.owner_type, event.event_owner_id) for event in ingame_events
+    )
+    for event in ingame_events:
+        entity = entities.get((event.owner_type, event.event_owner_id))
+        embeds[event.owner.event_visibility.webhook.pk].append(
+            ingame_event_embed(event, action, entity)
+        )
+
+    for webhook_pk, webhook_embeds in embeds.items():
+        webhooks[webhook_pk].send_embeds(webhook_embeds)
+
+
+def ops_fields(events, url: str) -> list:
+    """returns the names and values of the embed fields
+    for events listed by the discord ops command
+    """
+    fields = []
+    for event in events:
+        if isinstance(event, IngameEvents):
+            fields.append(
+                (
+                    "Ingame Event: {0}".format(event.title),
+                    "Host: {0}\n Time:{1}\n"
+                    "[Details]({2}/opcalendar/ingame/event/{3}/details/)".format(
+                        event.owner_name,
+                        event.event_start_date,
+                        url,
+                        event.event_id,
+                    ),
+                )
+            )
+        else:
+            fields.append(
+                (
+                    "Event: {0} {1}".format(event.title, event.operation_type.ticker),
+                    "Host: {0}\nFC: {1}\nDoctrine: {2}\nLocation: {3}\nTime: {4}\n"
+                    "[Details]({5}/opcalendar/event/{6}/details/)\n".format(
+                        event.host,
+                        event.fc,
+                        event.doctrine,
+                        event.formup_system,
+                        event.start_time,
+                        url,
+                        event.id,
+                    ),
+                )
+            )
+    return fields
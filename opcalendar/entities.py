@@ -0,0 +1,184 @@
+from bravado.exception import HTTPError
+
+from django.core.cache import cache
+
+from allianceauth.eveonline.models import EveAllianceInfo, EveCorporationInfo
+from allianceauth.services.hooks import get_extension_logger
+
+from .providers import esi
+
+logger = get_extension_logger(__name__)
+
+ENTITY_CACHE_TIMEOUT = 86400
+
+# Entities that could not be resolved are retried after this many seconds
+ENTITY_FAILURE_CACHE_TIMEOUT = 300
+
+# Cached for entities that could not be resolved
+UNRESOLVED = dict()
+
+# Categories ESI can resolve over /universe/names/
+RESOLVABLE_CATEGORIES = {"alliance", "character", "corporation", "faction"}
+
+# The image server has no logos for factions
+IMAGE_URLS = {
+    "alliance": "https://images.evetech.net/alliances/{}/logo",
+    "character": "https://images.evetech.net/characters/{}/portrait",
+    "corporation": "https://images.evetech.net/corporations/{}/logo",
+}
+
+
+def _cache_key(category: str, entity_id: int) -> str:
+    return "opcalendar-entity-{}-{}".format(category, entity_id)
+
+
+def _post_universe_names(entity_ids) -> dict:
+    return {
+        row["id"]: row["name"]
+        for row in esi.client.Universe.post_universe_names(
+            ids=list(entity_ids)
+        ).results()
+    }
+
+
+def _fetch_names(entity_ids: set) -> dict:
+    """fetches the names for the given IDs from ESI.
+
+    ESI rejects the whole request if one of the IDs is invalid,
+    so the IDs are resolved one by one when the bulk request fails.
+    """
+    try:
+        return _post_universe_names(entity_ids)
+    except (HTTPError, OSError):
+        logger.warning("Failed to resolve names for %s", entity_ids, exc_info=True)
+        if len(entity_ids) == 1:
+            return dict()
+
+    names = dict()
+    for entity_id in entity_ids:
+        try:
+            names.update(_post_universe_names([entity_id]))
+        except (HTTPError, OSError):
+            logger.warning("Failed to resolve name for %s", entity_id, exc_info=True)
+
+    return names
+
+
+def _known_tickers(entities: set) -> dict:
+    """returns the tickers of alliances and corporations known to Alliance Auth"""
+    alliance_ids = {x for category, x in entities if category == "alliance"}
+    corporation_ids = {x for category, x in entities if category == "corporation"}
+    tickers = {
+        ("alliance", alliance_id): ticker
+        for alliance_id, ticker in EveAllianceInfo.objects.filter(
+            alliance_id__in=alliance_ids
+        ).values_list("alliance_id", "alliance_ticker")
+    }
+    tickers.update(
+        {
+            ("corporation", corporation_id): ticker
+            for corporation_id, ticker in EveCorporationInfo.objects.filter(
+                corporation_id__in=corporation_ids
+            ).values_list("corporation_id", "corporation_ticker")
+        }
+    )
+    return tickers
+
+
+def _fetch_ticker(category: str, entity_id: int) -> str:
+    if category == "alliance":
+        return esi.client.Alliance.get_alliances_alliance_id(
+            alliance_id=entity_id
+        ).results()["ticker"]
+
+    if category == "corporation":
+        return esi.client.Corporation.get_corporations_corporation_id(
+            corporation_id=entity_id
+        ).results()["ticker"]
+
+    return ""
+
+
+def _fetch_entities(entities: set) -> dict:
+    """fetches name and ticker for the given entities.
+
+    Tickers are taken from Alliance Auth if possible and only fetched from ESI
+    for unknown alliances and corporations.
+    """
+    names = _fetch_names({entity_id for _, entity_id in entities})
+    tickers = _known_tickers(entities)
+
+    result = dict()
+    for category, entity_id in entities:
+        if entity_id not in names:
+            continue
+
+        ticker = tickers.get((category, entity_id))
+        if ticker is None:
+            try:
+                ticker = _fetch_ticker(category, entity_id)
+            except (HTTPError, OSError):
+                logger.warning(
+                    "Failed to fetch ticker for %s %s",
+                    category,
+                    entity_id,
+                    exc_info=True,
+                )
+                continue
+
+        result[(category, entity_id)] = {
+            "name": names[entity_id],
+            "ticker": ticker,
+        }
+
+    return result
+
+
+def resolve_entities(entities) -> dict:
+    """returns name, ticker and logo url for the given (category, id) pairs.
+
+    Entities are fetched from ESI in bulk and cached.
+    Entities that can not be resolved are missing from the result
+    and retried after a short time.
+    """
+    entities = {
+        (category, entity_id)
+        for category, entity_id in entities
+        if entity_id and category in RESOLVABLE_CATEGORIES
+    }
+    keys = {_cache_key(*entity): entity for entity in entities}
+    cached = cache.get_many(keys.keys())
+    result = {keys[key]: value for key, value in cached.items()}
+
+    missing = entities - set(result)
+    if missing:
+        logger.debug("Resolving %s entities from ESI", len(missing))
+        fetched = _fetch_entities(missing)
+        cache.set_many(
+            {_cache_key(*entity): info for entity, info in fetched.items()},
+            ENTITY_CACHE_TIMEOUT,
+        )
+        # Failures are remembered for a while to not ask ESI for every notification
+        cache.set_many(
+            {_cache_key(*entity): UNRESOLVED for entity in missing - set(fetched)},
+            ENTITY_FAILURE_CACHE_TIMEOUT,
+        )
+        result.update(fetched)
+
+    return {
+        (category, entity_id): {
+            **info,
+            "logo_url": (
+                IMAGE_URLS[category].format(entity_id)
+                if category in IMAGE_URLS
+                else None
+            ),
+        }
+        for (category, entity_id), info in result.items()
+        if info
+    }
+
+
+def entity_info(category: str, entity_id: int) -> dict:
+    """returns name, ticker and logo url for an entity or None if unknown"""
+    return resolve_entities([(category, entity_id)]).get((category, entity_id))
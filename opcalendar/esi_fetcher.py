@@ -0,0 +1,88 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from bravado.exception import HTTPError
+
+from django.core.cache import cache
+
+from allianceauth.services.hooks import get_extension_logger
+
+from .app_settings import OPCALENDAR_ESI_MAX_WORKERS
+from .providers import esi
+
+logger = get_extension_logger(__name__)
+
+# Stop sending requests when fewer errors than this remain in the ESI error window
+ESI_ERROR_LIMIT_THRESHOLD = 10
+ESI_ERROR_LIMIT_KEY = "opcalendar-esi-error-limit-reached"
+
+
+def esi_error_limit_reached() -> bool:
+    """whether we have to wait for the ESI error window to reset"""
+    return bool(cache.get(ESI_ERROR_LIMIT_KEY))
+
+
+def _track_error_limit(headers) -> None:
+    """remembers when ESI is close to blocking us, until the error window resets"""
+    try:
+        remain = int(headers.get("X-Esi-Error-Limit-Remain"))
+        reset = int(headers.get("X-Esi-Error-Limit-Reset"))
+    except (AttributeError, TypeError, ValueError):
+        return
+
+    if remain < ESI_ERROR_LIMIT_THRESHOLD:
+        logger.warning(
+            "ESI error limit nearly reached, pausing requests for %s seconds", reset
+        )
+        cache.set(ESI_ERROR_LIMIT_KEY, True, max(reset, 1))
+
+
+def _fetch_event_details(character_id: int, event_id: int, access_token: str):
+    if esi_error_limit_reached():
+        logger.debug("Skipping details for event %s due to ESI error limit", event_id)
+        return None
+
+    operation = esi.client.Calendar.get_characters_character_id_calendar_event_id(
+        character_id=character_id,
+        event_id=event_id,
+        token=access_token,
+    )
+    operation.request_config.also_return_response = True
+    try:
+        details, response = operation.results()
+    except HTTPError as ex:
+        _track_error_limit(getattr(ex.response, "headers", None))
+        raise
+
+    _track_error_limit(response.headers)
+    return details
+
+
+def fetch_event_details(character_id: int, event_ids: list, access_token: str) -> dict:
+    """fetches the details for all given calendar events concurrently.
+
+    Returns a dict with the details for each event id.
+    Events that could not be fetched are missing from the result.
+    """
+    details = dict()
+    if not event_ids:
+        return details
+
+    with ThreadPoolExecutor(max_workers=OPCALENDAR_ESI_MAX_WORKERS) as executor:
+        futures = {
+            event_id: executor.submit(
+                _fetch_event_details, character_id, event_id, access_token
+            )
+            for event_id in event_ids
+        }
+        for event_id, future in futures.items():
+            try:
+                result = future.result()
+            except Exception:
+                logger.warning(
+                    "Failed to fetch details for event %s", event_id, exc_info=True
+                )
+                continue
+            if result is not None:
+                details[event_id] = result
+
+    return details
@@ -0,0 +1,234 @@
+"""Streaming parser for VEVENT components of iCalendar feeds.
+
+Reads a feed line by line and yields one lightweight record per event,
+without building an object graph for the whole calendar.
+"""
+from datetime import datetime, timedelta
+import re
+from typing import Iterable, Iterator, NamedTuple, Optional
+
+import pytz
+
+from allianceauth.services.hooks import get_extension_logger
+
+logger = get_extension_logger(__name__)
+
+# Properties we read from events
+EVENT_PROPERTIES = {
+    "UID",
+    "DTSTART",
+    "DTEND",
+    "DURATION",
+    "SUMMARY",
+    "LOCATION",
+    "DESCRIPTION",
+    "RECURRENCE-ID",
+}
+
+DURATION_PATTERN = re.compile(
+    r"^(?P<sign>[+-])?P(?:(?P<weeks>\d+)W)?(?:(?P<days>\d+)D)?"
+    r"(?:T(?:(?P<hours>\d+)H)?(?:(?P<minutes>\d+)M)?(?:(?P<seconds>\d+)S)?)?$"
+)
+
+TEXT_ESCAPES = {"n": "\n", "N": "\n", ",": ",", ";": ";", "\\": "\\"}
+
+
+class VEvent(NamedTuple):
+    """An event from an iCalendar feed. Start and end are aware UTC datetimes"""
+
+    uid: str
+    start: datetime
+    end: datetime
+    summary: str
+    location: str
+    description: str
+    recurrence_id: str = ""
+
+    @property
+    def key(self) -> str:
+        """identifies the event or a changed occurrence of a recurring event"""
+        if self.recurrence_id:
+            return "{}/{}".format(self.uid, self.recurrence_id)
+        return self.uid
+
+
+def _decode(line) -> str:
+    if isinstance(line, bytes):
+        return line.decode("utf-8", errors="replace")
+    return line
+
+
+def unfold(lines: Iterable) -> Iterator[str]:
+    """yields the logical content lines from raw lines of a feed"""
+    current = None
+    for line in lines:
+        line = line.rstrip(b"\r\n" if isinstance(line, bytes) else "\r\n")
+
+        # Folded lines continue the previous line after a single whitespace.
+        # Folds can split multi-byte characters, so we only decode whole lines
+        if line[:1] in (" ", "\t", b" ", b"\t"):
+            if current is not None:
+                current += line[1:]
+            continue
+
+        if current is not None:
+            yield _decode(current)
+        current = line
+
+    if current:
+        yield _decode(current)
+
+
+def _split_line(line: str) -> tuple:
+    """splits a content line into its name, parameters and value"""
+    quoted = False
+    for position, char in enumerate(line):
+        if char == '"':
+            quoted = not quoted
+        elif char == ":" and not quoted:
+            head, value = line[:position], line[position + 1 :]
+            break
+    else:
+        return line.upper(), dict(), ""
+
+    name, *params = head.split(";")
+    parameters = dict()
+    for param in params:
+        key, _, param_value = param.partition("=")
+        parameters[key.upper()] = param_value.strip('"')
+    return name.upper(), parameters, value
+
+
+def _unescape(value: str) -> str:
+    return re.sub(r"\\(.)", lambda m: TEXT_ESCAPES.get(m.group(1), m.group(1)), value)
+
+
+def _parse_datetime(value: str, parameters: dict) -> tuple:
+    """returns the value as aware UTC datetime
+    and whether it was a date without time
+    """
+    value = value.strip()
+    if parameters.get("VALUE") == "DATE" or len(value) == 8:
+        day = datetime.strptime(value[:8], "%Y%m%d")
+        return pytz.utc.localize(day), True
+
+    if value.endswith("Z"):
+        return pytz.utc.localize(datetime.strptime(value[:15], "%Y%m%dT%H%M%S")), False
+
+    naive = datetime.strptime(value[:15], "%Y%m%dT%H%M%S")
+    try:
+        tz = pytz.timezone(parameters["TZID"])
+    except (KeyError, pytz.UnknownTimeZoneError):
+        # Floating times and unknown zones are treated as UTC
+        tz = pytz.utc
+    return tz.localize(naive).astimezone(pytz.utc), False
+
+
+def _parse_duration(value: str) -> Optional[timedelta]:
+    match = DURATION_PATTERN.match(value.strip())
+    if not match:
+        return None
+    duration = timedelta(
+        weeks=int(match.group("weeks") or 0),
+        days=int(match.group("days") or 0),
+        hours=int(match.group("hours") or 0),
+        minutes=int(match.group("minutes") or 0),
+        seconds=int(match.group("seconds") or 0),
+    )
+    return -duration if match.group("sign") == "-" else duration
+
+
+def _build_event(properties: dict) -> Optional[VEvent]:
+    if "DTSTART" not in properties:
+        return None
+
+    start, all_day = _parse_datetime(*properties["DTSTART"])
+    end = None
+    if "DTEND" in properties:
+        end, _ = _parse_datetime(*properties["DTEND"])
+    elif "DURATION" in properties:
+        duration = _parse_duration(properties["DURATION"][0])
+        if duration is not None:
+            end = start + duration
+    if end is None:
+        end = start + timedelta(days=1) if all_day else start
+
+    def text(name: str) -> str:
+        return _unescape(properties[name][0]) if name in properties else ""
+
+    return VEvent(
+        uid=text("UID"),
+        start=start,
+        end=end,
+        summary=text("SUMMARY"),
+        location=text("LOCATION"),
+        description=text("DESCRIPTION"),
+        recurrence_id=properties.get("RECURRENCE-ID", ("",))[0].strip(),
+    )
+
+
+def parse_events(
+    lines: Iterable,
+    window_start: datetime = None,
+    window_end: datetime = None,
+) -> Iterator[VEvent]:
+    """yields all events of a feed starting within the optional window.
+
+    Events that can not be parsed are skipped.
+    Raises ValueError when the feed is not a complete calendar.
+    """
+    properties = None
+    depth = 0
+    started = finished = False
+    for line in unfold(lines):
+        if not line.strip():
+            continue
+
+        name, parameters, value = _split_line(line)
+        if not started:
+            if name != "BEGIN" or value.upper() != "VCALENDAR":
+                raise ValueError("Feed is not an iCalendar: %s" % line[:100])
+            started = True
+            continue
+
+        if name == "END" and properties is None and value.upper() == "VCALENDAR":
+            finished = True
+            continue
+
+        if name == "BEGIN":
+            if value.upper() == "VEVENT" and properties is None:
+                properties = dict()
+                depth = 0
+            elif properties is not None:
+                # Nested components like VALARM
+                depth += 1
+            continue
+
+        if name == "END" and properties is not None:
+            if depth:
+                depth -= 1
+                continue
+
+            try:
+                event = _build_event(properties)
+            except ValueError:
+                logger.warning("Skipping event with invalid dates: %s", properties)
+                event = None
+            properties = None
+
+            if event is None:
+                continue
+            if window_start and event.start < window_start:
+                continue
+            if window_end and event.start >= window_end:
+                continue
+            yield event
+            continue
+
+        # Only keep the properties we need and only while inside an event
+        if properties is not None and not depth and name in EVENT_PROPERTIES:
+            properties.setdefault(name, (value, parameters))
+
+    # A truncated feed would look like all missing events were removed
+    if not finished:
+        raise ValueError("Feed ended before the end of the calendar")
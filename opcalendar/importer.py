@@ -0,0 +1,426 @@
+from collections import defaultdict
+import datetime
+import hashlib
+import io
+from typing import Iterator
+
+import requests
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from allianceauth.services.hooks import get_extension_logger
+
+from . import __version__
+from .app_settings import (
+    OPCALENDAR_CAS_URL,
+    OPCALENDAR_EVE_LINKNET_URL,
+    OPCALENDAR_EVE_UNI_URL,
+    OPCALENDAR_FREE_RANGE_CHIKUNS_URL,
+    OPCALENDAR_FRIDAY_YARRRR_URL,
+    OPCALENDAR_FUNINC_URL,
+    OPCALENDAR_FWAMING_DWAGONS_URL,
+    OPCALENDAR_IMPORT_LOOKAHEAD_DAYS,
+    OPCALENDAR_IMPORT_LOOKBACK_DAYS,
+    OPCALENDAR_IMPORT_TIMEOUT,
+    OPCALENDAR_NOTIFY_IMPORTS,
+    OPCALENDAR_REDEMPTION_ROAD_URL,
+    OPCALENDAR_SPECTRE_URL,
+)
+from .caching import invalidate_month_of
+from .models import Event, EventImport, WebHook
+from .embeds import BLUE, GREEN, RED
+from .signals import mute_import_notifications
+
+logger = get_extension_logger(__name__)
+
+# Max number of events listed in an import summary notification
+SUMMARY_MAX_EVENTS = 20
+
+FEED_URLS = {
+    EventImport.SPECTRE_FLEET: OPCALENDAR_SPECTRE_URL,
+    EventImport.EVE_UNIVERSITY: OPCALENDAR_EVE_UNI_URL,
+    EventImport.FUN_INC: OPCALENDAR_FUNINC_URL,
+    EventImport.FRIDAY_YARRRR: OPCALENDAR_FRIDAY_YARRRR_URL,
+    EventImport.REDEMPTION_ROAD: OPCALENDAR_REDEMPTION_ROAD_URL,
+    EventImport.CAS: OPCALENDAR_CAS_URL,
+    EventImport.FWAMING_DWAGONS: OPCALENDAR_FWAMING_DWAGONS_URL,
+    EventImport.FREE_RANGE_CHIKUNS: OPCALENDAR_FREE_RANGE_CHIKUNS_URL,
+    EventImport.EVE_LINKNET: OPCALENDAR_EVE_LINKNET_URL,
+}
+
+
+class FeedResponse:
+    """Result of fetching a feed"""
+
+    def __init__(
+        self,
+        content: bytes = None,
+        etag: str = "",
+        last_modified: str = "",
+        not_modified: bool = False,
+    ) -> None:
+        self.content = content
+        self.etag = etag
+        self.last_modified = last_modified
+        self.not_modified = not_modified
+
+    @property
+    def text(self) -> str:
+        return self.content.decode("utf-8", errors="replace")
+
+    def lines(self) -> Iterator[bytes]:
+        """iterates over the raw lines of the content without decoding all of it"""
+        return iter(io.BytesIO(self.content))
+
+
+def import_window() -> tuple:
+    """returns the start and end of the time range of imported events.
+
+    The window moves by whole days, so it stays the same for all imports of a day
+    """
+    today = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    return (
+        today - datetime.timedelta(days=OPCALENDAR_IMPORT_LOOKBACK_DAYS),
+        today + datetime.timedelta(days=OPCALENDAR_IMPORT_LOOKAHEAD_DAYS + 1),
+    )
+
+
+def _fetch_feed(
+    session: requests.Session, feeds: list, window_end: datetime.datetime
+) -> FeedResponse:
+    source = feeds[0].source
+    url = FEED_URLS[source]
+    logger.debug("%s: import feed active. Pulling events from %s", source, url)
+
+    # Only ask for changes if all feeds of the source have seen the same version.
+    # Unchanged feeds can still have events that moved into the import window
+    versions = {
+        (feed.etag, feed.last_modified, feed.import_window_end) for feed in feeds
+    }
+    headers = dict()
+    if len(versions) == 1:
+        etag, modified, feed_window_end = versions.pop()
+        if feed_window_end != window_end:
+            etag = modified = ""
+        if etag:
+            headers["If-None-Match"] = etag
+        if modified:
+            headers["If-Modified-Since"] = modified
+
+    r = session.get(url, headers=headers, timeout=OPCALENDAR_IMPORT_TIMEOUT)
+    if r.status_code == 304:
+        logger.debug("%s: Feed not modified since last import", source)
+        return FeedResponse(
+            etag=feeds[0].etag,
+            last_modified=feeds[0].last_modified,
+            not_modified=True,
+        )
+
+    r.raise_for_status()
+    return FeedResponse(
+        content=r.content,
+        etag=r.headers.get("ETag", ""),
+        last_modified=r.headers.get("Last-Modified", ""),
+    )
+
+
+def fetch_feed(feeds: list, window_end: datetime.datetime = None) -> FeedResponse:
+    """fetches the source of feeds once for all of them.
+
+    All feeds need to have the same source. Feeds are only fetched
+    conditionally when they were last imported with the same window_end.
+    Returns the FeedResponse or None if fetching the feed failed
+    """
+    with requests.Session() as session:
+        session.headers["User-Agent"] = "aa-opcalendar {}".format(__version__)
+        try:
+            return _fetch_feed(session, feeds, window_end)
+        except Exception:
+            logger.error("%s: Error in fetching fleets", feeds[0].source, exc_info=True)
+            return None
+
+
+# Fields of imported events set from feeds and feed configurations
+IMPORTED_FIELDS = (
+    "title",
+    "doctrine",
+    "formup_system",
+    "description",
+    "start_time",
+    "end_time",
+    "fc",
+    "operation_type_id",
+    "host_id",
+    "event_visibility_id",
+    "eve_character_id",
+    "user_id",
+    "import_source_id",
+    "external_uid",
+)
+
+
+def content_hash(event: Event) -> str:
+    """returns a hash over all imported fields of an event"""
+    values = []
+    for field in IMPORTED_FIELDS:
+        value = getattr(event, field)
+        if isinstance(value, datetime.datetime):
+            value = value.isoformat()
+        values.append("" if value is None else str(value))
+    return hashlib.md5("\x1f".join(values).encode("utf-8")).hexdigest()
+
+
+class ImportSync:
+    """Diffs events pulled from NPSI feeds against the stored external events
+    and applies the result in bulk.
+
+    Existing events are matched by their feed and uid and updated in place
+    when their content changed. Events without uid are matched by their
+    start time and title. With a window only events starting within it
+    are added, updated or removed. With a feed only the events of that feed
+    and events without feed are considered.
+    """
+
+    def __init__(
+        self,
+        window_start: datetime.datetime = None,
+        window_end: datetime.datetime = None,
+        feed: EventImport = None,
+    ) -> None:
+        self.window_start = window_start
+        self.window_end = window_end
+        existing = Event.objects.filter(external=True)
+        if feed:
+            existing = existing.filter(
+                Q(import_source=feed) | Q(import_source__isnull=True)
+            )
+        if window_start:
+            existing = existing.filter(start_time__gte=window_start)
+        if window_end:
+            existing = existing.filter(start_time__lt=window_end)
+
+        self._by_uid = dict()
+        self._by_title = dict()
+        self._start_times = dict()
+        self._ids_by_source = defaultdict(set)
+        for (
+            pk,
+            start_time,
+            title,
+            import_source_id,
+            external_uid,
+            stored_hash,
+        ) in existing.values_list(
+            "pk",
+            "start_time",
+            "title",
+            "import_source_id",
+            "external_uid",
+            "content_hash",
+        ):
+            if external_uid:
+                self._by_uid[(import_source_id, external_uid)] = (pk, stored_hash)
+            else:
+                # Events imported before we tracked their uid
+                self._by_title[(start_time, title)] = (pk, stored_hash)
+            self._start_times[pk] = start_time
+            self._ids_by_source[import_source_id].add(pk)
+        self._seen_ids = set()
+        self._new_events = dict()
+        self._changed_events = []
+        self._pruned_sources = set()
+
+        logger.debug("External events in database: %s", len(self._start_times))
+
+    def add(self, event: Event) -> None:
+        """adds an unsaved event pulled from a feed"""
+        if self.window_start and event.start_time < self.window_start:
+            return
+        if self.window_end and event.start_time >= self.window_end:
+            return
+
+        event.external_uid = event.external_uid[:255]
+        event.content_hash = content_hash(event)
+        if event.external_uid:
+            key = (event.import_source_id, event.external_uid)
+            pk, stored_hash = self._by_uid.get(key, (None, None))
+        else:
+            key = (event.start_time, event.title)
+            pk, stored_hash = None, None
+
+        if pk is None:
+            pk, stored_hash = self._by_title.get(
+                (event.start_time, event.title), (None, None)
+            )
+
+        # Feeds can list the same event more than once
+        if key in self._new_events or pk in self._seen_ids:
+            logger.debug("Event: %s listed more than once, skipping", event.title)
+
+        # If we get the event from API it should not be removed
+        elif pk:
+            self._seen_ids.add(pk)
+            if stored_hash == event.content_hash:
+                logger.debug("Event: %s already in database, skipping", event.title)
+            else:
+                logger.debug("Event: %s changed, updating", event.title)
+                event.pk = pk
+                self._changed_events.append(event)
+
+        else:
+            logger.debug("New event found: %s", event.title)
+            self._new_events[key] = event
+
+    def prune_source(self, feed: EventImport) -> None:
+        """removes the events of a successfully imported feed
+        that were not seen in it
+        """
+        self._pruned_sources.add(feed.pk)
+
+    def apply(self, prune_unassigned: bool = True) -> tuple:
+        """creates all new events, updates all changed events
+        and removes all unseen events of pruned feeds.
+
+        Events without feed are removed when prune_unassigned is set
+        and they were not seen in any feed.
+
+        Returns the created, the updated and the removed events
+        """
+        created = list(self._new_events.values())
+        updated = self._changed_events
+        removed = []
+
+        with transaction.atomic(), mute_import_notifications():
+            if created:
+                Event.objects.bulk_create(created, batch_size=500)
+                logger.debug("Saved %s new events in database", len(created))
+
+            if updated:
+                # bulk_update does not set auto_now fields
+                now = timezone.now()
+                for event in updated:
+                    event.updated_date = now
+                Event.objects.bulk_update(
+                    updated,
+                    IMPORTED_FIELDS + ("content_hash", "updated_date"),
+                    batch_size=500,
+                )
+                logger.debug("Updated %s changed events in database", len(updated))
+
+            pruned_sources = set(self._pruned_sources)
+            if prune_unassigned:
+                pruned_sources.add(None)
+            stale_ids = set()
+            for import_source_id in pruned_sources:
+                stale_ids |= self._ids_by_source[import_source_id] - self._seen_ids
+            if stale_ids:
+                stale = Event.objects.filter(pk__in=stale_ids).select_related(
+                    "event_visibility__webhook"
+                )
+                removed = list(stale)
+                stale.delete()
+                logger.debug("Removed %s unseen NPSI fleets", len(removed))
+
+        # bulk_create and bulk_update do not send post_save
+        months = {event.start_time for event in created + updated}
+        months |= {self._start_times[event.pk] for event in updated}
+        for month_start in months:
+            invalidate_month_of(month_start)
+
+        return created, updated, removed
+
+
+def remove_unassigned_events(
+    window_start: datetime.datetime = None, window_end: datetime.datetime = None
+) -> list:
+    """removes all imported events without feed within the window.
+
+    Only call this after all feeds were imported, which assigns their events.
+    Returns the removed events
+    """
+    stale = Event.objects.filter(external=True, import_source__isnull=True)
+    if window_start:
+        stale = stale.filter(start_time__gte=window_start)
+    if window_end:
+        stale = stale.filter(start_time__lt=window_end)
+
+    with transaction.atomic(), mute_import_notifications():
+        removed = list(stale.select_related("event_visibility__webhook"))
+        if removed:
+            Event.objects.filter(pk__in=[event.pk for event in removed]).delete()
+            logger.debug("Removed %s NPSI fleets without feed", len(removed))
+
+    return removed
+
+
+def summary_rows(created: list, updated: list, removed: list) -> list:
+    """returns the rows for the import summaries of events.
+
+    Rows are the webhook pk, the action, the start time and the title
+    of an event, so they can be passed between tasks
+    """
+    now = datetime.datetime.now(timezone.utc)
+    rows = []
+    for action, events in (
+        ("created", created),
+        ("updated", updated),
+        ("removed", removed),
+    ):
+        for event in events:
+            visibility = event.event_visibility
+            if not visibility or not visibility.webhook:
+                continue
+            if not visibility.webhook.enabled:
+                continue
+            if event.start_time < now and visibility.ignore_past_fleets:
+                continue
+            rows.append(
+                (
+                    visibility.webhook.pk,
+                    action,
+                    event.start_time.strftime("%Y-%m-%d %H:%M"),
+                    event.title,
+                )
+            )
+    return rows
+
+
+def send_summary(rows: list) -> None:
+    """sends one summary notification per webhook for imported events"""
+    if not OPCALENDAR_NOTIFY_IMPORTS:
+        return
+
+    summaries = defaultdict(lambda: {"created": [], "updated": [], "removed": []})
+    for webhook_pk, action, start_time, title in rows:
+        summaries[webhook_pk][action].append((start_time, title))
+
+    for webhook in WebHook.objects.filter(pk__in=summaries.keys()):
+        try:
+            webhook.send_embed(_summary_embed(**summaries[webhook.pk]))
+        except Exception:
+            logger.error("Failed to send import summary", exc_info=True)
+
+
+def _summary_embed(created: list, updated: list, removed: list) -> dict:
+    lines = []
+    for prefix, events in (
+        ("New", created),
+        ("Updated", updated),
+        ("Removed", removed),
+    ):
+        for start_time, title in sorted(events):
+            lines.append("{}: {} {}".format(prefix, start_time, title))
+
+    if len(lines) > SUMMARY_MAX_EVENTS:
+        more = len(lines) - SUMMARY_MAX_EVENTS
+        lines = lines[:SUMMARY_MAX_EVENTS] + ["... and {} more".format(more)]
+
+    return {
+        "title": "NPSI events updated from API: {} new, {} updated, {} removed".format(
+            len(created), len(updated), len(removed)
+        ),
+        "description": "\n".join(lines),
+        "color": GREEN if created else BLUE if updated else RED,
+    }
@@ -0,0 +1,117 @@
+from django.core.cache import cache
+from django.db import models
+from django.db.models import Q
+
+from allianceauth.services.hooks import get_extension_logger
+
+logger = get_extension_logger(__name__)
+
+VISIBILITY_CACHE_TIMEOUT = 3600
+VISIBILITY_GENERATION_KEY = "opcalendar-visibility-generation"
+
+
+class EventVisibilityManager(models.Manager):
+    def visible_ids_for_user(self, user) -> frozenset:
+        """returns the ids of all visibility filters the user is allowed to see
+
+        Results are cached per group and state membership, so all users
+        sharing the same memberships share the same cache entry.
+        """
+        group_ids = sorted(user.groups.values_list("pk", flat=True))
+        state_id = user.profile.state_id
+        key = "opcalendar-visibility-ids-{}-{}-{}".format(
+            self._generation(), state_id, ".".join(str(x) for x in group_ids)
+        )
+        visibility_ids = cache.get(key)
+        if visibility_ids is None:
+            visibility_ids = frozenset(
+                self.filter(
+                    Q(restricted_to_group__in=group_ids)
+                    | Q(restricted_to_group__isnull=True)
+                )
+                .filter(
+                    Q(restricted_to_state=state_id)
+                    | Q(restricted_to_state__isnull=True)
+                )
+                .values_list("pk", flat=True)
+                .distinct()
+            )
+            cache.set(key, visibility_ids, VISIBILITY_CACHE_TIMEOUT)
+        return visibility_ids
+
+    def invalidate_visibility_cache(self) -> None:
+        """invalidates all cached visibility ids"""
+        logger.debug("Invalidating cached visibility filters")
+        try:
+            cache.incr(VISIBILITY_GENERATION_KEY)
+        except ValueError:
+            cache.set(VISIBILITY_GENERATION_KEY, 1, None)
+
+    @staticmethod
+    def _generation() -> int:
+        return cache.get_or_set(VISIBILITY_GENERATION_KEY, 1, None)
+
+
+class EventQuerySet(models.QuerySet):
+    # Relations used when displaying events
+    DISPLAY_RELATED_FIELDS = ("event_visibility", "operation_type", "host")
+
+    def visible_to(self, user) -> models.QuerySet:
+        """events the given user is allowed to see based on visibility filters"""
+        from .models import EventVisibility
+
+        visibility_ids = EventVisibility.objects.visible_ids_for_user(user)
+        return self.filter(
+            Q(event_visibility_id__in=visibility_ids) | Q(event_visibility__isnull=True)
+        )
+
+    def for_display(self) -> models.QuerySet:
+        """events with all relations needed for displaying them preloaded"""
+        return self.select_related(*self.DISPLAY_RELATED_FIELDS)
+
+
+class EventManager(models.Manager):
+    def get_queryset(self) -> models.QuerySet:
+        return EventQuerySet(self.model, using=self._db)
+
+    def visible_to(self, user) -> models.QuerySet:
+        return self.get_queryset().visible_to(user)
+
+    def for_display(self) -> models.QuerySet:
+        return self.get_queryset().for_display()
+
+
+class IngameEventsQuerySet(models.QuerySet):
+    # Relations used when displaying ingame events
+    DISPLAY_RELATED_FIELDS = (
+        "host",
+        "owner__event_visibility",
+        "owner__operation_type",
+    )
+
+    def visible_to(self, user) -> models.QuerySet:
+        """ingame events the given user is allowed to see based on the
+        visibility filter of their owner
+        """
+        from .models import EventVisibility
+
+        visibility_ids = EventVisibility.objects.visible_ids_for_user(user)
+        return self.filter(
+            Q(owner__event_visibility_id__in=visibility_ids)
+            | Q(owner__event_visibility__isnull=True)
+        )
+
+    def for_display(self) -> models.QuerySet:
+        """ingame events with all relations needed for displaying them preloaded"""
+        return self.select_related(*self.DISPLAY_RELATED_FIELDS)
+
+
+class IngameEventsManager(models.Manager):
+    def get_queryset(self) -> models.QuerySet:
+        return IngameEventsQuerySet(self.model, using=self._db)
+
+    def visible_to(self, user) -> models.QuerySet:
+        return self.get_queryset().visible_to(user)
+
+    def for_display(self) -> models.QuerySet:
+        return self.get_queryset().for_display()
@@ -0,0 +1,48 @@
+# Generated by Django 3.1.14 on 2026-10-18 08:13
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("opcalendar", "0024_auto_20210429_1111"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="event",
+            name="import_source",
+            field=models.ForeignKey(
+                blank=True,
+                help_text="NPSI import that pulled this event",
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="events",
+                to="opcalendar.eventimport",
+            ),
+        ),
+        migrations.AddField(
+            model_name="eventimport",
+            name="etag",
+            field=models.CharField(
+                blank=True,
+                default="",
+                editable=False,
+                help_text="ETag of the last successfully imported feed response",
+                max_length=255,
+            ),
+        ),
+        migrations.AddField(
+            model_name="eventimport",
+            name="last_modified",
+            field=models.CharField(
+                blank=True,
+                default="",
+                editable=False,
+                help_text="Last-Modified of the last successfully imported feed response",
+                max_length=64,
+            ),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 3.1.14 on 2026-10-18 08:40
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("opcalendar", "0026_webhookmessage"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="event",
+            name="updated_date",
+            field=models.DateTimeField(
+                auto_now=True,
+                default=django.utils.timezone.now,
+                help_text="When the event was last changed",
+            ),
+            preserve_default=False,
+        ),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 3.1.14 on 2026-10-18 08:24
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+import opcalendar.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("opcalendar", "0027_event_updated_date"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="UserFeedToken",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "token",
+                    models.CharField(
+                        default=opcalendar.models._generate_feed_token,
+                        help_text="Secret part of the feed URL",
+                        max_length=64,
+                        unique=True,
+                    ),
+                ),
+                (
+                    "created_date",
+                    models.DateTimeField(
+                        default=django.utils.timezone.now,
+                        help_text="When the token was created",
+                    ),
+                ),
+                (
+                    "user",
+                    models.OneToOneField(
+                        help_text="User the feed belongs to",
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="opcalendar_feed_token",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "User Feed Token",
+                "verbose_name_plural": "User Feed Tokens",
+                "default_permissions": (),
+            },
+        ),
+    ]
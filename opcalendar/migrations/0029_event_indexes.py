@@ -0,0 +1,37 @@
+# Generated by Django 3.1.14 on 2026-10-18 08:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("opcalendar", "0028_userfeedtoken"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="event",
+            index=models.Index(fields=["start_time"], name="opcalendar_event_start"),
+        ),
+        migrations.AddIndex(
+            model_name="event",
+            index=models.Index(
+                fields=["event_visibility", "start_time"],
+                name="opcalendar_event_visibility",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="event",
+            index=models.Index(
+                fields=["external", "start_time", "title"],
+                name="opcalendar_event_import",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="ingameevents",
+            index=models.Index(
+                fields=["event_start_date"], name="opcalendar_ingame_start"
+            ),
+        ),
+    ]
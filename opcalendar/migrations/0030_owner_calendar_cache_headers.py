@@ -0,0 +1,34 @@
+# Generated by Django 3.1.14 on 2026-10-18 08:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("opcalendar", "0029_event_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="owner",
+            name="calendar_etag",
+            field=models.CharField(
+                blank=True,
+                default="",
+                editable=False,
+                help_text="ETag of the last calendar response from ESI",
+                max_length=128,
+            ),
+        ),
+        migrations.AddField(
+            model_name="owner",
+            name="calendar_expires",
+            field=models.DateTimeField(
+                blank=True,
+                editable=False,
+                help_text="when the last calendar response from ESI expires",
+                null=True,
+            ),
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 3.1.14 on 2026-10-18 08:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("opcalendar", "0030_owner_calendar_cache_headers"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="owner",
+            name="consecutive_failures",
+            field=models.PositiveIntegerField(
+                default=0,
+                editable=False,
+                help_text="number of failed syncs since the last successful sync",
+            ),
+        ),
+        migrations.AddField(
+            model_name="owner",
+            name="last_error",
+            field=models.PositiveSmallIntegerField(
+                choices=[
+                    (0, "No error"),
+                    (1, "Invalid token"),
+                    (2, "Expired token"),
+                    (3, "Insufficient permissions"),
+                    (4, "No character set for fetching data from ESI"),
+                    (5, "ESI API is currently unavailable"),
+                    (6, "Operaton mode does not match with current setting"),
+                    (99, "Unknown error"),
+                ],
+                default=0,
+                editable=False,
+                help_text="error of the last sync",
+            ),
+        ),
+        migrations.AddField(
+            model_name="owner",
+            name="last_sync_at",
+            field=models.DateTimeField(
+                blank=True,
+                editable=False,
+                help_text="when the calendar was last synced",
+                null=True,
+            ),
+        ),
+    ]
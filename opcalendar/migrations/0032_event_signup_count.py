@@ -0,0 +1,39 @@
+# Generated by Django 3.1.14 on 2026-10-18 08:49
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_signups(apps, schema_editor):
+    Event = apps.get_model("opcalendar", "Event")
+    EventMember = apps.get_model("opcalendar", "EventMember")
+
+    signups = (
+        EventMember.objects.filter(event=OuterRef("pk"))
+        .order_by()
+        .values("event")
+        .annotate(count=Count("pk"))
+        .values("count")
+    )
+    Event.objects.update(signup_count=Coalesce(Subquery(signups), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("opcalendar", "0031_owner_sync_health"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="event",
+            name="signup_count",
+            field=models.PositiveIntegerField(
+                default=0,
+                editable=False,
+                help_text="Number of characters signed up for the event",
+            ),
+        ),
+        migrations.RunPython(count_signups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 3.1.14 on 2026-10-18 09:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("opcalendar", "0032_event_signup_count"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="event",
+            name="content_hash",
+            field=models.CharField(
+                blank=True,
+                default="",
+                editable=False,
+                help_text="Hash of the imported content to detect changes in NPSI feeds",
+                max_length=32,
+            ),
+        ),
+        migrations.AddField(
+            model_name="event",
+            name="external_uid",
+            field=models.CharField(
+                blank=True,
+                default="",
+                editable=False,
+                help_text="Unique id of the event in its NPSI feed",
+                max_length=255,
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="event",
+            index=models.Index(
+                fields=["import_source", "external_uid"], name="opcalendar_event_uid"
+            ),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 3.1.14 on 2026-10-18 09:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("opcalendar", "0033_event_external_uid"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="eventimport",
+            name="consecutive_failures",
+            field=models.PositiveIntegerField(
+                default=0,
+                editable=False,
+                help_text="number of failed imports since the last successful import",
+            ),
+        ),
+        migrations.AddField(
+            model_name="eventimport",
+            name="last_error",
+            field=models.PositiveSmallIntegerField(
+                choices=[
+                    (0, "No error"),
+                    (1, "Fetching the feed failed"),
+                    (2, "Parsing the feed failed"),
+                ],
+                default=0,
+                editable=False,
+                help_text="error that occurred at the last import",
+            ),
+        ),
+        migrations.AddField(
+            model_name="eventimport",
+            name="last_import_at",
+            field=models.DateTimeField(
+                blank=True,
+                editable=False,
+                help_text="when the feed was last imported",
+                null=True,
+            ),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 3.1.14 on 2026-10-18 09:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("opcalendar", "0034_eventimport_health"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="eventimport",
+            name="import_window_end",
+            field=models.DateTimeField(
+                blank=True,
+                editable=False,
+                help_text="end of the import window of the last successfully imported feed",
+                null=True,
+            ),
+        ),
+    ]
@@ -1,10 +1,17 @@
-import requests
+from email.utils import parsedate_to_datetime
+import hashlib
 import json
+import secrets
+import time
+
+import requests
 
 from typing import Tuple
 from datetime import timedelta, datetime
 
-from django.db import models
+from django.core.cache import cache
+from django.db import models, transaction
+from django.db.models import F
 from django.urls import reverse
 from django.contrib.auth.models import User
 from django.utils import timezone
@@ -12,7 +19,13 @@ from django.utils.translation import ugettext_lazy as _
 from django.utils.html import strip_tags
 from django.contrib.auth.models import Group
 
-from esi.errors import TokenExpiredError, TokenInvalidError
+from bravado.exception import (
+    HTTPBadGateway,
+    HTTPGatewayTimeout,
+    HTTPNotModified,
+    HTTPServiceUnavailable,
+)
+from esi.errors import TokenError, TokenExpiredError, TokenInvalidError
 from esi.models import Token
 
 from allianceauth.authentication.models import CharacterOwnership
@@ -20,12 +33,27 @@ from allianceauth.eveonline.models import EveCharacter, EveCorporationInfo
 from allianceauth.services.hooks import get_extension_logger
 from allianceauth.authentication.models import State
 
+from .app_settings import (
+    OPCALENDAR_IMPORT_BACKOFF_BASE,
+    OPCALENDAR_IMPORT_BACKOFF_MAX,
+    OPCALENDAR_IMPORT_FAILURE_THRESHOLD,
+    OPCALENDAR_NOTIFY_IMPORTS,
+    OPCALENDAR_OWNER_BACKOFF_BASE,
+    OPCALENDAR_OWNER_BACKOFF_MAX,
+)
+from .caching import invalidate_month_of
+from .esi_fetcher import fetch_event_details
 from .providers import esi
 from .decorators import fetch_token_for_owner
+from .managers import EventManager, EventVisibilityManager, IngameEventsManager
 
 logger = get_extension_logger(__name__)
 
 
+def _generate_feed_token() -> str:
+    return secrets.token_urlsafe(32)
+
+
 class General(models.Model):
     """Meta model for app permissions"""
 
@@ -60,11 +88,14 @@ class WebHook(models.Model):
     )
     enabled = models.BooleanField(default=True, help_text=_("Is the webhook enabled?"))
 
-    def send_embed(self, embed):
-        custom_headers = {"Content-Type": "application/json"}
-        data = '{"embeds": [%s]}' % json.dumps(embed)
-        r = requests.post(self.webhook_url, headers=custom_headers, data=data)
-        r.raise_for_status()
+    # Discord limits for a single message
+    MAX_EMBEDS_PER_MESSAGE = 10
+    MAX_EMBED_CHARS_PER_MESSAGE = 6000
+
+    # Retry failed messages with exponential backoff
+    MAX_ATTEMPTS = 5
+    RETRY_BACKOFF = 30
+    RETRY_BACKOFF_MAX = 3600
 
     class Meta:
         verbose_name = "Webhook"
@@ -73,6 +104,176 @@ class WebHook(models.Model):
     def __str__(self):
         return "{}".format(self.name)
 
+    def send_embed(self, embed):
+        """queues an embed for delivery. Never blocks on network I/O"""
+        self.send_embeds([embed])
+
+    def send_embeds(self, embeds: list):
+        """queues embeds for delivery in one go"""
+        WebHookMessage.objects.bulk_create(
+            [WebHookMessage(webhook=self, embed=embed) for embed in embeds]
+        )
+        transaction.on_commit(self.schedule_delivery)
+
+    def schedule_delivery(self, countdown: float = 0):
+        """starts a task delivering all queued messages of this webhook"""
+        from .tasks import send_webhook_messages
+
+        send_webhook_messages.apply_async(
+            kwargs={"webhook_pk": self.pk}, countdown=countdown
+        )
+
+    @property
+    def _rate_limit_key(self) -> str:
+        return "opcalendar-webhook-blocked-{}".format(
+            hashlib.md5(self.webhook_url.encode("utf-8")).hexdigest()
+        )
+
+    def blocked_for(self) -> float:
+        """returns the seconds until Discord accepts messages for this webhook URL"""
+        blocked_until = cache.get(self._rate_limit_key)
+        if not blocked_until:
+            return 0
+        return max(blocked_until - time.time(), 0)
+
+    def _block(self, seconds: float) -> None:
+        if seconds > 0:
+            cache.set(self._rate_limit_key, time.time() + seconds, int(seconds) + 1)
+
+    def _update_rate_limit(self, response) -> None:
+        if response.status_code == 429:
+            try:
+                retry_after = float(response.json()["retry_after"])
+            except (ValueError, KeyError, TypeError):
+                retry_after = float(response.headers.get("Retry-After", 1))
+            logger.warning("%s: Rate limited for %s seconds", self, retry_after)
+            self._block(max(retry_after, 1))
+
+        elif response.headers.get("X-RateLimit-Remaining") == "0":
+            self._block(float(response.headers.get("X-RateLimit-Reset-After", 1)))
+
+    def _next_batch(self) -> list:
+        """returns the next due messages that fit into a single Discord message"""
+        batch = []
+        size = 0
+        for message in self.messages.filter(next_attempt_at__lte=timezone.now())[
+            : self.MAX_EMBEDS_PER_MESSAGE
+        ]:
+            size += message.embed_size()
+            if batch and size > self.MAX_EMBED_CHARS_PER_MESSAGE:
+                break
+            batch.append(message)
+        return batch
+
+    def _post(self, embeds: list) -> requests.Response:
+        return requests.post(
+            self.webhook_url,
+            headers={"Content-Type": "application/json"},
+            data=json.dumps({"embeds": embeds}),
+            timeout=30,
+        )
+
+    def send_queued_messages(self) -> None:
+        """sends all due queued messages, combining up to 10 embeds per message"""
+        while not self.blocked_for():
+            batch = self._next_batch()
+            if not batch:
+                break
+
+            try:
+                r = self._post([message.embed for message in batch])
+            except requests.exceptions.RequestException as ex:
+                logger.warning("%s: Failed to send messages: %s", self, ex)
+                self._retry_later(batch)
+                break
+
+            self._update_rate_limit(r)
+            if r.status_code == 429:
+                continue
+
+            if r.ok:
+                logger.debug("%s: Sent %s embeds", self, len(batch))
+            elif r.status_code < 500:
+                # Discord will not accept these messages on a retry
+                logger.error(
+                    "%s: Discord rejected %s embeds: %s %s",
+                    self,
+                    len(batch),
+                    r.status_code,
+                    r.text,
+                )
+            else:
+                logger.warning("%s: Discord returned %s", self, r.status_code)
+                self._retry_later(batch)
+                break
+
+            WebHookMessage.objects.filter(pk__in=[x.pk for x in batch]).delete()
+
+    def _retry_later(self, batch: list) -> None:
+        for message in batch:
+            message.attempts += 1
+            if message.attempts >= self.MAX_ATTEMPTS:
+                logger.error(
+                    "%s: Giving up on message after %s attempts: %s",
+                    self,
+                    message.attempts,
+                    message.embed.get("title"),
+                )
+                message.delete()
+            else:
+                message.next_attempt_at = timezone.now() + timedelta(
+                    seconds=min(
+                        self.RETRY_BACKOFF * 2 ** (message.attempts - 1),
+                        self.RETRY_BACKOFF_MAX,
+                    )
+                )
+                message.save(update_fields=["attempts", "next_attempt_at"])
+
+    def next_delivery_in(self):
+        """returns the seconds until the next queued message is due
+        or None if nothing is queued
+        """
+        next_attempt_at = (
+            self.messages.order_by("next_attempt_at")
+            .values_list("next_attempt_at", flat=True)
+            .first()
+        )
+        if next_attempt_at is None:
+            return None
+        return max(
+            (next_attempt_at - timezone.now()).total_seconds(), self.blocked_for()
+        )
+
+
+class WebHookMessage(models.Model):
+    """Embed queued for delivery to a Discord webhook"""
+
+    webhook = models.ForeignKey(
+        WebHook,
+        on_delete=models.CASCADE,
+        related_name="messages",
+    )
+    embed = models.JSONField()
+    created_at = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    class Meta:
+        default_permissions = ()
+        ordering = ["pk"]
+
+    def __str__(self):
+        return "{}: {}".format(self.webhook, self.embed.get("title", ""))
+
+    def embed_size(self) -> int:
+        """number of characters counting against Discord's embed limits"""
+        size = len(self.embed.get("title", "")) + len(self.embed.get("description", ""))
+        size += len(self.embed.get("footer", {}).get("text", ""))
+        size += len(self.embed.get("author", {}).get("name", ""))
+        for field in self.embed.get("fields", []):
+            size += len(field.get("name", "")) + len(field.get("value", ""))
+        return size
+
 
 class EventVisibility(models.Model):
     name = models.CharField(
@@ -132,6 +333,8 @@ class EventVisibility(models.Model):
         help_text=("Whether this visibility filter is active"),
     )
 
+    objects = EventVisibilityManager()
+
     def __str__(self) -> str:
         return str(self.name)
 
@@ -278,6 +481,16 @@ class EventImport(models.Model):
         (FREE_RANGE_CHIKUNS, _("FREE RANGE CHIKUNS")),
     ]
 
+    ERROR_NONE = 0
+    ERROR_FETCH_FAILED = 1
+    ERROR_PARSE_FAILED = 2
+
+    ERRORS_LIST = [
+        (ERROR_NONE, "No error"),
+        (ERROR_FETCH_FAILED, "Fetching the feed failed"),
+        (ERROR_PARSE_FAILED, "Parsing the feed failed"),
+    ]
+
     source = models.CharField(
         max_length=32,
         choices=IMPORT_SOURCES,
@@ -313,10 +526,78 @@ class EventImport(models.Model):
         null=True,
         help_text=_("Visibility filter that dictates who is able to see this event"),
     )
+    etag = models.CharField(
+        max_length=255,
+        default="",
+        blank=True,
+        editable=False,
+        help_text=_("ETag of the last successfully imported feed response"),
+    )
+    last_modified = models.CharField(
+        max_length=64,
+        default="",
+        blank=True,
+        editable=False,
+        help_text=_("Last-Modified of the last successfully imported feed response"),
+    )
+    import_window_end = models.DateTimeField(
+        null=True,
+        blank=True,
+        editable=False,
+        help_text=_("end of the import window of the last successfully imported feed"),
+    )
+    last_import_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        editable=False,
+        help_text=_("when the feed was last imported"),
+    )
+    last_error = models.PositiveSmallIntegerField(
+        choices=ERRORS_LIST,
+        default=ERROR_NONE,
+        editable=False,
+        help_text=_("error that occurred at the last import"),
+    )
+    consecutive_failures = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        help_text=_("number of failed imports since the last successful import"),
+    )
 
     def __str__(self):
         return str(self.source)
 
+    def record_import(self, error: int) -> None:
+        """stores the time and outcome of an import"""
+        self.last_import_at = timezone.now()
+        self.last_error = error
+        if error == self.ERROR_NONE:
+            self.consecutive_failures = 0
+        else:
+            self.consecutive_failures += 1
+        self.save(
+            update_fields=["last_import_at", "last_error", "consecutive_failures"]
+        )
+
+    def next_import_at(self):
+        """returns the earliest time for the next import or None if due now.
+
+        Feeds failing too often in a row are skipped with exponential backoff.
+        """
+        failures = self.consecutive_failures - OPCALENDAR_IMPORT_FAILURE_THRESHOLD
+        if failures < 0 or not self.last_import_at:
+            return None
+
+        delay = min(
+            OPCALENDAR_IMPORT_BACKOFF_BASE * 2**failures,
+            OPCALENDAR_IMPORT_BACKOFF_MAX,
+        )
+        return self.last_import_at + timedelta(seconds=delay)
+
+    def is_import_due(self, now=None) -> bool:
+        next_import_at = self.next_import_at()
+        return next_import_at is None or next_import_at <= (now or timezone.now())
+
     class Meta:
         verbose_name = "NPSI Event Import"
         verbose_name_plural = "NPSI Event Imports"
@@ -371,10 +652,36 @@ class Event(models.Model):
         null=True,
         help_text=_("Is the event an external event over API"),
     )
+    import_source = models.ForeignKey(
+        EventImport,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="events",
+        help_text=_("NPSI import that pulled this event"),
+    )
+    external_uid = models.CharField(
+        max_length=255,
+        default="",
+        blank=True,
+        editable=False,
+        help_text=_("Unique id of the event in its NPSI feed"),
+    )
+    content_hash = models.CharField(
+        max_length=32,
+        default="",
+        blank=True,
+        editable=False,
+        help_text=_("Hash of the imported content to detect changes in NPSI feeds"),
+    )
     created_date = models.DateTimeField(
         default=timezone.now,
         help_text=_("When the event was created"),
     )
+    updated_date = models.DateTimeField(
+        auto_now=True,
+        help_text=_("When the event was last changed"),
+    )
     eve_character = models.ForeignKey(
         EveCharacter,
         null=True,
@@ -386,6 +693,34 @@ class Event(models.Model):
         on_delete=models.CASCADE,
         help_text=_("User who created the event"),
     )
+    signup_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        help_text=_("Number of characters signed up for the event"),
+    )
+
+    objects = EventManager()
+
+    class Meta:
+        indexes = [
+            # calendar months, feeds and upcoming events
+            models.Index(fields=["start_time"], name="opcalendar_event_start"),
+            # events of a month for the visibility filters of a user
+            models.Index(
+                fields=["event_visibility", "start_time"],
+                name="opcalendar_event_visibility",
+            ),
+            # matching NPSI imports against stored events
+            models.Index(
+                fields=["external", "start_time", "title"],
+                name="opcalendar_event_import",
+            ),
+            # upserting NPSI imports by their feed uid
+            models.Index(
+                fields=["import_source", "external_uid"],
+                name="opcalendar_event_uid",
+            ),
+        ]
 
     def duration(self):
         return self.end_time - self.start_time
@@ -401,11 +736,6 @@ class Event(models.Model):
         if self.event_visibility:
             return f"{self.event_visibility.name.replace(' ', '-').lower()}"
 
-    @property
-    def get_event_styling(self):
-        if self.event_visibility:
-            return f".{self.event_visibility.name.replace(' ', '-').lower()}:before{{border-color: transparent {self.event_visibility.color} transparent transparent;border-style: solid;}} .{self.operation_type.name.replace(' ', '-').lower()} {{border-left: 6px solid {self.operation_type.color} !important;}}"
-
     @property
     def get_category_class(self):
         if self.operation_type:
@@ -434,6 +764,36 @@ class Event(models.Model):
             self.user == user and user.has_perm("opcalendar.create_event")
         )
 
+    def signup(self, character: EveCharacter) -> bool:
+        """signs up a character for this event.
+
+        Returns True if the character was not signed up before
+        """
+        with transaction.atomic():
+            _, created = EventMember.objects.get_or_create(
+                event=self, character=character
+            )
+            if created:
+                Event.objects.filter(pk=self.pk).update(
+                    signup_count=F("signup_count") + 1
+                )
+        return created
+
+    def remove_signup(self, character: EveCharacter) -> bool:
+        """removes the signup of a character for this event.
+
+        Returns True if the character was signed up
+        """
+        with transaction.atomic():
+            deleted, _ = EventMember.objects.filter(
+                event=self, character=character
+            ).delete()
+            if deleted:
+                Event.objects.filter(pk=self.pk).update(
+                    signup_count=F("signup_count") - deleted
+                )
+        return bool(deleted)
+
 
 class Owner(models.Model):
     """A corporation that holds the calendars"""
@@ -461,6 +821,14 @@ class Owner(models.Model):
         (ERROR_UNKNOWN, "Unknown error"),
     ]
 
+    # Errors that will not go away without someone fixing the owner
+    TOKEN_ERRORS = {
+        ERROR_TOKEN_INVALID,
+        ERROR_TOKEN_EXPIRED,
+        ERROR_INSUFFICIENT_PERMISSIONS,
+        ERROR_NO_CHARACTER,
+    }
+
     corporation = models.OneToOneField(
         EveCorporationInfo,
         default=None,
@@ -499,105 +867,316 @@ class Owner(models.Model):
         default=True,
         help_text=("whether this owner is currently included in the sync process"),
     )
+    calendar_etag = models.CharField(
+        max_length=128,
+        default="",
+        blank=True,
+        editable=False,
+        help_text=_("ETag of the last calendar response from ESI"),
+    )
+    calendar_expires = models.DateTimeField(
+        null=True,
+        blank=True,
+        editable=False,
+        help_text=_("when the last calendar response from ESI expires"),
+    )
+    last_sync_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        editable=False,
+        help_text=_("when the calendar was last synced"),
+    )
+    last_error = models.PositiveSmallIntegerField(
+        choices=ERRORS_LIST,
+        default=ERROR_NONE,
+        editable=False,
+        help_text=_("error of the last sync"),
+    )
+    consecutive_failures = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        help_text=_("number of failed syncs since the last successful sync"),
+    )
+
+    # ESI returns the calendar in pages of 50 events
+    CALENDAR_PAGE_SIZE = 50
+    CALENDAR_MAX_PAGES = 10
 
     class Meta:
         verbose_name = "Ingame Clanedar Owner"
         verbose_name_plural = "Ingame Calendar Owners"
 
+    def sync_events(self) -> None:
+        """syncs the events from ESI and records the outcome on the owner"""
+        try:
+            self.update_events_esi()
+        except TokenError as ex:
+            self.record_sync(ex.args[0] if ex.args else self.ERROR_TOKEN_INVALID)
+            return
+        except (
+            OSError,
+            HTTPBadGateway,
+            HTTPGatewayTimeout,
+            HTTPServiceUnavailable,
+        ):
+            self.record_sync(self.ERROR_ESI_UNAVAILABLE)
+            raise
+        except Exception:
+            self.record_sync(self.ERROR_UNKNOWN)
+            raise
+
+        self.record_sync(self.ERROR_NONE)
+
+    def record_sync(self, error: int) -> None:
+        """stores the time and outcome of a sync"""
+        self.last_sync_at = timezone.now()
+        self.last_error = error
+        if error == self.ERROR_NONE:
+            self.consecutive_failures = 0
+        else:
+            self.consecutive_failures += 1
+        self.save(update_fields=["last_sync_at", "last_error", "consecutive_failures"])
+
+    def next_sync_at(self):
+        """returns the earliest time for the next sync or None if due now.
+
+        Owners with token errors are retried with exponential backoff.
+        """
+        if (
+            self.last_error not in self.TOKEN_ERRORS
+            or not self.consecutive_failures
+            or not self.last_sync_at
+        ):
+            return None
+
+        delay = min(
+            OPCALENDAR_OWNER_BACKOFF_BASE * 2 ** (self.consecutive_failures - 1),
+            OPCALENDAR_OWNER_BACKOFF_MAX,
+        )
+        return self.last_sync_at + timedelta(seconds=delay)
+
+    def is_sync_due(self, now=None) -> bool:
+        next_sync_at = self.next_sync_at()
+        return next_sync_at is None or next_sync_at <= (now or timezone.now())
+
     @fetch_token_for_owner(["esi-calendar.read_calendar_events.v1"])
     def update_events_esi(self, token):
+        from .embeds import CREATED, DELETED, INGAME_EVENT_RELATED_FIELDS, send_embeds
+        from .signals import mute_import_notifications
+
         if self.is_active:
 
+            # The calendar can not have changed before the last response expires
+            if self.calendar_expires and self.calendar_expires > timezone.now():
+                logger.debug(
+                    "%s: Calendar cached until %s, skipping",
+                    self,
+                    self.calendar_expires,
+                )
+                return
+
+            events, headers = self._fetch_events()
+
+            if events is None:
+                logger.debug("%s: Calendar not modified since last sync", self)
+                self._store_calendar_headers(headers, self.calendar_etag)
+                return
+
             # Get all current imported fleets in database
-            event_ids_to_remove = list(
-                IngameEvents.objects.filter(owner=self).values_list(
-                    "event_id", flat=True
+            existing = {
+                event_id: (title, event_start_date)
+                for event_id, title, event_start_date in IngameEvents.objects.filter(
+                    owner=self
+                ).values_list("event_id", "title", "event_start_date")
+            }
+            logger.debug("Ingame events currently in database: %s" % list(existing))
+
+            # Event IDs are global, events shared by several calendars
+            # are kept by the owner that stored them first
+            other_owners_events = set(
+                IngameEvents.objects.filter(
+                    pk__in=[event["event_id"] for event in events]
                 )
+                .exclude(owner=self)
+                .values_list("event_id", flat=True)
             )
+
+            # Only fetch details for new events or events whose summary changed
+            changed_events = {
+                event["event_id"]: event
+                for event in events
+                if event["event_id"] not in other_owners_events
+                and existing.get(event["event_id"])
+                != (event["title"], event["event_date"])
+            }
             logger.debug(
-                "Ingame events currently in database: %s" % event_ids_to_remove
+                "%s: Fetching details for %s of %s events",
+                self,
+                len(changed_events),
+                len(events),
             )
 
-            events = self._fetch_events()
-            for event in events:
-
-                character_id = self.character.character.character_id
+            all_details = fetch_event_details(
+                self.character.character.character_id,
+                list(changed_events),
+                token.valid_access_token(),
+            )
 
-                details = (
-                    esi.client.Calendar.get_characters_character_id_calendar_event_id(
-                        character_id=character_id,
-                        event_id=event["event_id"],
-                        token=token.valid_access_token(),
-                    ).results()
+            hosts = {
+                host.community: host
+                for host in EventHost.objects.filter(
+                    community__in={x["owner_name"] for x in all_details.values()}
                 )
+            }
 
-                end_date = event["event_date"] + timedelta(minutes=details["duration"])
-
-                original = IngameEvents.objects.filter(
-                    owner=self, event_id=event["event_id"]
-                ).first()
+            # Events we could not get the details for are retried on the next sync
+            unresolved = set(changed_events) - set(all_details)
 
-                text = strip_tags(details["text"])
+            new_events = []
+            for event_id, details in all_details.items():
+                event = changed_events[event_id]
+                end_date = event["event_date"] + timedelta(minutes=details["duration"])
 
                 try:
-                    if original is not None:
+                    if event_id in existing:
+                        logger.debug("Event: %s changed, updating" % event["title"])
 
-                        logger.debug("Event: %s already in database" % event["title"])
-                        event_ids_to_remove.remove(original.event_id)
+                        # Updating over the queryset to not notify about it as a new event
+                        old_start_date = existing[event_id][1]
+                        IngameEvents.objects.filter(pk=event_id).update(
+                            text=strip_tags(details["text"]),
+                            importance=details["importance"],
+                            duration=details["duration"],
+                            event_start_date=event["event_date"],
+                            event_end_date=end_date,
+                            title=event["title"],
+                        )
+                        invalidate_month_of(old_start_date)
+                        invalidate_month_of(event["event_date"])
 
                     else:
 
                         # Check if we already have the host
-                        original_host = EventHost.objects.filter(
-                            community=details["owner_name"]
-                        ).first()
+                        host = hosts.get(details["owner_name"])
 
-                        logger.debug("Got original host: {}".format(original_host))
+                        logger.debug("Got original host: {}".format(host))
 
-                        if original_host is not None:
-                            host = original_host
-                        else:
+                        if host is None:
                             host = EventHost.objects.create(
                                 community=details["owner_name"],
                                 external=True,
                             )
-
-                        IngameEvents.objects.create(
-                            event_id=event["event_id"],
-                            owner=self,
-                            text=text,
-                            event_owner_id=details["owner_id"],
-                            owner_type=details["owner_type"],
-                            owner_name=details["owner_name"],
-                            host=host,
-                            importance=details["importance"],
-                            duration=details["duration"],
-                            event_start_date=event["event_date"],
-                            event_end_date=end_date,
-                            title=event["title"],
+                            hosts[host.community] = host
+
+                        new_events.append(
+                            IngameEvents(
+                                event_id=event_id,
+                                owner=self,
+                                text=strip_tags(details["text"]),
+                                event_owner_id=details["owner_id"],
+                                owner_type=details["owner_type"],
+                                owner_name=details["owner_name"],
+                                host=host,
+                                importance=details["importance"],
+                                duration=details["duration"],
+                                event_start_date=event["event_date"],
+                                event_end_date=end_date,
+                                title=event["title"],
+                            )
                         )
-                        logger.debug("New event created: %s" % event["title"])
+                        logger.debug("New event found: %s" % event["title"])
                 except Exception as e:
                     logger.debug("Error adding new event: %s" % e)
+                    unresolved.add(event_id)
 
             logger.debug("Removing all events that we did not get over API")
-            IngameEvents.objects.filter(pk__in=event_ids_to_remove).delete()
+            event_ids_to_remove = set(existing) - {x["event_id"] for x in events}
+            removed_events = list(
+                IngameEvents.objects.filter(pk__in=event_ids_to_remove).select_related(
+                    *INGAME_EVENT_RELATED_FIELDS
+                )
+            )
+
+            # Notify about all new and removed events at once
+            with mute_import_notifications():
+                # Another owner can store the same event while we sync
+                IngameEvents.objects.bulk_create(new_events, ignore_conflicts=True)
+                IngameEvents.objects.filter(pk__in=event_ids_to_remove).delete()
+
+            # bulk_create does not send post_save
+            for month_start in {event.event_start_date for event in new_events}:
+                invalidate_month_of(month_start)
+
+            if OPCALENDAR_NOTIFY_IMPORTS:
+                send_embeds(new_events, CREATED)
+                send_embeds(removed_events, DELETED)
+
+            if unresolved:
+                logger.warning(
+                    "%s: Could not fetch details for %s events", self, len(unresolved)
+                )
+
+            # Conditional requests only cover the first page
+            # and must not skip events that still need to be fetched
+            self._store_calendar_headers(
+                headers,
+                headers.get("ETag", "")
+                if len(events) < self.CALENDAR_PAGE_SIZE and not unresolved
+                else "",
+            )
 
             logger.debug(
                 "All events fetched for %s" % self.character.character.character_name
             )
 
     @fetch_token_for_owner(["esi-calendar.read_calendar_events.v1"])
-    def _fetch_events(self, token) -> list:
+    def _fetch_events(self, token) -> tuple:
+        """fetches all upcoming events of the calendar, page by page.
 
+        Returns the events and the response headers of the first page.
+        Events are None if the calendar did not change since the last sync.
+        """
         character_id = self.character.character.character_id
+        access_token = token.valid_access_token()
+
+        events = []
+        headers = None
+        from_event_id = None
+        for _page in range(self.CALENDAR_MAX_PAGES):
+            params = {"character_id": character_id, "token": access_token}
+            if from_event_id:
+                params["from_event"] = from_event_id
+            elif self.calendar_etag:
+                params["If-None-Match"] = self.calendar_etag
+
+            operation = esi.client.Calendar.get_characters_character_id_calendar(
+                **params
+            )
+            operation.request_config.also_return_response = True
+            try:
+                page, response = operation.results()
+            except HTTPNotModified as ex:
+                return None, ex.response.headers
+
+            if headers is None:
+                headers = response.headers
+            events += page
+
+            if len(page) < self.CALENDAR_PAGE_SIZE:
+                break
+            from_event_id = page[-1]["event_id"]
+
+        return events, headers
 
-        events = esi.client.Calendar.get_characters_character_id_calendar(
-            character_id=character_id,
-            token=token.valid_access_token(),
-        ).results()
+    def _store_calendar_headers(self, headers, etag: str) -> None:
+        try:
+            expires = parsedate_to_datetime(headers.get("Expires"))
+        except (AttributeError, TypeError, ValueError):
+            expires = None
 
-        return events
+        self.calendar_etag = etag
+        self.calendar_expires = expires
+        self.save(update_fields=["calendar_etag", "calendar_expires"])
 
     def token(self, scopes=None) -> Tuple[Token, int]:
         """returns a valid Token for the owner"""
@@ -679,12 +1258,18 @@ class IngameEvents(models.Model):
     importance = models.CharField(max_length=128)
     duration = models.CharField(max_length=128)
 
+    objects = IngameEventsManager()
+
     def __str__(self):
         return self.title
 
     class Meta:
         verbose_name = "Ingame Event"
         verbose_name_plural = "Ingame Events"
+        indexes = [
+            # calendar months, feeds and upcoming events
+            models.Index(fields=["event_start_date"], name="opcalendar_ingame_start"),
+        ]
 
     def get_absolute_url(self):
         return reverse("opcalendar:ingame-event-detail", args=(self.event_id,))
@@ -704,15 +1289,6 @@ class IngameEvents(models.Model):
         else:
             return "ingame-event"
 
-    @property
-    def get_event_styling(self):
-        d = ""
-        if self.owner.event_visibility:
-            d += f".{self.owner.event_visibility.name.replace(' ', '-').lower()}:before{{border-color: transparent {self.owner.event_visibility.color} transparent transparent;border-style: solid;}}"
-        if self.owner.operation_type:
-            d += f".{self.owner.operation_type.name.replace(' ', '-').lower()} {{border-left: 6px solid {self.owner.operation_type.color} !important;}}"
-        return d
-
     @property
     def get_category_class(self):
         if self.owner.operation_type:
@@ -739,3 +1315,35 @@ class EventMember(models.Model):
 
     class Meta:
         unique_together = ["event", "character"]
+
+
+class UserFeedToken(models.Model):
+    """Secret token for accessing the personal ical feed of a user"""
+
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        related_name="opcalendar_feed_token",
+        help_text=_("User the feed belongs to"),
+    )
+    token = models.CharField(
+        max_length=64,
+        unique=True,
+        default=_generate_feed_token,
+        help_text=_("Secret part of the feed URL"),
+    )
+    created_date = models.DateTimeField(
+        default=timezone.now,
+        help_text=_("When the token was created"),
+    )
+
+    class Meta:
+        default_permissions = ()
+        verbose_name = "User Feed Token"
+        verbose_name_plural = "User Feed Tokens"
+
+    def __str__(self):
+        return "{}".format(self.user)
+
+    def get_absolute_url(self):
+        return reverse("opcalendar:user_feed", args=(self.token,))
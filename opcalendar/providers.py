@@ -1,5 +1,6 @@
 from esi.clients import EsiClientProvider
 import os
+import threading
 from . import __version__
 
 
@@ -8,6 +9,22 @@ def get_swagger_spec_path() -> str:
     return os.path.join(os.path.dirname(os.path.abspath(__file__)), "swagger.json")
 
 
-esi = EsiClientProvider(
+class SharedEsiClientProvider(EsiClientProvider):
+    """ESI client provider that loads the spec on first use only,
+    once per process and safe to use from multiple threads
+    """
+
+    _lock = threading.Lock()
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = super().client
+        return self._client
+
+
+esi = SharedEsiClientProvider(
     spec_file=get_swagger_spec_path(), app_info_text=f"aa-opcalendar v{__version__}"
 )
@@ -0,0 +1,54 @@
+"""Stylesheet for visibility filters and categories shown on the calendar"""
+import hashlib
+
+from django.core.cache import cache
+
+from allianceauth.services.hooks import get_extension_logger
+
+from .models import EventCategory, EventVisibility
+
+logger = get_extension_logger(__name__)
+
+STYLES_CACHE_KEY = "opcalendar-calendar-styles"
+
+
+def _render_styles() -> str:
+    rules = dict()
+    for visibility in EventVisibility.objects.all():
+        rules[
+            ".{}:before".format(visibility.get_visibility_class)
+        ] = "border-color: transparent {} transparent transparent;border-style: solid;".format(
+            visibility.color
+        )
+    for category in EventCategory.objects.all():
+        rules[
+            ".{}".format(category.get_category_class)
+        ] = "border-left: 6px solid {} !important;".format(category.color)
+
+    return "".join(
+        "{} {{{}}}\n".format(selector, declarations)
+        for selector, declarations in rules.items()
+    )
+
+
+def calendar_styles() -> dict:
+    """returns the stylesheet and its version.
+
+    The version is derived from the content, so it changes with every change
+    of the stylesheet and can be used to cache the stylesheet forever.
+    """
+    styles = cache.get(STYLES_CACHE_KEY)
+    if styles is None:
+        css = _render_styles()
+        styles = {
+            "css": css,
+            "version": hashlib.md5(css.encode("utf-8")).hexdigest()[:12],
+        }
+        cache.set(STYLES_CACHE_KEY, styles, None)
+    return styles
+
+
+def invalidate_styles() -> None:
+    """invalidates the stylesheet after visibility filters or categories changed"""
+    logger.debug("Invalidating calendar stylesheet")
+    cache.delete(STYLES_CACHE_KEY)
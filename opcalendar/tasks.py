@@ -1,33 +1,42 @@
+from collections import defaultdict
 from datetime import datetime
 import re
+import uuid
 
 from bravado.exception import HTTPBadGateway, HTTPGatewayTimeout, HTTPServiceUnavailable
 from celery import shared_task
 import feedparser
-from ics import Calendar
-import requests
-import pytz
+from django.core.cache import cache
+from django.db.models import F
+from django.utils import timezone
 from django.utils.html import strip_tags
 from allianceauth.services.hooks import get_extension_logger
 from allianceauth.services.tasks import QueueOnce
 
-from .app_settings import (
-    OPCALENDAR_EVE_UNI_URL,
-    OPCALENDAR_SPECTRE_URL,
-    OPCALENDAR_FUNINC_URL,
-    OPCALENDAR_FRIDAY_YARRRR_URL,
-    OPCALENDAR_REDEMPTION_ROAD_URL,
-    OPCALENDAR_CAS_URL,
-    OPCALENDAR_FWAMING_DWAGONS_URL,
-    OPCALENDAR_FREE_RANGE_CHIKUNS_URL,
-    OPCALENDAR_EVE_LINKNET_URL,
+from .app_settings import OPCALENDAR_OWNER_SYNC_SPREAD, OPCALENDAR_TASKS_TIME_LIMIT
+from .ical_parser import parse_events
+from .importer import (
+    ImportSync,
+    fetch_feed,
+    import_window,
+    remove_unassigned_events,
+    send_summary,
+    summary_rows,
 )
-from .app_settings import OPCALENDAR_TASKS_TIME_LIMIT
-from .models import Event, EventImport, Owner
+from .models import Event, EventImport, Owner, WebHook
 
 
 DEFAULT_TASK_PRIORITY = 6
 
+WEBHOOK_LOCK_KEY = "opcalendar-webhook-delivery-{}"
+WEBHOOK_LOCK_TIMEOUT = 300
+
+NPSI_IMPORT_LOCK_KEY = "opcalendar-npsi-import-{}"
+NPSI_IMPORT_RUN_KEY = "opcalendar-npsi-import-run-{}"
+NPSI_IMPORT_PENDING_KEY = "opcalendar-npsi-import-run-{}-pending"
+NPSI_IMPORT_RESULT_KEY = "opcalendar-npsi-import-run-{}-feed-{}"
+NPSI_IMPORT_RUN_TIMEOUT = 21600
+
 logger = get_extension_logger(__name__)
 
 # Create your tasks here
@@ -51,362 +60,337 @@ TASK_ESI_KWARGS = {
 }
 
 
-@shared_task
-def import_all_npsi_fleets() -> bool:
-    """Imports all NPSI fleets from their respective APIs"""
-
-    # Get all current imported fleets in database
-    event_ids_to_remove = set(
-        Event.objects.filter(external=True).values_list("id", flat=True)
-    )
-
-    logger.debug("External events in database: {}".format(event_ids_to_remove))
-
-    # Get all import feeds
-    feeds = EventImport.objects.all()
-
-    feed_errors = False
-
-    # Check for active NPSI feeds
+@shared_task(**TASK_DEFAULT_KWARGS)
+def import_all_npsi_fleets() -> None:
+    """Imports all NPSI fleets from their respective APIs.
+
+    Starts one import task for each source with feeds that are due,
+    so every source is fetched only once. The last one to finish
+    starts finalize_npsi_import
+    """
+    feeds = list(EventImport.objects.order_by("pk"))
+
+    # Skip feeds that failed too often in a row until their backoff ends
+    now = timezone.now()
+    feeds_by_source = defaultdict(list)
     for feed in feeds:
-
-        # If Spectre Fleet is active
-        if feed.source == EventImport.SPECTRE_FLEET:
-            feed_errors |= _import_spectre_fleet(feed, event_ids_to_remove)
-
-        # Check for FUN Inc fleets
-        if feed.source == EventImport.FUN_INC:
-            feed_errors |= _import_fun_inc(feed, event_ids_to_remove)
-
-        # Check for EVE Uni events
-        if feed.source == EventImport.EVE_UNIVERSITY:
-            feed_errors |= _import_eve_uni(feed, event_ids_to_remove)
-
-        # Check for events via SPECTRE ical feed
-        if feed.source == EventImport.FRIDAY_YARRRR:
-            feed_errors |= _import_ical(
-                feed, event_ids_to_remove, OPCALENDAR_FRIDAY_YARRRR_URL
-            )
-
-        if feed.source == EventImport.REDEMPTION_ROAD:
-            feed_errors |= _import_ical(
-                feed, event_ids_to_remove, OPCALENDAR_REDEMPTION_ROAD_URL
-            )
-
-        if feed.source == EventImport.CAS:
-            feed_errors |= _import_ical(feed, event_ids_to_remove, OPCALENDAR_CAS_URL)
-
-        if feed.source == EventImport.FWAMING_DWAGONS:
-            feed_errors |= _import_ical(
-                feed, event_ids_to_remove, OPCALENDAR_FWAMING_DWAGONS_URL
+        if feed.is_import_due(now):
+            feeds_by_source[feed.source].append(feed.pk)
+        else:
+            logger.info(
+                "%s: Skipping feed after %s failed imports until %s",
+                feed,
+                feed.consecutive_failures,
+                feed.next_import_at(),
             )
 
-        if feed.source == EventImport.FREE_RANGE_CHIKUNS:
-            feed_errors |= _import_ical(
-                feed, event_ids_to_remove, OPCALENDAR_FREE_RANGE_CHIKUNS_URL
-            )
+    feed_pks = [pk for pks in feeds_by_source.values() for pk in pks]
+    run_id = uuid.uuid4().hex
+    cache.set(
+        NPSI_IMPORT_RUN_KEY.format(run_id),
+        {"feed_pks": feed_pks, "all_feeds": len(feed_pks) == len(feeds)},
+        NPSI_IMPORT_RUN_TIMEOUT,
+    )
+    cache.set(
+        NPSI_IMPORT_PENDING_KEY.format(run_id),
+        len(feeds_by_source),
+        NPSI_IMPORT_RUN_TIMEOUT,
+    )
 
-        if feed.source == EventImport.EVE_LINKNET:
-            feed_errors |= _import_ical(
-                feed, event_ids_to_remove, OPCALENDAR_EVE_LINKNET_URL
-            )
+    if not feeds_by_source:
+        finalize_npsi_import.apply_async(
+            kwargs={"run_id": run_id}, priority=DEFAULT_TASK_PRIORITY
+        )
 
-    logger.debug("Checking for NPSI fleets to be removed.")
+    for source, source_feed_pks in feeds_by_source.items():
+        import_npsi_source.apply_async(
+            kwargs={"source": source, "feed_pks": source_feed_pks, "run_id": run_id},
+            priority=DEFAULT_TASK_PRIORITY,
+        )
 
-    if feed_errors:
-        logger.error("Errors in feeds, not cleaning up operations on this run")
-        return False
 
-    else:
-        if not event_ids_to_remove:
-            logger.debug("No NPSI fleets to be removed.")
+@shared_task(**TASK_DEFAULT_KWARGS)
+def import_npsi_source(source: str, feed_pks: list, run_id: str = None) -> dict:
+    """Imports the events of one NPSI source for all of its feeds.
+
+    The source is fetched and parsed once and its events are added to each feed.
+    Only one import per source runs at a time. Returns the result of the import
+    for each feed, which is empty if the import was skipped
+    """
+    results = dict()
+    try:
+        # Overlapping runs must not import the same source twice
+        lock_key = NPSI_IMPORT_LOCK_KEY.format(source)
+        if not cache.add(lock_key, True, OPCALENDAR_TASKS_TIME_LIMIT):
+            logger.info("Import of source %s already running, skipping", source)
         else:
-            logger.debug("Removed unseen NPSI fleets")
-            # Remove all events we did not see from API
-            Event.objects.filter(pk__in=event_ids_to_remove).delete()
-        return True
+            try:
+                results = _import_source(source, feed_pks)
+            finally:
+                cache.delete(lock_key)
+
+    finally:
+        if run_id:
+            _finish_source_import(run_id, results)
+        else:
+            send_summary([row for x in results.values() for row in x["summary"]])
 
+    return results
 
-def _import_spectre_fleet(feed, event_ids_to_remove):
-    logger.debug(
-        "%s: import feed active. Pulling events from %s",
-        feed,
-        OPCALENDAR_SPECTRE_URL,
-    )
 
-    try:
-
-        # Get spectre fleets from their RSS feed
-        d = feedparser.parse(OPCALENDAR_SPECTRE_URL)
-
-        # Process each fleet entry
-        for entry in d.entries:
-
-            # Look for SF fleets only
-            if entry.author_detail.name == "Spectre Fleet":
-
-                # Only active fleets
-                if "[RESERVED]" not in entry.title:
-
-                    logger.debug("%s: Import even found: %s", feed, entry.title)
-
-                    # Format datetimes
-                    date_object = datetime.strptime(
-                        entry.published, "%a, %d %b %Y %H:%M:%S %z"
-                    )
-                    date_object.strftime("%Y-%m-%dT%H:%M")
-
-                    # Check if we already have the event stored
-                    original = Event.objects.filter(
-                        start_time=date_object, title=entry.title
-                    ).first()
-
-                    # If we get the event from API it should not be removed
-                    if original:
-
-                        logger.debug(
-                            "%s: Event: %s already in database, skipping",
-                            feed,
-                            entry.title,
-                        )
-
-                        # Remove the found fleet from the to be removed list
-                        event_ids_to_remove.discard(original.id)
-
-                    else:
-                        # Save new fleet to database
-                        Event.objects.create(
-                            operation_type=feed.operation_type,
-                            title=entry.title,
-                            host=feed.host,
-                            doctrine="see details",
-                            formup_system=feed.source,
-                            description=strip_tags(entry.description),
-                            start_time=date_object,
-                            end_time=date_object,
-                            fc=feed.source,
-                            external=True,
-                            user=feed.creator,
-                            event_visibility=feed.event_visibility,
-                            eve_character=feed.eve_character,
-                        )
-
-                        logger.debug(
-                            "%s: Saved new event in database: %s",
-                            feed,
-                            entry.title,
-                        )
-
-    except Exception:
-        logger.error("%s: Error in fetching fleets", feed, exc_info=True)
-        return True
-
-    return False
-
-
-def _import_fun_inc(feed, event_ids_to_remove):
-    logger.debug(
-        "%s: import feed active. Pulling events from %s",
-        feed,
-        OPCALENDAR_FUNINC_URL,
+def _import_source(source: str, feed_pks: list) -> dict:
+    feeds = list(
+        EventImport.objects.select_related(
+            "host", "operation_type", "creator", "eve_character", "event_visibility"
+        ).filter(pk__in=feed_pks, source=source)
     )
+    if not feeds:
+        logger.warning("No feeds with pks %s for source %s", feed_pks, source)
+        return dict()
 
-    try:
-        # Get FUN Inc fleets from google ical
-        r = requests.get(OPCALENDAR_FUNINC_URL)
-        c = Calendar(r.text)
-
-        # Parse each entry we got
-        for entry in c.events:
-
-            # Format datetime
-            start_date = datetime.utcfromtimestamp(entry.begin.timestamp).replace(
-                tzinfo=pytz.utc
-            )
-            end_date = datetime.utcfromtimestamp(entry.end.timestamp).replace(
-                tzinfo=pytz.utc
-            )
-            title = entry.name
+    window = import_window()
+    response = fetch_feed(feeds, window[1])
+    entries = None
 
-            logger.debug("%s: Import even found: %s", feed, title)
+    if response is None:
+        error = EventImport.ERROR_FETCH_FAILED
 
-            # Check if we already have the event stored
-            original = Event.objects.filter(start_time=start_date, title=title).first()
+    # Keep the events of feeds that did not change since the last run
+    elif response.not_modified:
+        error = EventImport.ERROR_NONE
 
-            # If we get the event from API it should not be removed
-            if original:
+    else:
+        try:
+            entries = _parse_feed(source, response, window)
+            error = EventImport.ERROR_NONE
+        except Exception:
+            logger.error("%s: Error in parsing fleets", source, exc_info=True)
+            error = EventImport.ERROR_PARSE_FAILED
+
+    return {
+        feed.pk: _import_entries(feed, entries, response, error, window)
+        for feed in feeds
+    }
 
-                logger.debug("%s: Event: %s already in database, skipping", feed, title)
 
-                # Remove the found fleet from the to be removed list
-                event_ids_to_remove.discard(original.id)
+def _import_entries(feed, entries, response, error, window) -> dict:
+    """adds the parsed entries of a source to a feed and records the outcome.
 
-            else:
-                # Save new fleet to database
-                event = Event(
+    entries is None when the source was not parsed
+    """
+    created, updated, removed = [], [], []
+    if entries is not None:
+        sync = ImportSync(*window, feed=feed)
+        for entry in entries:
+            sync.add(
+                Event(
+                    **entry,
                     operation_type=feed.operation_type,
-                    title=title,
                     host=feed.host,
-                    doctrine="see details",
-                    formup_system=feed.source,
-                    description=strip_tags(entry.description),
-                    start_time=start_date,
-                    end_time=end_date,
-                    fc=feed.source,
                     external=True,
+                    import_source=feed,
                     user=feed.creator,
                     event_visibility=feed.event_visibility,
                     eve_character=feed.eve_character,
                 )
+            )
 
-                logger.debug("%s: Saved new EVE UNI event in database: %s", feed, title)
+        # Remove the events we did not see in this feed.
+        # Events without feed are removed after all feeds were imported
+        sync.prune_source(feed)
+        created, updated, removed = sync.apply(prune_unassigned=False)
 
-                event.save()
+        # Only remember feed versions once their events are stored
+        feed.etag = response.etag
+        feed.last_modified = response.last_modified
+        feed.import_window_end = window[1]
+        feed.save(update_fields=["etag", "last_modified", "import_window_end"])
 
-    except Exception:
-        logger.error("%s: Error in fetching fleets", feed, exc_info=True)
-        return True
+    feed.record_import(error)
 
-    return False
+    return {
+        "error": error,
+        "parsed": entries is not None,
+        "summary": summary_rows(created, updated, removed),
+    }
 
 
-def _import_eve_uni(feed, event_ids_to_remove):
-    logger.debug(
-        "%s: import feed active. Pulling events from %s",
-        feed,
-        OPCALENDAR_EVE_UNI_URL,
+def _finish_source_import(run_id: str, results: dict) -> None:
+    """stores the results of a source import and starts the finalize step
+    once all sources of the run are done
+    """
+    cache.set_many(
+        {
+            NPSI_IMPORT_RESULT_KEY.format(run_id, feed_pk): result
+            for feed_pk, result in results.items()
+        },
+        NPSI_IMPORT_RUN_TIMEOUT,
     )
-
     try:
-        # Get EVE Uni events from their API feed (ical)
-        r = requests.get(OPCALENDAR_EVE_UNI_URL)
-        c = Calendar(r.text)
-        for entry in c.events:
+        pending = cache.decr(NPSI_IMPORT_PENDING_KEY.format(run_id))
+    except ValueError:
+        logger.warning("NPSI import run %s expired before it was finished", run_id)
+        return
+
+    if pending <= 0:
+        finalize_npsi_import.apply_async(
+            kwargs={"run_id": run_id}, priority=DEFAULT_TASK_PRIORITY
+        )
 
-            # Filter only class events as they are the only public events in eveuni
-            if "class" in entry.name.lower():
 
-                # Format datetime
-                start_date = datetime.utcfromtimestamp(entry.begin.timestamp).replace(
-                    tzinfo=pytz.utc
-                )
-                end_date = datetime.utcfromtimestamp(entry.end.timestamp).replace(
-                    tzinfo=pytz.utc
-                )
-                title = re.sub(r"[\(\[].*?[\)\]]", "", entry.name)
-
-                logger.debug("%s: Import even found: %s", feed, title)
-
-                # Check if we already have the event stored
-                original = Event.objects.filter(
-                    start_time=start_date, title=title
-                ).first()
-
-                # If we get the event from API it should not be removed
-                if original:
-
-                    logger.debug(
-                        "%s: Event: %s already in database, skipping", feed, title
-                    )
-
-                    # Remove the found fleet from the to be removed list
-                    event_ids_to_remove.discard(original.id)
-
-                else:
-                    # Save new event to database
-                    event = Event(
-                        operation_type=feed.operation_type,
-                        title=title,
-                        host=feed.host,
-                        doctrine="see details",
-                        formup_system=feed.source,
-                        description=strip_tags(entry.description.replace("<br>", "\n")),
-                        start_time=start_date,
-                        end_time=end_date,
-                        fc=feed.source,
-                        external=True,
-                        user=feed.creator,
-                        event_visibility=feed.event_visibility,
-                        eve_character=feed.eve_character,
-                    )
-
-                    logger.debug(
-                        "%s: Saved new EVE UNI event in database: %s",
-                        feed,
-                        title,
-                    )
-                    event.save()
-
-    except Exception:
-        logger.error("%s: Error in fetching fleets", feed, exc_info=True)
-        return True
-
-    return False
-
-
-def _import_ical(feed, event_ids_to_remove, url):
-    logger.debug(
-        "%s: import feed active. Pulling events from %s",
-        feed,
-        url,
+@shared_task(**TASK_DEFAULT_KWARGS)
+def finalize_npsi_import(run_id: str) -> bool:
+    """Aggregates the results of all feed imports of a run,
+    removes imported events without feed and sends the import summaries.
+
+    Returns whether all feeds were imported without errors
+    """
+    run = cache.get(NPSI_IMPORT_RUN_KEY.format(run_id))
+    if run is None:
+        logger.warning("NPSI import run %s expired before it was finished", run_id)
+        return False
+
+    result_keys = [
+        NPSI_IMPORT_RESULT_KEY.format(run_id, feed_pk) for feed_pk in run["feed_pks"]
+    ]
+    results = cache.get_many(result_keys)
+    cache.delete_many(
+        result_keys
+        + [NPSI_IMPORT_RUN_KEY.format(run_id), NPSI_IMPORT_PENDING_KEY.format(run_id)]
     )
 
-    try:
-        # Get EVE Uni events from their API feed (ical)
-        r = requests.get(url)
-        c = Calendar(r.text)
-        for entry in c.events:
-
-            # Format datetime
-            start_date = datetime.utcfromtimestamp(entry.begin.timestamp).replace(
-                tzinfo=pytz.utc
-            )
-            end_date = datetime.utcfromtimestamp(entry.end.timestamp).replace(
-                tzinfo=pytz.utc
-            )
-            title = re.sub(r"[\(\[].*?[\)\]]", "", entry.name)
+    # Skipped imports have no result
+    results = [results.get(key) for key in result_keys]
+    failed = sum(
+        1 for result in results if result and result["error"] != EventImport.ERROR_NONE
+    )
+    rows = [row for result in results if result for row in result["summary"]]
+
+    # Events without feed are only outdated when every feed has claimed its events
+    if run["all_feeds"] and all(result and result["parsed"] for result in results):
+        removed = remove_unassigned_events(*import_window())
+        rows += summary_rows([], [], removed)
+
+    if failed:
+        logger.error("Errors in %s of %s NPSI feeds", failed, len(results))
+
+    logger.info(
+        "NPSI import finished for %s feeds: %s new, %s updated, %s removed",
+        len(results),
+        sum(1 for row in rows if row[1] == "created"),
+        sum(1 for row in rows if row[1] == "updated"),
+        sum(1 for row in rows if row[1] == "removed"),
+    )
+    send_summary(rows)
 
-            logger.debug("%s: Import even found: %s", feed, title)
+    return not failed
 
-            # Check if we already have the event stored
-            original = Event.objects.filter(start_time=start_date, title=title).first()
 
-            # If we get the event from API it should not be removed
-            if original:
+def _parse_feed(source: str, response, window: tuple) -> list:
+    """returns the fields of all events of a source
+    that do not depend on the feed configuration
+    """
+    if source == EventImport.SPECTRE_FLEET:
+        return list(_parse_spectre_fleet(source, response))
 
-                logger.debug("%s: Event: %s already in database, skipping", feed, title)
+    elif source == EventImport.FUN_INC:
+        return list(_parse_fun_inc(source, response, window))
 
-                # Remove the found fleet from the to be removed list
-                event_ids_to_remove.discard(original.id)
+    elif source == EventImport.EVE_UNIVERSITY:
+        return list(_parse_eve_uni(source, response, window))
 
-            else:
-                # Save new event to database
-                event = Event(
-                    operation_type=feed.operation_type,
-                    title=title,
-                    host=feed.host,
-                    formup_system=entry.location,
-                    description=strip_tags(entry.description.replace("<br>", "\n")),
-                    start_time=start_date,
-                    end_time=end_date,
-                    external=True,
-                    user=feed.creator,
-                    event_visibility=feed.event_visibility,
-                    eve_character=feed.eve_character,
-                )
+    # Everything else is a plain ical feed
+    return list(_parse_ical(source, response, window))
 
-                logger.debug(
-                    "%s: Saved new EVE UNI event in database: %s",
-                    feed,
-                    title,
-                )
-                event.save()
 
-    except Exception:
-        logger.error("%s: Error in fetching fleets", feed, exc_info=True)
-        return True
+def _parse_spectre_fleet(source, response):
+    # Get spectre fleets from their RSS feed
+    d = feedparser.parse(response.content)
+
+    # Process each fleet entry
+    for entry in d.entries:
+
+        # Look for SF fleets only
+        if entry.author_detail.name == "Spectre Fleet":
+
+            # Only active fleets
+            if "[RESERVED]" not in entry.title:
+
+                logger.debug("%s: Import even found: %s", source, entry.title)
 
-    return False
+                # Format datetimes
+                date_object = datetime.strptime(
+                    entry.published, "%a, %d %b %Y %H:%M:%S %z"
+                )
+
+                yield {
+                    "title": entry.title,
+                    "doctrine": "see details",
+                    "formup_system": source,
+                    "description": strip_tags(entry.description),
+                    "start_time": date_object,
+                    "end_time": date_object,
+                    "fc": source,
+                    "external_uid": getattr(entry, "id", ""),
+                }
+
+
+def _parse_fun_inc(source, response, window):
+    # Parse each FUN Inc fleet we got from google ical
+    for entry in parse_events(response.lines(), *window):
+        title = entry.summary
+
+        logger.debug("%s: Import even found: %s", source, title)
+
+        yield {
+            "title": title,
+            "doctrine": "see details",
+            "formup_system": source,
+            "description": strip_tags(entry.description),
+            "start_time": entry.start,
+            "end_time": entry.end,
+            "fc": source,
+            "external_uid": entry.key,
+        }
+
+
+def _parse_eve_uni(source, response, window):
+    # Get EVE Uni events from their API feed (ical)
+    for entry in parse_events(response.lines(), *window):
+
+        # Filter only class events as they are the only public events in eveuni
+        if "class" in entry.summary.lower():
+            title = re.sub(r"[\(\[].*?[\)\]]", "", entry.summary)
+
+            logger.debug("%s: Import even found: %s", source, title)
+
+            yield {
+                "title": title,
+                "doctrine": "see details",
+                "formup_system": source,
+                "description": strip_tags(entry.description.replace("<br>", "\n")),
+                "start_time": entry.start,
+                "end_time": entry.end,
+                "fc": source,
+                "external_uid": entry.key,
+            }
+
+
+def _parse_ical(source, response, window):
+    # Get events from their API feed (ical)
+    for entry in parse_events(response.lines(), *window):
+        title = re.sub(r"[\(\[].*?[\)\]]", "", entry.summary)
+
+        logger.debug("%s: Import even found: %s", source, title)
+
+        yield {
+            "title": title,
+            "formup_system": entry.location or "",
+            "description": strip_tags(entry.description.replace("<br>", "\n")),
+            "start_time": entry.start,
+            "end_time": entry.end,
+            "external_uid": entry.key,
+        }
 
 
 @shared_task(
@@ -422,14 +406,27 @@ def _import_ical(feed, event_ids_to_remove, url):
 def update_events_for_owner(self, owner_pk):
     """fetches all calendars for owner from ESI"""
 
-    return _get_owner(owner_pk).update_events_esi()
+    return _get_owner(owner_pk).sync_events()
 
 
 @shared_task(**TASK_DEFAULT_KWARGS)
 def update_all_ingame_events():
-    for owner in Owner.objects.all():
+    """schedules the sync of all active owners that are due,
+    spread evenly over OPCALENDAR_OWNER_SYNC_SPREAD seconds
+    """
+    now = timezone.now()
+    owners = [
+        owner
+        for owner in Owner.objects.filter(is_active=True).order_by(
+            F("last_sync_at").asc(nulls_first=True), "pk"
+        )
+        if owner.is_sync_due(now)
+    ]
+
+    for index, owner in enumerate(owners):
         update_events_for_owner.apply_async(
             kwargs={"owner_pk": owner.pk},
+            countdown=round(index * OPCALENDAR_OWNER_SYNC_SPREAD / len(owners)),
             priority=DEFAULT_TASK_PRIORITY,
         )
 
@@ -445,6 +442,38 @@ def _get_owner(owner_pk: int) -> Owner:
     return owner
 
 
+@shared_task(**TASK_DEFAULT_KWARGS)
+def send_webhook_messages(webhook_pk):
+    """sends all queued messages of a webhook and schedules the next delivery"""
+    try:
+        webhook = WebHook.objects.get(pk=webhook_pk)
+    except WebHook.DoesNotExist:
+        logger.warning("Webhook with pk %s does not exist", webhook_pk)
+        return
+
+    # Only one delivery per webhook at a time to keep the messages in order
+    lock_key = WEBHOOK_LOCK_KEY.format(webhook_pk)
+    if not cache.add(lock_key, True, WEBHOOK_LOCK_TIMEOUT):
+        logger.debug("%s: Delivery already running", webhook)
+        return
+
+    try:
+        webhook.send_queued_messages()
+    finally:
+        cache.delete(lock_key)
+
+    countdown = webhook.next_delivery_in()
+    if countdown is not None:
+        webhook.schedule_delivery(countdown=countdown)
+
+
+@shared_task(**TASK_DEFAULT_KWARGS)
+def send_all_webhook_messages():
+    """starts delivery for all webhooks with queued messages"""
+    for webhook in WebHook.objects.filter(messages__isnull=False).distinct():
+        webhook.schedule_delivery()
+
+
 # @shared_task
 # def add(x, y):
 #     return x + y
@@ -0,0 +1,14 @@
+from django import template
+from django.urls import reverse
+
+from ..styles import calendar_styles
+
+register = template.Library()
+
+
+@register.simple_tag
+def calendar_styles_url() -> str:
+    """returns the versioned URL of the calendar stylesheet"""
+    return "{}?v={}".format(
+        reverse("opcalendar:calendar_styles"), calendar_styles()["version"]
+    )
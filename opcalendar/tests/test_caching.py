@@ -0,0 +1,206 @@
+import datetime as dt
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.utils import timezone
+
+from allianceauth.tests.auth_utils import AuthUtils
+
+from ..caching import (
+    CALENDAR_LAST_MODIFIED_KEY,
+    invalidate_calendar,
+    invalidate_month,
+    last_modified,
+    month_generation,
+)
+from ..calendar import Calendar
+from ..models import Event, EventCategory, EventHost, IngameEvents, Owner
+from ..utils import NoSocketsTestCase
+
+MODULE_PATH = "opcalendar.calendar"
+
+
+class TestMonthGeneration(NoSocketsTestCase):
+    def setUp(self) -> None:
+        cache.clear()
+
+    def test_should_only_change_invalidated_month(self):
+        # given
+        june = month_generation(2021, 6)
+        july = month_generation(2021, 7)
+        # when
+        invalidate_month(2021, 6)
+        # then
+        self.assertNotEqual(month_generation(2021, 6), june)
+        self.assertEqual(month_generation(2021, 7), july)
+
+    def test_should_change_all_months_when_calendar_invalidated(self):
+        # given
+        june = month_generation(2021, 6)
+        july = month_generation(2021, 7)
+        modified = timezone.now() - dt.timedelta(hours=1)
+        cache.set(CALENDAR_LAST_MODIFIED_KEY, modified)
+        # when
+        invalidate_calendar()
+        # then
+        self.assertNotEqual(month_generation(2021, 6), june)
+        self.assertNotEqual(month_generation(2021, 7), july)
+        self.assertGreater(last_modified(), modified)
+
+
+class TestCalendarCache(NoSocketsTestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        super().setUpClass()
+        cls.user = AuthUtils.create_user("Bruce Wayne")
+        cls.user = AuthUtils.add_permission_to_user_by_name(
+            "opcalendar.basic_access", cls.user
+        )
+        cls.host = EventHost.objects.create(community="Test Host")
+        cls.category = EventCategory.objects.create(name="PvP", ticker="PVP")
+
+        # A month in the future, so the cached styling does not expire
+        cls.start_time = (timezone.now() + dt.timedelta(days=62)).replace(
+            day=10, hour=18, minute=0, second=0, microsecond=0
+        )
+
+    def setUp(self) -> None:
+        cache.clear()
+
+    def _event(self, title: str, start_time=None) -> Event:
+        start_time = start_time or self.start_time
+        return Event(
+            operation_type=self.category,
+            title=title,
+            host=self.host,
+            doctrine="Ferox",
+            formup_system="Jita",
+            description="Bring ammo",
+            start_time=start_time,
+            end_time=start_time + dt.timedelta(hours=1),
+            fc="Bruce Wayne",
+            user=self.user,
+        )
+
+    def _render(self, start_time=None) -> str:
+        start_time = start_time or self.start_time
+        return Calendar(start_time.year, start_time.month, self.user).formatmonth()
+
+    def _generation(self, start_time=None) -> str:
+        start_time = timezone.localtime(start_time or self.start_time)
+        return month_generation(start_time.year, start_time.month)
+
+    def test_should_serve_cached_month(self):
+        # given
+        self._event("Event 1").save()
+        html = self._render()
+        # Bulk creates do not send signals and leave the cache untouched
+        Event.objects.bulk_create([self._event("Event 2")])
+        # when
+        cached_html = self._render()
+        # then
+        self.assertEqual(cached_html, html)
+        self.assertNotIn("Event 2", cached_html)
+
+    def test_should_render_month_again_when_local_date_changes(self):
+        # given
+        today = timezone.localtime(self.start_time).date()
+        with patch(MODULE_PATH + ".timezone.localdate", return_value=today):
+            html = self._render()
+        # when
+        with patch(
+            MODULE_PATH + ".timezone.localdate",
+            return_value=today + dt.timedelta(days=1),
+        ):
+            next_html = self._render()
+        # then
+        self.assertIn(
+            "<td class='today'><div class='date'>{}</div>".format(today.day), html
+        )
+        self.assertNotIn(
+            "<td class='today'><div class='date'>{}</div>".format(today.day),
+            next_html,
+        )
+
+    def test_should_render_month_again_after_event_saved(self):
+        # given
+        event = self._event("Event 1")
+        event.save()
+        self._render()
+        # when
+        event.title = "Event 2"
+        event.save()
+        # then
+        self.assertIn("Event 2", self._render())
+
+    def test_should_invalidate_month_when_event_deleted(self):
+        # given
+        event = self._event("Event 1")
+        event.save()
+        generation = self._generation()
+        # when
+        event.delete()
+        # then
+        self.assertNotEqual(self._generation(), generation)
+
+    def test_should_invalidate_both_months_when_event_moved(self):
+        # given
+        event = self._event("Event 1")
+        event.save()
+        next_month = self.start_time + dt.timedelta(days=31)
+        generation = self._generation()
+        next_generation = self._generation(next_month)
+        # when
+        event.start_time = next_month
+        event.end_time = next_month
+        event.save()
+        # then
+        self.assertNotEqual(self._generation(), generation)
+        self.assertNotEqual(self._generation(next_month), next_generation)
+
+    def test_should_not_invalidate_other_months_when_event_saved(self):
+        # given
+        other_month = self.start_time + dt.timedelta(days=31)
+        generation = self._generation(other_month)
+        # when
+        self._event("Event 1").save()
+        # then
+        self.assertEqual(self._generation(other_month), generation)
+
+    def test_should_invalidate_month_when_ingame_event_saved(self):
+        # given
+        generation = self._generation()
+        # when
+        IngameEvents.objects.create(
+            event_id=1,
+            owner=Owner.objects.create(),
+            event_start_date=self.start_time,
+            title="Ingame event",
+            owner_type="corporation",
+            owner_name="Wayne Technologies",
+            importance="0",
+            duration="60",
+        )
+        # then
+        self.assertNotEqual(self._generation(), generation)
+
+    def test_should_invalidate_calendar_when_category_changes(self):
+        # given
+        self._event("Event 1").save()
+        self._render()
+        # when
+        self.category.name = "Strat Op"
+        self.category.save()
+        # then
+        self.assertIn("strat-op", self._render())
+
+    def test_should_not_invalidate_calendar_when_owner_synced(self):
+        # given
+        owner = Owner.objects.create()
+        self._event("Event 1").save()
+        html = self._render()
+        Event.objects.bulk_create([self._event("Event 2")])
+        # when
+        owner.record_sync(Owner.ERROR_NONE)
+        # then
+        self.assertEqual(self._render(), html)
@@ -0,0 +1,133 @@
+import datetime as dt
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from allianceauth.tests.auth_utils import AuthUtils
+
+from ..calendar import Calendar
+from ..models import (
+    Event,
+    EventCategory,
+    EventHost,
+    EventVisibility,
+    IngameEvents,
+    Owner,
+)
+from ..signals import mute_import_notifications
+from ..styles import calendar_styles
+from ..utils import NoSocketsTestCase
+
+
+class TestCalendarQueries(NoSocketsTestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        super().setUpClass()
+        cls.user = AuthUtils.create_user("Bruce Wayne")
+        cls.user = AuthUtils.add_permission_to_user_by_name(
+            "opcalendar.basic_access", cls.user
+        )
+        cls.host = EventHost.objects.create(community="Test Host")
+        cls.visibilities = [
+            EventVisibility.objects.create(name="Visibility %s" % x) for x in range(5)
+        ]
+        cls.categories = [
+            EventCategory.objects.create(name="Category %s" % x, ticker="C%s" % x)
+            for x in range(5)
+        ]
+        cls.owner = Owner.objects.create(
+            event_visibility=cls.visibilities[0], operation_type=cls.categories[0]
+        )
+
+    def _create_events(self, count: int) -> None:
+        start_time = timezone.make_aware(dt.datetime(2021, 6, 10, 18, 0))
+        with mute_import_notifications():
+            Event.objects.bulk_create(
+                Event(
+                    operation_type=self.categories[x % 5],
+                    title="Event %s" % x,
+                    host=EventHost.objects.create(community="Host %s" % x)
+                    if x % 100 == 0
+                    else self.host,
+                    doctrine="Ferox",
+                    formup_system="Jita",
+                    description="Bring ammo",
+                    start_time=start_time + dt.timedelta(minutes=x * 30),
+                    end_time=start_time + dt.timedelta(minutes=x * 30 + 60),
+                    fc="Bruce Wayne",
+                    event_visibility=self.visibilities[x % 5],
+                    user=self.user,
+                )
+                for x in range(count)
+            )
+            IngameEvents.objects.bulk_create(
+                IngameEvents(
+                    event_id=x + 1,
+                    owner=self.owner,
+                    event_start_date=start_time + dt.timedelta(minutes=x * 30),
+                    event_end_date=start_time + dt.timedelta(minutes=x * 30 + 60),
+                    title="Ingame event %s" % x,
+                    text="text",
+                    owner_type="corporation",
+                    owner_name="Wayne Technologies",
+                    host=self.host,
+                    importance="0",
+                    duration="60",
+                )
+                for x in range(count // 10)
+            )
+
+    def _render_month(self) -> int:
+        cache.clear()
+        user = User.objects.get(pk=self.user.pk)
+        with CaptureQueriesContext(connection) as context:
+            html = Calendar(2021, 6, user).formatmonth()
+        self.assertIn("Event 0", html)
+        return len(context.captured_queries)
+
+    def test_should_render_month_with_fixed_number_of_queries(self):
+        # given
+        self._create_events(10)
+        expected_queries = self._render_month()
+        Event.objects.all().delete()
+        IngameEvents.objects.all().delete()
+        self._create_events(500)
+        # when
+        queries = self._render_month()
+        # then
+        self.assertEqual(Event.objects.count(), 500)
+        self.assertEqual(queries, expected_queries)
+
+
+class TestCalendarStyles(NoSocketsTestCase):
+    def setUp(self) -> None:
+        cache.clear()
+
+    def test_should_generate_rules_for_visibilities_and_categories(self):
+        # given
+        EventVisibility.objects.create(name="Alliance Only", color="#ff0000")
+        EventCategory.objects.create(name="Strat Op", ticker="S", color="#00ff00")
+        # when
+        css = calendar_styles()["css"]
+        # then
+        self.assertIn(
+            ".alliance-only:before {border-color: transparent #ff0000 transparent "
+            "transparent;border-style: solid;}",
+            css,
+        )
+        self.assertIn(".strat-op {border-left: 6px solid #00ff00 !important;}", css)
+
+    def test_should_change_version_when_category_changes(self):
+        # given
+        category = EventCategory.objects.create(
+            name="Strat Op", ticker="S", color="#00ff00"
+        )
+        version = calendar_styles()["version"]
+        # when
+        category.color = "#0000ff"
+        category.save()
+        # then
+        self.assertNotEqual(calendar_styles()["version"], version)
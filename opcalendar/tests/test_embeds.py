@@ -0,0 +1,119 @@
+import datetime as dt
+from unittest.mock import patch
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils.timezone import now
+
+from allianceauth.tests.auth_utils import AuthUtils
+
+from ..embeds import (
+    CREATED,
+    DELETED,
+    EVENT_RELATED_FIELDS,
+    GREEN,
+    RED,
+    event_embed,
+    send_embeds,
+)
+from ..models import (
+    Event,
+    EventCategory,
+    EventHost,
+    EventVisibility,
+    WebHook,
+    WebHookMessage,
+)
+from ..signals import mute_import_notifications
+from ..utils import NoSocketsTestCase
+
+MODULE_PATH = "opcalendar.embeds"
+
+
+class TestEmbeds(NoSocketsTestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        super().setUpClass()
+        cls.user = AuthUtils.create_user("Bruce Wayne")
+        cls.eve_character = AuthUtils.add_main_character_2(
+            cls.user, "Bruce Wayne", 1001, 2001, "Wayne Technologies", "WYN"
+        )
+        cls.host = EventHost.objects.create(community="Test Host")
+        cls.category = EventCategory.objects.create(name="Strategic", ticker="STRAT")
+        cls.webhook = WebHook.objects.create(
+            name="Fleets", webhook_url="https://discord.com/api/webhooks/1/abc"
+        )
+        cls.visibility = EventVisibility.objects.create(
+            name="Members", webhook=cls.webhook
+        )
+
+    def _create_events(self, count: int, **kwargs) -> list:
+        start_time = now() + dt.timedelta(days=1)
+        with mute_import_notifications():
+            return Event.objects.bulk_create(
+                Event(
+                    operation_type=self.category,
+                    title="Event %s" % x,
+                    host=self.host,
+                    doctrine="Ferox",
+                    formup_system="Jita",
+                    description="Bring ammo",
+                    start_time=start_time,
+                    end_time=start_time,
+                    fc="Bruce Wayne",
+                    event_visibility=self.visibility,
+                    eve_character=self.eve_character,
+                    user=self.user,
+                    **kwargs
+                )
+                for x in range(count)
+            )
+
+    def test_should_build_event_embed(self):
+        # given
+        event = self._create_events(1)[0]
+        # when
+        embed = event_embed(event, CREATED)
+        # then
+        self.assertEqual(embed["title"], "New event: Event 0")
+        self.assertEqual(embed["color"], GREEN)
+        self.assertEqual(
+            [x["name"] for x in embed["fields"]], ["FC", "Type", "Formup", "Eve Time"]
+        )
+        self.assertEqual(embed["footer"]["text"], " Bruce Wayne [WYN], Test Host")
+
+    def test_should_build_imported_event_embed(self):
+        # given
+        event = self._create_events(1, external=True)[0]
+        # when
+        embed = event_embed(event, DELETED)
+        # then
+        self.assertEqual(embed["title"], "NPSI event deleted from API: Event 0")
+        self.assertEqual(embed["color"], RED)
+        self.assertEqual(
+            [x["name"] for x in embed["fields"]], ["Community", "Eve Time"]
+        )
+
+    @patch("opcalendar.models.WebHook.schedule_delivery")
+    def test_should_queue_embeds_with_constant_queries(self, mock_schedule_delivery):
+        # given
+        self._create_events(50)
+        events = Event.objects.select_related(*EVENT_RELATED_FIELDS)
+        # when
+        with CaptureQueriesContext(connection) as context:
+            send_embeds(events, CREATED)
+        # then
+        self.assertEqual(WebHookMessage.objects.count(), 50)
+        self.assertLessEqual(len(context.captured_queries), 3)
+
+    @patch("opcalendar.models.WebHook.schedule_delivery")
+    def test_should_not_queue_past_events_when_ignored(self, mock_schedule_delivery):
+        # given
+        self.visibility.ignore_past_fleets = True
+        self.visibility.save()
+        event = self._create_events(1)[0]
+        event.start_time = now() - dt.timedelta(days=1)
+        # when
+        send_embeds([event], CREATED)
+        # then
+        self.assertFalse(WebHookMessage.objects.exists())
@@ -0,0 +1,160 @@
+from unittest.mock import patch
+
+from bravado.exception import HTTPNotFound
+
+from django.core.cache import cache
+
+from allianceauth.eveonline.models import EveAllianceInfo
+
+from ..entities import entity_info, resolve_entities
+from ..utils import BravadoOperationStub, BravadoResponseStub, NoSocketsTestCase
+
+MODULE_PATH = "opcalendar.entities"
+
+
+@patch(MODULE_PATH + ".esi")
+class TestResolveEntities(NoSocketsTestCase):
+    def setUp(self) -> None:
+        cache.clear()
+
+    @staticmethod
+    def _setup_esi(mock_esi) -> None:
+        mock_esi.client.Universe.post_universe_names.return_value = (
+            BravadoOperationStub(
+                [
+                    {"id": 3001, "name": "Wayne Enterprises", "category": "alliance"},
+                    {
+                        "id": 2001,
+                        "name": "Wayne Technologies",
+                        "category": "corporation",
+                    },
+                ]
+            )
+        )
+        mock_esi.client.Alliance.get_alliances_alliance_id.return_value = (
+            BravadoOperationStub({"ticker": "WYE"})
+        )
+        mock_esi.client.Corporation.get_corporations_corporation_id.return_value = (
+            BravadoOperationStub({"ticker": "WYT"})
+        )
+
+    def test_should_resolve_entities_in_one_request(self, mock_esi):
+        # given
+        self._setup_esi(mock_esi)
+        # when
+        result = resolve_entities([("alliance", 3001), ("corporation", 2001)])
+        # then
+        self.assertEqual(mock_esi.client.Universe.post_universe_names.call_count, 1)
+        self.assertCountEqual(
+            mock_esi.client.Universe.post_universe_names.call_args[1]["ids"],
+            [3001, 2001],
+        )
+        self.assertEqual(
+            result[("alliance", 3001)],
+            {
+                "name": "Wayne Enterprises",
+                "ticker": "WYE",
+                "logo_url": "https://images.evetech.net/alliances/3001/logo",
+            },
+        )
+        self.assertEqual(result[("corporation", 2001)]["ticker"], "WYT")
+
+    def test_should_use_cached_entities(self, mock_esi):
+        # given
+        self._setup_esi(mock_esi)
+        resolve_entities([("alliance", 3001)])
+        # when
+        info = entity_info("alliance", 3001)
+        # then
+        self.assertEqual(info["name"], "Wayne Enterprises")
+        self.assertEqual(mock_esi.client.Universe.post_universe_names.call_count, 1)
+
+    def test_should_only_fetch_missing_entities(self, mock_esi):
+        # given
+        self._setup_esi(mock_esi)
+        resolve_entities([("alliance", 3001)])
+        # when
+        resolve_entities([("alliance", 3001), ("corporation", 2001)])
+        # then
+        self.assertEqual(
+            mock_esi.client.Universe.post_universe_names.call_args[1]["ids"], [2001]
+        )
+
+    def test_should_skip_entities_esi_can_not_resolve(self, mock_esi):
+        # when
+        result = resolve_entities([("eve_server", 1), ("corporation", None)])
+        # then
+        self.assertEqual(result, dict())
+        self.assertIsNone(entity_info("eve_server", 1))
+        self.assertFalse(mock_esi.client.Universe.post_universe_names.called)
+
+    def test_should_fall_back_when_esi_fails(self, mock_esi):
+        # given
+        mock_esi.client.Universe.post_universe_names.side_effect = OSError
+        # when
+        info = entity_info("corporation", 2001)
+        # then
+        self.assertIsNone(info)
+
+    def test_should_remember_failures_for_a_short_time(self, mock_esi):
+        # given
+        mock_esi.client.Universe.post_universe_names.side_effect = OSError
+        entity_info("corporation", 2001)
+        mock_esi.client.Universe.post_universe_names.side_effect = None
+        self._setup_esi(mock_esi)
+        # when
+        with patch(MODULE_PATH + ".ENTITY_FAILURE_CACHE_TIMEOUT", 0):
+            entity_info("corporation", 3001)
+        # then
+        self.assertIsNone(entity_info("corporation", 2001))
+        self.assertEqual(mock_esi.client.Universe.post_universe_names.call_count, 2)
+        self.assertEqual(entity_info("corporation", 3001)["name"], "Wayne Enterprises")
+        self.assertEqual(mock_esi.client.Universe.post_universe_names.call_count, 2)
+
+    def test_should_resolve_entities_one_by_one_when_bulk_request_fails(self, mock_esi):
+        # given
+        self._setup_esi(mock_esi)
+        names = {3001: "Wayne Enterprises"}
+
+        def post_universe_names(ids):
+            if any(x not in names for x in ids):
+                raise HTTPNotFound(BravadoResponseStub(404, "Ensure all IDs are valid"))
+            return BravadoOperationStub(
+                [{"id": x, "name": names[x], "category": "alliance"} for x in ids]
+            )
+
+        mock_esi.client.Universe.post_universe_names.side_effect = post_universe_names
+        # when
+        result = resolve_entities([("alliance", 3001), ("alliance", 9999)])
+        # then
+        self.assertEqual(list(result), [("alliance", 3001)])
+        self.assertEqual(result[("alliance", 3001)]["name"], "Wayne Enterprises")
+
+    def test_should_use_tickers_known_to_alliance_auth(self, mock_esi):
+        # given
+        self._setup_esi(mock_esi)
+        EveAllianceInfo.objects.create(
+            alliance_id=3001,
+            alliance_name="Wayne Enterprises",
+            alliance_ticker="WYE",
+            executor_corp_id=2001,
+        )
+        # when
+        info = entity_info("alliance", 3001)
+        # then
+        self.assertEqual(info["ticker"], "WYE")
+        self.assertFalse(mock_esi.client.Alliance.get_alliances_alliance_id.called)
+
+    def test_should_not_show_logos_for_factions(self, mock_esi):
+        # given
+        mock_esi.client.Universe.post_universe_names.return_value = (
+            BravadoOperationStub(
+                [{"id": 500001, "name": "Caldari State", "category": "faction"}]
+            )
+        )
+        # when
+        info = entity_info("faction", 500001)
+        # then
+        self.assertEqual(
+            info, {"name": "Caldari State", "ticker": "", "logo_url": None}
+        )
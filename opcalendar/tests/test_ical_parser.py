@@ -0,0 +1,133 @@
+import datetime as dt
+
+from ics import Calendar, Event
+from pytz import utc
+
+from django.test import TestCase
+
+from ..ical_parser import parse_events, unfold
+
+FEED = b"""BEGIN:VCALENDAR\r
+VERSION:2.0\r
+PRODID:-//Test//Test//EN\r
+BEGIN:VTIMEZONE\r
+TZID:Europe/Berlin\r
+BEGIN:STANDARD\r
+DTSTART:19701025T030000\r
+END:STANDARD\r
+END:VTIMEZONE\r
+BEGIN:VEVENT\r
+UID:event-1@test\r
+DTSTART:20210205T220000Z\r
+DTEND:20210205T230000Z\r
+SUMMARY:Roam\\, with friends\r
+LOCATION:Jita\r
+DESCRIPTION:First line\\nsecond line that is folded\r
+  over two lines\r
+BEGIN:VALARM\r
+ACTION:DISPLAY\r
+DESCRIPTION:Reminder\r
+END:VALARM\r
+END:VEVENT\r
+BEGIN:VEVENT\r
+UID:event-2@test\r
+DTSTART;TZID=Europe/Berlin:20210710T200000\r
+DURATION:PT1H30M\r
+SUMMARY:Class\r
+END:VEVENT\r
+BEGIN:VEVENT\r
+UID:event-3@test\r
+RECURRENCE-ID;VALUE=DATE:20211224\r
+DTSTART;VALUE=DATE:20211224\r
+SUMMARY:Holiday\r
+END:VEVENT\r
+END:VCALENDAR\r
+"""
+
+
+class TestParseEvents(TestCase):
+    def test_should_unfold_lines(self):
+        lines = [b"DESCRIPTION:one\r\n", b" two\r\n", b"\tthree\r\n", b"UID:1\r\n"]
+        self.assertEqual(list(unfold(lines)), ["DESCRIPTION:onetwothree", "UID:1"])
+
+    def test_should_unfold_characters_split_by_a_fold(self):
+        raw = "SUMMARY:Caldari – Gallente".encode()
+        lines = [raw[:17] + b"\r\n", b" " + raw[17:] + b"\r\n"]
+        self.assertEqual(list(unfold(lines)), ["SUMMARY:Caldari – Gallente"])
+
+    def test_should_parse_events(self):
+        # when
+        events = list(parse_events(FEED.splitlines(keepends=True)))
+        # then
+        self.assertEqual(len(events), 3)
+        first, second, third = events
+        self.assertEqual(first.uid, "event-1@test")
+        self.assertEqual(first.summary, "Roam, with friends")
+        self.assertEqual(first.location, "Jita")
+        self.assertEqual(
+            first.description, "First line\nsecond line that is folded over two lines"
+        )
+        self.assertEqual(first.start, utc.localize(dt.datetime(2021, 2, 5, 22, 0)))
+        self.assertEqual(first.end, utc.localize(dt.datetime(2021, 2, 5, 23, 0)))
+        # Europe/Berlin is UTC+2 in summer
+        self.assertEqual(second.start, utc.localize(dt.datetime(2021, 7, 10, 18, 0)))
+        self.assertEqual(second.end, utc.localize(dt.datetime(2021, 7, 10, 19, 30)))
+        self.assertEqual(second.description, "")
+        self.assertEqual(third.start, utc.localize(dt.datetime(2021, 12, 24)))
+        self.assertEqual(third.end, utc.localize(dt.datetime(2021, 12, 25)))
+        self.assertEqual(first.key, "event-1@test")
+        self.assertEqual(third.key, "event-3@test/20211224")
+
+    def test_should_only_return_events_in_window(self):
+        # when
+        events = list(
+            parse_events(
+                FEED.splitlines(keepends=True),
+                utc.localize(dt.datetime(2021, 3, 1)),
+                utc.localize(dt.datetime(2021, 12, 1)),
+            )
+        )
+        # then
+        self.assertEqual([event.uid for event in events], ["event-2@test"])
+
+    def test_should_match_ics_library(self):
+        # given
+        calendar = Calendar()
+        for x in range(5):
+            calendar.events.add(
+                Event(
+                    name="Event %s" % x,
+                    begin=dt.datetime(2021, 2, 5 + x, 22, 0, tzinfo=utc),
+                    end=dt.datetime(2021, 2, 5 + x, 23, 0, tzinfo=utc),
+                    description="Description; with, special characters\nand lines",
+                    location="Amarr",
+                )
+            )
+        # when
+        events = list(parse_events(str(calendar).splitlines(keepends=True)))
+        # then
+        expected = {
+            (entry.name, entry.begin.datetime, entry.end.datetime, entry.description)
+            for entry in Calendar(str(calendar)).events
+        }
+        self.assertSetEqual(
+            {(x.summary, x.start, x.end, x.description) for x in events}, expected
+        )
+        self.assertTrue(all(x.location == "Amarr" for x in events))
+
+    def test_should_raise_error_for_invalid_feed(self):
+        with self.assertRaises(ValueError):
+            list(parse_events([b"<html></html>"]))
+
+    def test_should_raise_error_for_truncated_feed(self):
+        lines = FEED.splitlines(keepends=True)
+        with self.assertRaises(ValueError):
+            list(parse_events(lines[:-5]))
+
+    def test_should_skip_events_with_invalid_dates(self):
+        # given
+        feed = FEED.replace(b"DTSTART:20210205T220000Z", b"DTSTART:tomorrow")
+        # when
+        events = list(parse_events(feed.splitlines(keepends=True)))
+        # then
+        self.assertEqual(len(events), 2)
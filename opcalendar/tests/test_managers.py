@@ -0,0 +1,132 @@
+from django.contrib.auth.models import Group
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils.timezone import now
+
+from allianceauth.authentication.models import State
+from allianceauth.tests.auth_utils import AuthUtils
+
+from ..models import (
+    Event,
+    EventCategory,
+    EventHost,
+    EventVisibility,
+    IngameEvents,
+    Owner,
+)
+from ..utils import NoSocketsTestCase
+
+
+class TestVisibleTo(NoSocketsTestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        super().setUpClass()
+        cls.group = Group.objects.create(name="Members")
+        cls.state = State.objects.create(name="Special", priority=77)
+        cls.open_visibility = EventVisibility.objects.create(name="Open")
+        cls.group_visibility = EventVisibility.objects.create(name="Group only")
+        cls.group_visibility.restricted_to_group.add(cls.group)
+        cls.state_visibility = EventVisibility.objects.create(name="State only")
+        cls.state_visibility.restricted_to_state.add(cls.state)
+        creator = AuthUtils.create_user("Alfred Pennyworth")
+        host = EventHost.objects.create(community="Test Host")
+        category = EventCategory.objects.create(name="PvP", ticker="PVP")
+        start_time = now()
+        for title, visibility in [
+            ("open", cls.open_visibility),
+            ("group", cls.group_visibility),
+            ("state", cls.state_visibility),
+            ("none", None),
+        ]:
+            Event.objects.create(
+                operation_type=category,
+                title=title,
+                host=host,
+                doctrine="",
+                formup_system="",
+                description="",
+                start_time=start_time,
+                end_time=start_time,
+                fc="",
+                user=creator,
+                event_visibility=visibility,
+            )
+
+    def setUp(self) -> None:
+        cache.clear()
+        self.user = AuthUtils.create_user("Bruce Wayne")
+
+    def _visible_titles(self):
+        return set(Event.objects.visible_to(self.user).values_list("title", flat=True))
+
+    def test_should_only_show_unrestricted_events(self):
+        self.assertSetEqual(self._visible_titles(), {"open", "none"})
+
+    def test_should_show_events_of_new_groups(self):
+        # given
+        self._visible_titles()
+        # when
+        self.user.groups.add(self.group)
+        # then
+        self.assertSetEqual(self._visible_titles(), {"open", "group", "none"})
+
+    def test_should_show_events_of_new_state(self):
+        # given
+        self._visible_titles()
+        character = AuthUtils.add_main_character_2(self.user, "Bruce Wayne", 1001)
+        # when
+        self.state.member_characters.add(character)
+        # then
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.profile.state, self.state)
+        self.assertSetEqual(self._visible_titles(), {"open", "state", "none"})
+
+    def test_should_update_cached_ids_when_visibility_changes(self):
+        # given
+        self._visible_titles()
+        # when
+        self.open_visibility.restricted_to_group.add(self.group)
+        # then
+        self.assertSetEqual(self._visible_titles(), {"none"})
+
+    def test_should_share_cached_ids_between_users_with_same_memberships(self):
+        # given
+        other_user = AuthUtils.create_user("Clark Kent")
+        ids = EventVisibility.objects.visible_ids_for_user(self.user)
+        # when
+        with CaptureQueriesContext(connection) as context:
+            other_ids = EventVisibility.objects.visible_ids_for_user(other_user)
+        # then
+        self.assertEqual(ids, other_ids)
+        self.assertFalse(
+            any(
+                "opcalendar_eventvisibility" in query["sql"]
+                for query in context.captured_queries
+            )
+        )
+
+    def test_should_filter_ingame_events_by_owner_visibility(self):
+        # given
+        for event_id, visibility in [
+            (1, self.open_visibility),
+            (2, self.group_visibility),
+        ]:
+            IngameEvents.objects.create(
+                event_id=event_id,
+                owner=Owner.objects.create(event_visibility=visibility),
+                event_start_date=now(),
+                title=str(event_id),
+                owner_type="corporation",
+                owner_name="Wayne Technologies",
+                importance="0",
+                duration="60",
+            )
+        # when
+        event_ids = set(
+            IngameEvents.objects.visible_to(self.user).values_list(
+                "event_id", flat=True
+            )
+        )
+        # then
+        self.assertSetEqual(event_ids, {1})
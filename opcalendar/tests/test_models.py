@@ -1,21 +1,48 @@
 import datetime as dt
-from unittest.mock import patch
+from unittest.mock import Mock, patch
 
+from bravado.exception import HTTPNotModified
 from pytz import utc
+import requests
+import requests_mock
+
+from django.core.cache import cache
+from django.utils.timezone import now
 
 from allianceauth.tests.auth_utils import AuthUtils
 
-from ..models import IngameEvents, EventCategory, EventHost, Owner
+from ..caching import month_generation
+from ..models import (
+    Event,
+    EventCategory,
+    EventHost,
+    EventImport,
+    EventMember,
+    EventVisibility,
+    IngameEvents,
+    Owner,
+    WebHook,
+    WebHookMessage,
+)
 from .testdata import (
     esi_get_characters_character_id_calendar,
     esi_get_characters_character_id_calendar_event_id,
 )
-from ..utils import NoSocketsTestCase, add_character_to_user_2, add_new_token
+from ..utils import (
+    BravadoOperationStub,
+    BravadoResponseStub,
+    NoSocketsTestCase,
+    add_character_to_user_2,
+    add_new_token,
+)
 
 
 MODULE_PATH = "opcalendar.models"
 
+WEBHOOK_URL = "https://discord.com/api/webhooks/123/abc"
+
 
+@patch("opcalendar.esi_fetcher.esi")
 @patch(MODULE_PATH + ".esi")
 class TestOwnerUpdateEventsEsi(NoSocketsTestCase):
     @classmethod
@@ -33,18 +60,21 @@ class TestOwnerUpdateEventsEsi(NoSocketsTestCase):
         )
         cls.host = EventHost.objects.create(community="Test Host")
         cls.category = EventCategory.objects.create(
-            name="NPSI", ticker="NPSI", color=EventCategory.COLOR_PURPLE
+            name="NPSI", ticker="NPSI", color="#800080"
         )
         cls.owner = Owner.objects.create(
             character=cls.user.character_ownerships.first()
         )
 
-    def test_should_add_new_events(self, mock_esi):
+    def setUp(self) -> None:
+        self.owner.refresh_from_db()
+
+    def test_should_add_new_events(self, mock_esi, mock_esi_fetcher):
         # given
         mock_esi.client.Calendar.get_characters_character_id_calendar = (
             esi_get_characters_character_id_calendar
         )
-        mock_esi.client.Calendar.get_characters_character_id_calendar_event_id = (
+        mock_esi_fetcher.client.Calendar.get_characters_character_id_calendar_event_id = (
             esi_get_characters_character_id_calendar_event_id
         )
         # when
@@ -67,12 +97,12 @@ class TestOwnerUpdateEventsEsi(NoSocketsTestCase):
         )
         self.assertEqual(obj.title, "o7 The EVE Online Show")
 
-    def test_should_not_replace_existing_events(self, mock_esi):
+    def test_should_not_replace_existing_events(self, mock_esi, mock_esi_fetcher):
         # given
         mock_esi.client.Calendar.get_characters_character_id_calendar = (
             esi_get_characters_character_id_calendar
         )
-        mock_esi.client.Calendar.get_characters_character_id_calendar_event_id = (
+        mock_esi_fetcher.client.Calendar.get_characters_character_id_calendar_event_id = (
             esi_get_characters_character_id_calendar_event_id
         )
         original_event = IngameEvents.objects.create(
@@ -91,3 +121,601 @@ class TestOwnerUpdateEventsEsi(NoSocketsTestCase):
         # then
         self.assertEqual(IngameEvents.objects.count(), 1)
         self.assertTrue(IngameEvents.objects.filter(pk=original_event.pk).exists())
+
+    def test_should_only_fetch_details_for_changed_events(
+        self, mock_esi, mock_esi_fetcher
+    ):
+        # given
+        mock_esi.client.Calendar.get_characters_character_id_calendar = (
+            esi_get_characters_character_id_calendar
+        )
+        mock_esi_fetcher.client.Calendar.get_characters_character_id_calendar_event_id = Mock(
+            side_effect=esi_get_characters_character_id_calendar_event_id
+        )
+        IngameEvents.objects.create(
+            event_id=1386435,
+            event_start_date=utc.localize(dt.datetime(2016, 6, 26, 21, 0)),
+            event_end_date=utc.localize(dt.datetime(2016, 6, 26, 22, 0)),
+            owner=self.owner,
+            title="o7 The EVE Online Show",
+            text="The EVE Online Show features latest developer news",
+            owner_type="eve_server",
+            owner_name="EVE Server",
+            importance="1",
+            duration="60",
+        )
+        # when
+        self.owner.update_events_esi()
+        # then
+        self.assertFalse(
+            mock_esi_fetcher.client.Calendar.get_characters_character_id_calendar_event_id.called
+        )
+        self.assertEqual(IngameEvents.objects.count(), 1)
+
+    def test_should_update_events_with_changed_summary(
+        self, mock_esi, mock_esi_fetcher
+    ):
+        # given
+        mock_esi.client.Calendar.get_characters_character_id_calendar = (
+            esi_get_characters_character_id_calendar
+        )
+        mock_esi_fetcher.client.Calendar.get_characters_character_id_calendar_event_id = (
+            esi_get_characters_character_id_calendar_event_id
+        )
+        IngameEvents.objects.create(
+            event_id=1386435,
+            event_start_date=utc.localize(dt.datetime(2016, 6, 26, 20, 0)),
+            event_end_date=utc.localize(dt.datetime(2016, 6, 26, 21, 0)),
+            owner=self.owner,
+            title="o7 The EVE Online Show",
+            text="The EVE Online Show features latest developer news",
+            owner_type="eve_server",
+            owner_name="EVE Server",
+            importance="1",
+            duration="60",
+        )
+        # when
+        self.owner.update_events_esi()
+        # then
+        obj = IngameEvents.objects.get(pk=1386435)
+        self.assertEqual(
+            obj.event_start_date, utc.localize(dt.datetime(2016, 6, 26, 21, 0))
+        )
+        self.assertEqual(
+            obj.event_end_date, utc.localize(dt.datetime(2016, 6, 26, 22, 0))
+        )
+
+    def test_should_keep_events_stored_by_other_owners(
+        self, mock_esi, mock_esi_fetcher
+    ):
+        # given
+        shared_event = esi_get_characters_character_id_calendar(
+            character_id=1001, token=None
+        ).results()[0]
+        new_event = {
+            "event_id": 1,
+            "event_date": utc.localize(dt.datetime(2016, 6, 27, 21, 0)),
+            "title": "Corp roam",
+        }
+        mock_esi.client.Calendar.get_characters_character_id_calendar = Mock(
+            return_value=BravadoOperationStub(
+                [shared_event, new_event], headers={"ETag": '"abc"'}
+            )
+        )
+
+        def get_event_details(character_id, event_id, token):
+            if event_id == new_event["event_id"]:
+                return BravadoOperationStub(
+                    {
+                        "duration": 60,
+                        "importance": 0,
+                        "owner_id": 2001,
+                        "owner_name": "Wayne Technologies",
+                        "owner_type": "corporation",
+                        "text": "Bring ammo",
+                    }
+                )
+            return esi_get_characters_character_id_calendar_event_id(
+                character_id, event_id, token
+            )
+
+        mock_esi_fetcher.client.Calendar.get_characters_character_id_calendar_event_id = (
+            get_event_details
+        )
+        other_owner = Owner.objects.create()
+        IngameEvents.objects.create(
+            event_id=shared_event["event_id"],
+            event_start_date=shared_event["event_date"],
+            owner=other_owner,
+            title=shared_event["title"],
+            owner_type="eve_server",
+            owner_name="EVE System",
+            importance="1",
+            duration="60",
+        )
+        # when
+        self.owner.update_events_esi()
+        # then
+        self.assertEqual(
+            IngameEvents.objects.get(pk=shared_event["event_id"]).owner, other_owner
+        )
+        self.assertEqual(IngameEvents.objects.get(pk=1).owner, self.owner)
+        self.owner.refresh_from_db()
+        self.assertEqual(self.owner.calendar_etag, '"abc"')
+
+    def test_should_not_fetch_details_for_events_of_other_owners(
+        self, mock_esi, mock_esi_fetcher
+    ):
+        # given
+        mock_esi.client.Calendar.get_characters_character_id_calendar = (
+            esi_get_characters_character_id_calendar
+        )
+        mock_esi_fetcher.client.Calendar.get_characters_character_id_calendar_event_id = Mock(
+            side_effect=esi_get_characters_character_id_calendar_event_id
+        )
+        IngameEvents.objects.create(
+            event_id=1386435,
+            event_start_date=utc.localize(dt.datetime(2016, 6, 26, 21, 0)),
+            owner=Owner.objects.create(),
+            title="o7 The EVE Online Show",
+            owner_type="eve_server",
+            owner_name="EVE System",
+            importance="1",
+            duration="60",
+        )
+        # when
+        self.owner.update_events_esi()
+        # then
+        self.assertFalse(
+            mock_esi_fetcher.client.Calendar.get_characters_character_id_calendar_event_id.called
+        )
+        self.assertEqual(IngameEvents.objects.count(), 1)
+
+    def test_should_fetch_all_pages(self, mock_esi, mock_esi_fetcher):
+        # given
+        first_page = [
+            {
+                "event_id": x,
+                "event_date": utc.localize(dt.datetime(2016, 6, 26, 21, 0)),
+                "title": "Event %s" % x,
+            }
+            for x in range(1, Owner.CALENDAR_PAGE_SIZE + 1)
+        ]
+        second_page = esi_get_characters_character_id_calendar(
+            character_id=1001, token=None
+        ).results()
+        mock_esi.client.Calendar.get_characters_character_id_calendar = Mock(
+            side_effect=[
+                BravadoOperationStub(first_page),
+                BravadoOperationStub(second_page),
+            ]
+        )
+        mock_esi_fetcher.client.Calendar.get_characters_character_id_calendar_event_id = (
+            esi_get_characters_character_id_calendar_event_id
+        )
+        # when
+        self.owner.update_events_esi()
+        # then
+        calls = (
+            mock_esi.client.Calendar.get_characters_character_id_calendar.call_args_list
+        )
+        self.assertEqual(len(calls), 2)
+        self.assertNotIn("from_event", calls[0][1])
+        self.assertEqual(calls[1][1]["from_event"], Owner.CALENDAR_PAGE_SIZE)
+        self.assertTrue(IngameEvents.objects.filter(event_id=1386435).exists())
+        self.owner.refresh_from_db()
+        self.assertEqual(self.owner.calendar_etag, "")
+
+    def test_should_store_calendar_headers(self, mock_esi, mock_esi_fetcher):
+        # given
+        data = esi_get_characters_character_id_calendar(
+            character_id=1001, token=None
+        ).results()
+        mock_esi.client.Calendar.get_characters_character_id_calendar = Mock(
+            return_value=BravadoOperationStub(
+                data,
+                headers={"ETag": '"abc"', "Expires": "Sun, 26 Jun 2016 21:00:00 GMT"},
+            )
+        )
+        mock_esi_fetcher.client.Calendar.get_characters_character_id_calendar_event_id = (
+            esi_get_characters_character_id_calendar_event_id
+        )
+        # when
+        self.owner.update_events_esi()
+        # then
+        self.owner.refresh_from_db()
+        self.assertEqual(self.owner.calendar_etag, '"abc"')
+        self.assertEqual(
+            self.owner.calendar_expires, utc.localize(dt.datetime(2016, 6, 26, 21, 0))
+        )
+
+    def test_should_not_store_etag_when_details_are_missing(
+        self, mock_esi, mock_esi_fetcher
+    ):
+        # given
+        data = esi_get_characters_character_id_calendar(
+            character_id=1001, token=None
+        ).results()
+        mock_esi.client.Calendar.get_characters_character_id_calendar = Mock(
+            return_value=BravadoOperationStub(data, headers={"ETag": '"abc"'})
+        )
+        mock_esi_fetcher.client.Calendar.get_characters_character_id_calendar_event_id = Mock(
+            side_effect=OSError
+        )
+        # when
+        self.owner.update_events_esi()
+        # then
+        self.assertFalse(IngameEvents.objects.exists())
+        self.owner.refresh_from_db()
+        self.assertEqual(self.owner.calendar_etag, "")
+
+    def test_should_keep_events_when_calendar_not_modified(
+        self, mock_esi, mock_esi_fetcher
+    ):
+        # given
+        self.owner.calendar_etag = '"abc"'
+        self.owner.save()
+        IngameEvents.objects.create(
+            event_id=1,
+            event_start_date=utc.localize(dt.datetime(2016, 6, 26, 21, 0)),
+            event_end_date=utc.localize(dt.datetime(2016, 6, 26, 22, 0)),
+            owner=self.owner,
+            title="Old event",
+            owner_type="eve_server",
+            owner_name="EVE Server",
+            importance="1",
+            duration="60",
+        )
+        operation = Mock()
+        operation.results.side_effect = HTTPNotModified(
+            BravadoResponseStub(
+                status_code=304,
+                headers={"Expires": "Sun, 26 Jun 2016 21:00:00 GMT"},
+            )
+        )
+        mock_esi.client.Calendar.get_characters_character_id_calendar = Mock(
+            return_value=operation
+        )
+        # when
+        self.owner.update_events_esi()
+        # then
+        (
+            _,
+            kwargs,
+        ) = mock_esi.client.Calendar.get_characters_character_id_calendar.call_args
+        self.assertEqual(kwargs["If-None-Match"], '"abc"')
+        self.assertTrue(IngameEvents.objects.filter(event_id=1).exists())
+        self.owner.refresh_from_db()
+        self.assertEqual(self.owner.calendar_etag, '"abc"')
+        self.assertIsNotNone(self.owner.calendar_expires)
+
+    def test_should_skip_sync_until_calendar_expires(self, mock_esi, mock_esi_fetcher):
+        # given
+        self.owner.calendar_expires = now() + dt.timedelta(minutes=5)
+        self.owner.save()
+        # when
+        self.owner.update_events_esi()
+        # then
+        self.assertFalse(
+            mock_esi.client.Calendar.get_characters_character_id_calendar.called
+        )
+
+
+class TestOwnerSyncHealth(NoSocketsTestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        super().setUpClass()
+        cls.user = AuthUtils.create_user("Bruce Wayne")
+        cls.eve_character = add_character_to_user_2(
+            cls.user, 1001, "Bruce Wayne", 2001, "Wayne Technologies"
+        )
+
+    def setUp(self) -> None:
+        self.owner = Owner.objects.create(
+            character=self.user.character_ownerships.first()
+        )
+
+    def test_should_record_token_errors(self):
+        # when
+        self.owner.sync_events()
+        self.owner.sync_events()
+        # then
+        self.owner.refresh_from_db()
+        self.assertEqual(self.owner.last_error, Owner.ERROR_INSUFFICIENT_PERMISSIONS)
+        self.assertEqual(self.owner.consecutive_failures, 2)
+        self.assertIsNotNone(self.owner.last_sync_at)
+
+    @patch(MODULE_PATH + ".Owner.update_events_esi")
+    def test_should_reset_failures_after_successful_sync(self, mock_update):
+        # given
+        self.owner.consecutive_failures = 3
+        self.owner.last_error = Owner.ERROR_TOKEN_EXPIRED
+        self.owner.save()
+        # when
+        self.owner.sync_events()
+        # then
+        self.owner.refresh_from_db()
+        self.assertEqual(self.owner.last_error, Owner.ERROR_NONE)
+        self.assertEqual(self.owner.consecutive_failures, 0)
+
+    @patch(MODULE_PATH + ".OPCALENDAR_OWNER_BACKOFF_MAX", 3600)
+    @patch(MODULE_PATH + ".OPCALENDAR_OWNER_BACKOFF_BASE", 300)
+    def test_should_back_off_exponentially_on_token_errors(self):
+        # given
+        last_sync_at = now()
+        self.owner.last_sync_at = last_sync_at
+        self.owner.last_error = Owner.ERROR_TOKEN_EXPIRED
+        # when/then
+        for failures, delay in [(1, 300), (2, 600), (3, 1200), (5, 3600)]:
+            self.owner.consecutive_failures = failures
+            self.assertEqual(
+                self.owner.next_sync_at(), last_sync_at + dt.timedelta(seconds=delay)
+            )
+        self.assertFalse(self.owner.is_sync_due(last_sync_at))
+        self.assertTrue(self.owner.is_sync_due(last_sync_at + dt.timedelta(hours=1)))
+
+    def test_should_not_back_off_on_other_errors(self):
+        # given
+        self.owner.last_sync_at = now()
+        self.owner.last_error = Owner.ERROR_ESI_UNAVAILABLE
+        self.owner.consecutive_failures = 3
+        # when/then
+        self.assertIsNone(self.owner.next_sync_at())
+        self.assertTrue(self.owner.is_sync_due())
+
+    def test_should_not_invalidate_calendar_when_recording_sync(self):
+        # given
+        generation = month_generation(2021, 6)
+        # when
+        self.owner.record_sync(Owner.ERROR_NONE)
+        self.owner._store_calendar_headers({"Expires": None}, "abc")
+        # then
+        self.assertEqual(month_generation(2021, 6), generation)
+
+    def test_should_invalidate_calendar_when_visibility_changes(self):
+        # given
+        generation = month_generation(2021, 6)
+        self.owner.event_visibility = EventVisibility.objects.create(name="Members")
+        # when
+        self.owner.save()
+        # then
+        self.assertNotEqual(month_generation(2021, 6), generation)
+
+
+class TestEventImportHealth(NoSocketsTestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        super().setUpClass()
+        cls.user = AuthUtils.create_user("Bruce Wayne")
+        cls.host = EventHost.objects.create(community="Test Host")
+        cls.category = EventCategory.objects.create(name="NPSI", ticker="NPSI")
+
+    def setUp(self) -> None:
+        self.feed = EventImport.objects.create(
+            source=EventImport.FUN_INC,
+            host=self.host,
+            operation_type=self.category,
+            creator=self.user,
+        )
+
+    def test_should_record_failures_and_reset_after_success(self):
+        # when
+        self.feed.record_import(EventImport.ERROR_FETCH_FAILED)
+        self.feed.record_import(EventImport.ERROR_PARSE_FAILED)
+        # then
+        self.feed.refresh_from_db()
+        self.assertEqual(self.feed.last_error, EventImport.ERROR_PARSE_FAILED)
+        self.assertEqual(self.feed.consecutive_failures, 2)
+        self.assertIsNotNone(self.feed.last_import_at)
+        # when
+        self.feed.record_import(EventImport.ERROR_NONE)
+        # then
+        self.feed.refresh_from_db()
+        self.assertEqual(self.feed.last_error, EventImport.ERROR_NONE)
+        self.assertEqual(self.feed.consecutive_failures, 0)
+
+    @patch(MODULE_PATH + ".OPCALENDAR_IMPORT_FAILURE_THRESHOLD", 3)
+    @patch(MODULE_PATH + ".OPCALENDAR_IMPORT_BACKOFF_MAX", 14400)
+    @patch(MODULE_PATH + ".OPCALENDAR_IMPORT_BACKOFF_BASE", 3600)
+    def test_should_skip_feed_after_failures_in_a_row(self):
+        # given
+        last_import_at = now()
+        self.feed.last_import_at = last_import_at
+        self.feed.last_error = EventImport.ERROR_FETCH_FAILED
+        # when/then
+        for failures in [0, 2]:
+            self.feed.consecutive_failures = failures
+            self.assertIsNone(self.feed.next_import_at())
+            self.assertTrue(self.feed.is_import_due(last_import_at))
+        for failures, delay in [(3, 3600), (4, 7200), (5, 14400), (8, 14400)]:
+            self.feed.consecutive_failures = failures
+            self.assertEqual(
+                self.feed.next_import_at(),
+                last_import_at + dt.timedelta(seconds=delay),
+            )
+        self.assertFalse(self.feed.is_import_due(last_import_at))
+        self.assertTrue(self.feed.is_import_due(last_import_at + dt.timedelta(hours=4)))
+
+
+class TestEventSignup(NoSocketsTestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        super().setUpClass()
+        cls.user = AuthUtils.create_user("Bruce Wayne")
+        cls.eve_character = AuthUtils.add_main_character_2(
+            cls.user, "Bruce Wayne", 1001, 2001
+        )
+        cls.other_character = AuthUtils.add_main_character_2(
+            AuthUtils.create_user("Clark Kent"), "Clark Kent", 1002, 2001
+        )
+        start_time = now() + dt.timedelta(days=1)
+        cls.event = Event.objects.create(
+            operation_type=EventCategory.objects.create(name="Strategic", ticker="S"),
+            title="Defend the home",
+            host=EventHost.objects.create(community="Test Host"),
+            doctrine="Ferox",
+            formup_system="Jita",
+            description="Bring ammo",
+            start_time=start_time,
+            end_time=start_time,
+            fc="Bruce Wayne",
+            user=cls.user,
+        )
+
+    def test_should_sign_up_once(self):
+        # when
+        first = self.event.signup(self.eve_character)
+        second = self.event.signup(self.eve_character)
+        self.event.signup(self.other_character)
+        # then
+        self.assertTrue(first)
+        self.assertFalse(second)
+        self.assertEqual(EventMember.objects.filter(event=self.event).count(), 2)
+        self.event.refresh_from_db()
+        self.assertEqual(self.event.signup_count, 2)
+
+    def test_should_remove_signup(self):
+        # given
+        self.event.signup(self.eve_character)
+        self.event.signup(self.other_character)
+        # when
+        removed = self.event.remove_signup(self.eve_character)
+        removed_again = self.event.remove_signup(self.eve_character)
+        # then
+        self.assertTrue(removed)
+        self.assertFalse(removed_again)
+        self.event.refresh_from_db()
+        self.assertEqual(self.event.signup_count, 1)
+
+
+@requests_mock.Mocker()
+class TestWebHookDelivery(NoSocketsTestCase):
+    def setUp(self) -> None:
+        cache.clear()
+        self.webhook = WebHook.objects.create(name="Test", webhook_url=WEBHOOK_URL)
+
+    def _queue(self, count: int, description: str = "") -> None:
+        self.webhook.send_embeds(
+            [
+                {"title": "Event %s" % x, "description": description}
+                for x in range(count)
+            ]
+        )
+
+    def test_should_send_up_to_10_embeds_per_message(self, requests_mocker):
+        # given
+        requests_mocker.register_uri("POST", WEBHOOK_URL, status_code=204)
+        self._queue(13)
+        # when
+        self.webhook.send_queued_messages()
+        # then
+        self.assertEqual(
+            [len(x.json()["embeds"]) for x in requests_mocker.request_history],
+            [10, 3],
+        )
+        self.assertFalse(WebHookMessage.objects.exists())
+
+    def test_should_respect_character_limit_per_message(self, requests_mocker):
+        # given
+        requests_mocker.register_uri("POST", WEBHOOK_URL, status_code=204)
+        self._queue(3, description="x" * 4000)
+        # when
+        self.webhook.send_queued_messages()
+        # then
+        self.assertEqual(requests_mocker.call_count, 3)
+        self.assertFalse(WebHookMessage.objects.exists())
+
+    def test_should_wait_for_retry_after_when_rate_limited(self, requests_mocker):
+        # given
+        requests_mocker.register_uri(
+            "POST", WEBHOOK_URL, status_code=429, json={"retry_after": 5.0}
+        )
+        self._queue(1)
+        # when
+        self.webhook.send_queued_messages()
+        self.webhook.send_queued_messages()
+        # then
+        self.assertEqual(requests_mocker.call_count, 1)
+        self.assertEqual(WebHookMessage.objects.get().attempts, 0)
+        self.assertAlmostEqual(self.webhook.blocked_for(), 5, delta=1)
+        self.assertAlmostEqual(self.webhook.next_delivery_in(), 5, delta=1)
+
+    def test_should_use_retry_after_header_when_rate_limited(self, requests_mocker):
+        # given
+        requests_mocker.register_uri(
+            "POST", WEBHOOK_URL, status_code=429, headers={"Retry-After": "7"}
+        )
+        self._queue(1)
+        # when
+        self.webhook.send_queued_messages()
+        # then
+        self.assertAlmostEqual(self.webhook.blocked_for(), 7, delta=1)
+        self.assertTrue(WebHookMessage.objects.exists())
+
+    def test_should_pause_when_rate_limit_is_used_up(self, requests_mocker):
+        # given
+        requests_mocker.register_uri(
+            "POST",
+            WEBHOOK_URL,
+            status_code=204,
+            headers={"X-RateLimit-Remaining": "0", "X-RateLimit-Reset-After": "3"},
+        )
+        self._queue(11)
+        # when
+        self.webhook.send_queued_messages()
+        # then
+        self.assertEqual(requests_mocker.call_count, 1)
+        self.assertEqual(WebHookMessage.objects.count(), 1)
+        self.assertAlmostEqual(self.webhook.blocked_for(), 3, delta=1)
+
+    def test_should_retry_failed_messages_with_backoff(self, requests_mocker):
+        # given
+        requests_mocker.register_uri("POST", WEBHOOK_URL, status_code=502)
+        self._queue(1)
+        # when
+        self.webhook.send_queued_messages()
+        # then
+        message = WebHookMessage.objects.get()
+        self.assertEqual(message.attempts, 1)
+        self.assertAlmostEqual(
+            self.webhook.next_delivery_in(), WebHook.RETRY_BACKOFF, delta=2
+        )
+        # nothing is due before the backoff ends
+        self.webhook.send_queued_messages()
+        self.assertEqual(requests_mocker.call_count, 1)
+
+    def test_should_retry_after_connection_errors(self, requests_mocker):
+        # given
+        requests_mocker.register_uri(
+            "POST", WEBHOOK_URL, exc=requests.exceptions.ConnectionError
+        )
+        self._queue(1)
+        # when
+        self.webhook.send_queued_messages()
+        # then
+        self.assertEqual(WebHookMessage.objects.get().attempts, 1)
+
+    def test_should_drop_messages_after_max_attempts(self, requests_mocker):
+        # given
+        requests_mocker.register_uri("POST", WEBHOOK_URL, status_code=502)
+        self._queue(1)
+        WebHookMessage.objects.update(attempts=WebHook.MAX_ATTEMPTS - 2)
+        # when
+        self.webhook.send_queued_messages()
+        WebHookMessage.objects.update(next_attempt_at=now())
+        attempts = WebHookMessage.objects.get().attempts
+        self.webhook.send_queued_messages()
+        # then
+        self.assertEqual(attempts, WebHook.MAX_ATTEMPTS - 1)
+        self.assertFalse(WebHookMessage.objects.exists())
+        self.assertIsNone(self.webhook.next_delivery_in())
+
+    def test_should_drop_messages_rejected_by_discord(self, requests_mocker):
+        # given
+        requests_mocker.register_uri("POST", WEBHOOK_URL, status_code=400)
+        self._queue(1)
+        # when
+        self.webhook.send_queued_messages()
+        # then
+        self.assertEqual(requests_mocker.call_count, 1)
+        self.assertFalse(WebHookMessage.objects.exists())
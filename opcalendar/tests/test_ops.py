@@ -0,0 +1,156 @@
+import asyncio
+import datetime as dt
+from unittest import skipIf
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.test import TransactionTestCase
+from django.utils import timezone
+
+from allianceauth.services.modules.discord.models import DiscordUser
+from allianceauth.tests.auth_utils import AuthUtils
+
+from ..models import Event, EventCategory, EventHost, IngameEvents, Owner
+
+try:
+    from ..cogs import ops
+except ImportError:
+    ops = None
+
+MODULE_PATH = "opcalendar.cogs.ops"
+
+
+class Context:
+    """Minimal command context of the discord bot"""
+
+    class Author:
+        def __init__(self, sent: list):
+            self.sent = sent
+
+        async def send(self, embed):
+            self.sent.append(embed)
+
+    class Message:
+        def __init__(self, author_id: int, content: str):
+            self.author = type("User", (), {"id": author_id})
+            self.content = content
+
+    def __init__(self, author_id: int, content: str = "!ops"):
+        self.message = self.Message(author_id, content)
+        self.sent = []
+        self.replies = []
+        self.author = self.Author(self.sent)
+
+    async def trigger_typing(self):
+        pass
+
+    async def reply(self, embed):
+        self.replies.append(embed)
+
+
+# The bot commands query the database from worker threads,
+# which only see committed data
+@skipIf(ops is None, "discord bot is not installed")
+class TestOpsCommand(TransactionTestCase):
+    def setUp(self) -> None:
+        cache.clear()
+        self.user = AuthUtils.create_user("Bruce Wayne")
+        self.user = AuthUtils.add_permission_to_user_by_name(
+            "opcalendar.basic_access", self.user
+        )
+        DiscordUser.objects.create(user=self.user, uid=123)
+        self.host = EventHost.objects.create(community="Test Host")
+        self.category = EventCategory.objects.create(name="PvP", ticker="PVP")
+        self.now = timezone.now()
+
+    def _create_events(self, count: int) -> None:
+        owner = Owner.objects.create()
+        for x in range(count):
+            start_time = self.now + dt.timedelta(hours=2 * x + 1)
+            Event.objects.create(
+                operation_type=self.category,
+                title="Event %s" % x,
+                host=self.host,
+                doctrine="Ferox",
+                formup_system="Jita",
+                description="Bring ammo",
+                start_time=start_time,
+                end_time=start_time + dt.timedelta(hours=1),
+                fc="Bruce Wayne",
+                user=self.user,
+            )
+            IngameEvents.objects.create(
+                event_id=x + 1,
+                owner=owner,
+                event_start_date=start_time + dt.timedelta(hours=1),
+                title="Ingame %s" % x,
+                text="",
+                owner_type="corporation",
+                owner_name="Wayne Technologies",
+                host=self.host,
+                importance="0",
+                duration="60",
+            )
+
+    @staticmethod
+    def _run(ctx: Context) -> Context:
+        asyncio.run(ops.Ops(None).ops(ctx))
+        return ctx
+
+    def test_should_send_next_events_in_order(self):
+        # given
+        self._create_events(15)
+        Event.objects.create(
+            operation_type=self.category,
+            title="Past event",
+            host=self.host,
+            doctrine="Ferox",
+            formup_system="Jita",
+            description="Bring ammo",
+            start_time=self.now - dt.timedelta(days=1),
+            end_time=self.now - dt.timedelta(days=1),
+            fc="Bruce Wayne",
+            user=self.user,
+        )
+        # when
+        ctx = self._run(Context(123))
+        # then
+        self.assertEqual(ctx.replies[0].title, "Events sent")
+        names = [field.name for field in ctx.sent[0].fields]
+        self.assertEqual(len(names), ops.OPS_MAX_EVENTS)
+        self.assertEqual(
+            names[:3],
+            ["Event: Event 0 PVP", "Ingame Event: Ingame 0", "Event: Event 1 PVP"],
+        )
+        self.assertNotIn("Event: Past event PVP", names)
+
+    def test_should_filter_events_by_host(self):
+        # given
+        self._create_events(2)
+        other_host = EventHost.objects.create(community="Other Host")
+        Event.objects.filter(title="Event 0").update(host=other_host)
+        # when
+        ctx = self._run(Context(123, "!ops Other Host"))
+        # then
+        names = [field.name for field in ctx.sent[0].fields]
+        self.assertEqual(names, ["Event: Event 0 PVP"])
+
+    def test_should_fail_for_users_without_discord_service(self):
+        # when
+        ctx = self._run(Context(999))
+        # then
+        self.assertEqual(ctx.replies[0].title, "Command failed")
+        self.assertEqual(ctx.sent, [])
+
+    def test_should_cache_events_under_a_safe_key(self):
+        # given
+        self._create_events(1)
+        host = "Other Host " * 50
+        # when
+        with patch(MODULE_PATH + ".cache") as mock_cache:
+            mock_cache.get.return_value = None
+            self._run(Context(123, "!ops " + host))
+        # then
+        cache_key = mock_cache.set.call_args[0][0]
+        self.assertNotIn(" ", cache_key)
+        self.assertLess(len(cache_key), 100)
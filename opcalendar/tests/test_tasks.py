@@ -1,14 +1,29 @@
 import datetime as dt
+import re
 from unittest.mock import patch
 
 from pytz import utc
 import requests
 import requests_mock
 
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils.timezone import now
+
 
 from allianceauth.tests.auth_utils import AuthUtils
 
-from ..models import Event, EventCategory, EventHost, EventImport
+from ..app_settings import OPCALENDAR_SPECTRE_URL
+from ..models import (
+    Event,
+    EventCategory,
+    EventHost,
+    EventImport,
+    EventVisibility,
+    Owner,
+    WebHook,
+)
 from .. import tasks
 from .testdata import feedparser_parse, generate_ical_string
 from ..utils import NoSocketsTestCase
@@ -16,6 +31,24 @@ from ..utils import NoSocketsTestCase
 MODULE_PATH = "opcalendar.tasks"
 
 
+def run_npsi_import() -> bool:
+    """runs the NPSI import with all of its tasks eagerly
+    and returns the result of the finalize step
+    """
+    results = []
+    with patch(
+        MODULE_PATH + ".import_npsi_source.apply_async",
+        lambda kwargs, **options: tasks.import_npsi_source(**kwargs),
+    ), patch(
+        MODULE_PATH + ".finalize_npsi_import.apply_async",
+        lambda kwargs, **options: results.append(tasks.finalize_npsi_import(**kwargs)),
+    ):
+        tasks.import_all_npsi_fleets()
+    return results[0]
+
+
+# Test data is from 2021, import all of it
+@patch(MODULE_PATH + ".import_window", lambda: (None, None))
 @patch(MODULE_PATH + ".feedparser")
 @requests_mock.Mocker()
 class TestImportNpsiFleet(NoSocketsTestCase):
@@ -28,7 +61,7 @@ class TestImportNpsiFleet(NoSocketsTestCase):
         )
         cls.host = EventHost.objects.create(community="Test Host")
         cls.category = EventCategory.objects.create(
-            name="NPSI", ticker="NPSI", color=EventCategory.COLOR_PURPLE
+            name="NPSI", ticker="NPSI", color="#800080"
         )
 
     ########################
@@ -36,7 +69,8 @@ class TestImportNpsiFleet(NoSocketsTestCase):
 
     def test_should_add_new_spectre_fleet_event(self, mock_feedparser, requests_mocker):
         # given
-        mock_feedparser.parse = feedparser_parse
+        requests_mocker.register_uri("GET", url=OPCALENDAR_SPECTRE_URL, text="")
+        mock_feedparser.parse = lambda x: feedparser_parse(OPCALENDAR_SPECTRE_URL)
         EventImport.objects.create(
             source=EventImport.SPECTRE_FLEET,
             host=self.host,
@@ -45,7 +79,7 @@ class TestImportNpsiFleet(NoSocketsTestCase):
             eve_character=self.eve_character,
         )
         # when
-        tasks.import_all_npsi_fleets()
+        run_npsi_import()
         # then
         self.assertEqual(Event.objects.count(), 1)
         obj = Event.objects.first()
@@ -59,7 +93,7 @@ class TestImportNpsiFleet(NoSocketsTestCase):
         self.assertEqual(obj.start_time, published)
         self.assertEqual(obj.end_time, published)
         self.assertEqual(obj.fc, EventImport.SPECTRE_FLEET)
-        self.assertEqual(obj.visibility, Event.VISIBILITY_EXTERNAL)
+        self.assertTrue(obj.external)
         self.assertEqual(obj.user, self.user)
         self.assertEqual(obj.eve_character, self.eve_character)
 
@@ -67,7 +101,8 @@ class TestImportNpsiFleet(NoSocketsTestCase):
         self, mock_feedparser, requests_mocker
     ):
         # given
-        mock_feedparser.parse = feedparser_parse
+        requests_mocker.register_uri("GET", url=OPCALENDAR_SPECTRE_URL, text="")
+        mock_feedparser.parse = lambda x: feedparser_parse(OPCALENDAR_SPECTRE_URL)
         EventImport.objects.create(
             source=EventImport.SPECTRE_FLEET,
             host=self.host,
@@ -75,7 +110,7 @@ class TestImportNpsiFleet(NoSocketsTestCase):
             creator=self.user,
         )
         # when
-        tasks.import_all_npsi_fleets()
+        run_npsi_import()
         # then
         self.assertTrue(Event.objects.filter(title="Spectre Fleet 1").exists())
 
@@ -83,7 +118,8 @@ class TestImportNpsiFleet(NoSocketsTestCase):
         self, mock_feedparser, requests_mocker
     ):
         # given
-        mock_feedparser.parse = feedparser_parse
+        requests_mocker.register_uri("GET", url=OPCALENDAR_SPECTRE_URL, text="")
+        mock_feedparser.parse = lambda x: feedparser_parse(OPCALENDAR_SPECTRE_URL)
         EventImport.objects.create(
             source=EventImport.SPECTRE_FLEET,
             host=self.host,
@@ -107,15 +143,122 @@ class TestImportNpsiFleet(NoSocketsTestCase):
             eve_character=self.eve_character,
         )
         # when
-        tasks.import_all_npsi_fleets()
+        run_npsi_import()
         # then
         self.assertEqual(Event.objects.count(), 1)
         self.assertTrue(Event.objects.filter(pk=original_event.pk).exists())
 
+    def test_should_adopt_existing_spectre_fleet_event_without_uid(
+        self, mock_feedparser, requests_mocker
+    ):
+        # given
+        requests_mocker.register_uri("GET", url=OPCALENDAR_SPECTRE_URL, text="")
+        mock_feedparser.parse = lambda x: feedparser_parse(OPCALENDAR_SPECTRE_URL)
+        feed = EventImport.objects.create(
+            source=EventImport.SPECTRE_FLEET,
+            host=self.host,
+            operation_type=self.category,
+            creator=self.user,
+            eve_character=self.eve_character,
+        )
+        published = utc.localize(dt.datetime(2021, 2, 5, 21, 0))
+        original_event = Event.objects.create(
+            operation_type=self.category,
+            title="Spectre Fleet 1",
+            host=self.host,
+            doctrine="see details",
+            formup_system=EventImport.SPECTRE_FLEET,
+            description="",
+            start_time=published,
+            end_time=published,
+            fc=EventImport.SPECTRE_FLEET,
+            external=True,
+            user=self.user,
+            eve_character=self.eve_character,
+        )
+        # when
+        run_npsi_import()
+        # then
+        original_event.refresh_from_db()
+        self.assertEqual(original_event.import_source, feed)
+        self.assertEqual(
+            original_event.external_uid,
+            "https://www.spectre-fleet.space/engagement/events/view/2038",
+        )
+        self.assertTrue(original_event.content_hash)
+
+    def test_should_update_rescheduled_spectre_fleet_event_in_place(
+        self, mock_feedparser, requests_mocker
+    ):
+        # given
+        requests_mocker.register_uri("GET", url=OPCALENDAR_SPECTRE_URL, text="")
+        mock_feedparser.parse = lambda x: feedparser_parse(OPCALENDAR_SPECTRE_URL)
+        feed = EventImport.objects.create(
+            source=EventImport.SPECTRE_FLEET,
+            host=self.host,
+            operation_type=self.category,
+            creator=self.user,
+            eve_character=self.eve_character,
+        )
+        original_event = Event.objects.create(
+            operation_type=self.category,
+            title="Spectre Fleet 1 (TBC)",
+            host=self.host,
+            doctrine="see details",
+            formup_system=EventImport.SPECTRE_FLEET,
+            description="",
+            start_time=utc.localize(dt.datetime(2021, 2, 4, 18, 0)),
+            end_time=utc.localize(dt.datetime(2021, 2, 4, 18, 0)),
+            fc=EventImport.SPECTRE_FLEET,
+            external=True,
+            import_source=feed,
+            external_uid="https://www.spectre-fleet.space/engagement/events/view/2038",
+            user=self.user,
+            eve_character=self.eve_character,
+        )
+        # when
+        run_npsi_import()
+        # then
+        self.assertEqual(Event.objects.count(), 1)
+        original_event.refresh_from_db()
+        self.assertEqual(original_event.title, "Spectre Fleet 1")
+        published = utc.localize(dt.datetime(2021, 2, 5, 21, 0))
+        self.assertEqual(original_event.start_time, published)
+
+    def test_should_not_write_unchanged_spectre_fleet_events(
+        self, mock_feedparser, requests_mocker
+    ):
+        # given
+        requests_mocker.register_uri("GET", url=OPCALENDAR_SPECTRE_URL, text="")
+        mock_feedparser.parse = lambda x: feedparser_parse(OPCALENDAR_SPECTRE_URL)
+        EventImport.objects.create(
+            source=EventImport.SPECTRE_FLEET,
+            host=self.host,
+            operation_type=self.category,
+            creator=self.user,
+            eve_character=self.eve_character,
+        )
+        run_npsi_import()
+        # when
+        with CaptureQueriesContext(connection) as context:
+            run_npsi_import()
+        # then
+        self.assertEqual(Event.objects.count(), 1)
+        writes = [
+            query["sql"]
+            for query in context.captured_queries
+            if re.match(
+                r'(INSERT INTO|UPDATE|DELETE FROM) "opcalendar_event"\s',
+                query["sql"],
+            )
+        ]
+        self.assertListEqual(writes, [])
+
     def test_should_delete_outdated_spectre_fleet_event(
         self, mock_feedparser, requests_mocker
     ):
         # given
+        requests_mocker.register_uri("GET", url=OPCALENDAR_SPECTRE_URL, text="")
         mock_feedparser.parse = lambda x: feedparser_parse("no-data")
         EventImport.objects.create(
             source=EventImport.SPECTRE_FLEET,
@@ -140,7 +283,7 @@ class TestImportNpsiFleet(NoSocketsTestCase):
             eve_character=self.eve_character,
         )
         # when
-        tasks.import_all_npsi_fleets()
+        run_npsi_import()
         # then
         self.assertEqual(Event.objects.count(), 0)
 
@@ -148,6 +291,7 @@ class TestImportNpsiFleet(NoSocketsTestCase):
         self, mock_feedparser, requests_mocker
     ):
         # given
+        requests_mocker.register_uri("GET", url=OPCALENDAR_SPECTRE_URL, text="")
         mock_feedparser.parse.side_effect = RuntimeError
         EventImport.objects.create(
             source=EventImport.SPECTRE_FLEET,
@@ -157,7 +301,7 @@ class TestImportNpsiFleet(NoSocketsTestCase):
             eve_character=self.eve_character,
         )
         # when
-        result = tasks.import_all_npsi_fleets()
+        result = run_npsi_import()
         # then
         self.assertFalse(result)
         self.assertEqual(Event.objects.count(), 0)
@@ -180,7 +324,7 @@ class TestImportNpsiFleet(NoSocketsTestCase):
             eve_character=self.eve_character,
         )
         # when
-        tasks.import_all_npsi_fleets()
+        run_npsi_import()
         # then
         self.assertEqual(Event.objects.count(), 1)
         obj = Event.objects.first()
@@ -193,7 +337,7 @@ class TestImportNpsiFleet(NoSocketsTestCase):
         self.assertEqual(obj.start_time, utc.localize(dt.datetime(2021, 2, 5, 22, 0)))
         self.assertEqual(obj.end_time, utc.localize(dt.datetime(2021, 2, 5, 23, 0)))
         self.assertEqual(obj.fc, EventImport.FUN_INC)
-        self.assertEqual(obj.visibility, Event.VISIBILITY_EXTERNAL)
+        self.assertTrue(obj.external)
         self.assertEqual(obj.user, self.user)
         self.assertEqual(obj.eve_character, self.eve_character)
 
@@ -213,7 +357,7 @@ class TestImportNpsiFleet(NoSocketsTestCase):
             creator=self.user,
         )
         # when
-        tasks.import_all_npsi_fleets()
+        run_npsi_import()
         # then
         self.assertTrue(Event.objects.filter(title="Fun Fleet 1").exists())
 
@@ -248,7 +392,7 @@ class TestImportNpsiFleet(NoSocketsTestCase):
             eve_character=self.eve_character,
         )
         # when
-        tasks.import_all_npsi_fleets()
+        run_npsi_import()
         # then
         self.assertEqual(Event.objects.count(), 1)
         self.assertTrue(Event.objects.filter(pk=original_event.pk).exists())
@@ -284,7 +428,7 @@ class TestImportNpsiFleet(NoSocketsTestCase):
             eve_character=self.eve_character,
         )
         # when
-        tasks.import_all_npsi_fleets()
+        run_npsi_import()
         # then
         self.assertEqual(Event.objects.count(), 0)
 
@@ -305,7 +449,7 @@ class TestImportNpsiFleet(NoSocketsTestCase):
             eve_character=self.eve_character,
         )
         # when
-        result = tasks.import_all_npsi_fleets()
+        result = run_npsi_import()
         # then
         self.assertFalse(result)
         self.assertEqual(Event.objects.count(), 0)
@@ -327,7 +471,7 @@ class TestImportNpsiFleet(NoSocketsTestCase):
             eve_character=self.eve_character,
         )
         # when
-        result = tasks.import_all_npsi_fleets()
+        result = run_npsi_import()
         # then
         self.assertFalse(result)
         self.assertEqual(Event.objects.count(), 0)
@@ -350,7 +494,7 @@ class TestImportNpsiFleet(NoSocketsTestCase):
             eve_character=self.eve_character,
         )
         # when
-        tasks.import_all_npsi_fleets()
+        run_npsi_import()
         # then
         self.assertEqual(Event.objects.count(), 1)
         obj = Event.objects.first()
@@ -363,7 +507,7 @@ class TestImportNpsiFleet(NoSocketsTestCase):
         self.assertEqual(obj.start_time, utc.localize(dt.datetime(2021, 2, 4, 22, 0)))
         self.assertEqual(obj.end_time, utc.localize(dt.datetime(2021, 2, 4, 23, 0)))
         self.assertEqual(obj.fc, EventImport.EVE_UNIVERSITY)
-        self.assertEqual(obj.visibility, Event.VISIBILITY_EXTERNAL)
+        self.assertTrue(obj.external)
         self.assertEqual(obj.user, self.user)
         self.assertEqual(obj.eve_character, self.eve_character)
 
@@ -383,7 +527,7 @@ class TestImportNpsiFleet(NoSocketsTestCase):
             creator=self.user,
         )
         # when
-        tasks.import_all_npsi_fleets()
+        run_npsi_import()
         # then
         self.assertTrue(Event.objects.filter(title="Eve Uni class 1").exists())
 
@@ -418,7 +562,7 @@ class TestImportNpsiFleet(NoSocketsTestCase):
             eve_character=self.eve_character,
         )
         # when
-        tasks.import_all_npsi_fleets()
+        run_npsi_import()
         # then
         self.assertEqual(Event.objects.count(), 1)
         self.assertTrue(Event.objects.filter(pk=original_event.pk).exists())
@@ -454,7 +598,7 @@ class TestImportNpsiFleet(NoSocketsTestCase):
             eve_character=self.eve_character,
         )
         # when
-        tasks.import_all_npsi_fleets()
+        run_npsi_import()
         # then
         self.assertEqual(Event.objects.count(), 0)
 
@@ -475,7 +619,7 @@ class TestImportNpsiFleet(NoSocketsTestCase):
             eve_character=self.eve_character,
         )
         # when
-        result = tasks.import_all_npsi_fleets()
+        result = run_npsi_import()
         # then
         self.assertFalse(result)
         self.assertEqual(Event.objects.count(), 0)
@@ -495,7 +639,7 @@ class TestImportNpsiFleet(NoSocketsTestCase):
             eve_character=self.eve_character,
         )
         # when
-        result = tasks.import_all_npsi_fleets()
+        result = run_npsi_import()
         # then
         self.assertFalse(result)
         self.assertEqual(Event.objects.count(), 0)
@@ -505,7 +649,8 @@ class TestImportNpsiFleet(NoSocketsTestCase):
 
     def test_should_add_fleet_events_all_types(self, mock_feedparser, requests_mocker):
         # given
-        mock_feedparser.parse = feedparser_parse
+        requests_mocker.register_uri("GET", url=OPCALENDAR_SPECTRE_URL, text="")
+        mock_feedparser.parse = lambda x: feedparser_parse(OPCALENDAR_SPECTRE_URL)
         EventImport.objects.create(
             source=EventImport.SPECTRE_FLEET,
             host=self.host,
@@ -538,9 +683,400 @@ class TestImportNpsiFleet(NoSocketsTestCase):
             eve_character=self.eve_character,
         )
         # when
-        tasks.import_all_npsi_fleets()
+        run_npsi_import()
         # then
         self.assertEqual(Event.objects.count(), 3)
         self.assertTrue(Event.objects.filter(title="Spectre Fleet 1").exists())
         self.assertTrue(Event.objects.filter(title="Fun Fleet 1").exists())
         self.assertTrue(Event.objects.filter(title="Eve Uni class 1").exists())
+
+    ########################
+    # cleanup and failing feeds
+
+    def _create_event(self, title: str, feed: EventImport = None) -> Event:
+        start_time = utc.localize(dt.datetime(2021, 2, 3, 21, 0))
+        return Event.objects.create(
+            operation_type=self.category,
+            title=title,
+            host=self.host,
+            doctrine="see details",
+            formup_system="",
+            description="",
+            start_time=start_time,
+            end_time=start_time,
+            fc="",
+            external=True,
+            import_source=feed,
+            user=self.user,
+            eve_character=self.eve_character,
+        )
+
+    def test_should_clean_up_feeds_independently(
+        self, mock_feedparser, requests_mocker
+    ):
+        # given
+        requests_mocker.register_uri("GET", url=OPCALENDAR_SPECTRE_URL, text="")
+        mock_feedparser.parse = lambda x: feedparser_parse("no-data")
+        spectre_feed = EventImport.objects.create(
+            source=EventImport.SPECTRE_FLEET,
+            host=self.host,
+            operation_type=self.category,
+            creator=self.user,
+        )
+        requests_mocker.register_uri(
+            "GET",
+            url="https://portal.eveuniversity.org/api/getcalendar",
+            exc=requests.exceptions.ConnectTimeout,
+        )
+        eve_uni_feed = EventImport.objects.create(
+            source=EventImport.EVE_UNIVERSITY,
+            host=self.host,
+            operation_type=self.category,
+            creator=self.user,
+        )
+        self._create_event("Spectre Fleet OLD", spectre_feed)
+        self._create_event("Eve Uni class OLD", eve_uni_feed)
+        self._create_event("Unknown OLD")
+        # when
+        result = run_npsi_import()
+        # then
+        self.assertFalse(result)
+        self.assertSetEqual(
+            set(Event.objects.values_list("title", flat=True)),
+            {"Eve Uni class OLD", "Unknown OLD"},
+        )
+        spectre_feed.refresh_from_db()
+        self.assertEqual(spectre_feed.last_error, EventImport.ERROR_NONE)
+        eve_uni_feed.refresh_from_db()
+        self.assertEqual(eve_uni_feed.last_error, EventImport.ERROR_FETCH_FAILED)
+        self.assertEqual(eve_uni_feed.consecutive_failures, 1)
+
+    def test_should_skip_feeds_failing_too_often(
+        self, mock_feedparser, requests_mocker
+    ):
+        # given
+        feed = EventImport.objects.create(
+            source=EventImport.EVE_UNIVERSITY,
+            host=self.host,
+            operation_type=self.category,
+            creator=self.user,
+            last_error=EventImport.ERROR_FETCH_FAILED,
+            consecutive_failures=5,
+            last_import_at=now(),
+        )
+        self._create_event("Eve Uni class OLD", feed)
+        # when
+        result = run_npsi_import()
+        # then
+        self.assertTrue(result)
+        self.assertFalse(requests_mocker.called)
+        self.assertTrue(Event.objects.filter(title="Eve Uni class OLD").exists())
+        feed.refresh_from_db()
+        self.assertEqual(feed.consecutive_failures, 5)
+
+    def test_should_import_feeds_again_after_backoff(
+        self, mock_feedparser, requests_mocker
+    ):
+        # given
+        requests_mocker.register_uri(
+            "GET",
+            url="https://portal.eveuniversity.org/api/getcalendar",
+            text=generate_ical_string("eve_uni"),
+        )
+        feed = EventImport.objects.create(
+            source=EventImport.EVE_UNIVERSITY,
+            host=self.host,
+            operation_type=self.category,
+            creator=self.user,
+            last_error=EventImport.ERROR_FETCH_FAILED,
+            consecutive_failures=5,
+            last_import_at=now() - dt.timedelta(days=2),
+        )
+        # when
+        result = run_npsi_import()
+        # then
+        self.assertTrue(result)
+        self.assertTrue(requests_mocker.called)
+        feed.refresh_from_db()
+        self.assertEqual(feed.last_error, EventImport.ERROR_NONE)
+        self.assertEqual(feed.consecutive_failures, 0)
+
+    def test_should_skip_feeds_already_being_imported(
+        self, mock_feedparser, requests_mocker
+    ):
+        # given
+        feed = EventImport.objects.create(
+            source=EventImport.EVE_UNIVERSITY,
+            host=self.host,
+            operation_type=self.category,
+            creator=self.user,
+        )
+        self._create_event("Eve Uni class OLD", feed)
+        self._create_event("Unknown OLD")
+        lock_key = tasks.NPSI_IMPORT_LOCK_KEY.format(EventImport.EVE_UNIVERSITY)
+        cache.add(lock_key, True)
+        # when
+        try:
+            result = run_npsi_import()
+        finally:
+            cache.delete(lock_key)
+        # then
+        self.assertTrue(result)
+        self.assertFalse(requests_mocker.called)
+        self.assertEqual(Event.objects.count(), 2)
+
+    def test_should_fetch_source_once_for_all_its_feeds(
+        self, mock_feedparser, requests_mocker
+    ):
+        # given
+        requests_mocker.register_uri(
+            "GET",
+            url="https://portal.eveuniversity.org/api/getcalendar",
+            text=generate_ical_string("eve_uni"),
+        )
+        other_host = EventHost.objects.create(community="Other Host")
+        feed_1 = EventImport.objects.create(
+            source=EventImport.EVE_UNIVERSITY,
+            host=self.host,
+            operation_type=self.category,
+            creator=self.user,
+        )
+        feed_2 = EventImport.objects.create(
+            source=EventImport.EVE_UNIVERSITY,
+            host=other_host,
+            operation_type=self.category,
+            creator=self.user,
+        )
+        # when
+        result = run_npsi_import()
+        # then
+        self.assertTrue(result)
+        self.assertEqual(requests_mocker.call_count, 1)
+        for feed, host in [(feed_1, self.host), (feed_2, other_host)]:
+            events = Event.objects.filter(import_source=feed)
+            self.assertEqual(events.count(), 1)
+            self.assertTrue(all(event.host == host for event in events))
+            feed.refresh_from_db()
+            self.assertEqual(feed.last_error, EventImport.ERROR_NONE)
+
+    def test_should_only_send_conditional_requests_for_shared_versions(
+        self, mock_feedparser, requests_mocker
+    ):
+        # given
+        requests_mocker.register_uri(
+            "GET",
+            url="https://portal.eveuniversity.org/api/getcalendar",
+            text=generate_ical_string("eve_uni"),
+            headers={"ETag": '"new"'},
+        )
+        feeds = [
+            EventImport.objects.create(
+                source=EventImport.EVE_UNIVERSITY,
+                host=self.host,
+                operation_type=self.category,
+                creator=self.user,
+                etag=etag,
+            )
+            for etag in ['"old"', '"new"']
+        ]
+        # when
+        run_npsi_import()
+        run_npsi_import()
+        # then
+        first, second = requests_mocker.request_history
+        self.assertNotIn("If-None-Match", first.headers)
+        self.assertEqual(second.headers["If-None-Match"], '"new"')
+        for feed in feeds:
+            feed.refresh_from_db()
+            self.assertEqual(feed.etag, '"new"')
+
+    def test_should_fetch_unchanged_feeds_again_when_window_moved(
+        self, mock_feedparser, requests_mocker
+    ):
+        # given
+        requests_mocker.register_uri(
+            "GET",
+            url="https://portal.eveuniversity.org/api/getcalendar",
+            text=generate_ical_string("eve_uni"),
+            headers={"ETag": '"abc"'},
+        )
+        window = (
+            utc.localize(dt.datetime(2021, 1, 1)),
+            utc.localize(dt.datetime(2022, 1, 1)),
+        )
+        feed = EventImport.objects.create(
+            source=EventImport.EVE_UNIVERSITY,
+            host=self.host,
+            operation_type=self.category,
+            creator=self.user,
+            etag='"abc"',
+            import_window_end=window[1] - dt.timedelta(days=1),
+        )
+        # when
+        with patch(MODULE_PATH + ".import_window", lambda: window):
+            run_npsi_import()
+            run_npsi_import()
+        # then
+        first, second = requests_mocker.request_history
+        self.assertNotIn("If-None-Match", first.headers)
+        self.assertEqual(second.headers["If-None-Match"], '"abc"')
+        feed.refresh_from_db()
+        self.assertEqual(feed.import_window_end, window[1])
+
+    def test_should_finalize_once_after_the_last_source(
+        self, mock_feedparser, requests_mocker
+    ):
+        # given
+        requests_mocker.register_uri("GET", url=OPCALENDAR_SPECTRE_URL, text="")
+        mock_feedparser.parse = lambda x: feedparser_parse(OPCALENDAR_SPECTRE_URL)
+        requests_mocker.register_uri(
+            "GET",
+            url="https://portal.eveuniversity.org/api/getcalendar",
+            text=generate_ical_string("eve_uni"),
+        )
+        for source in [EventImport.SPECTRE_FLEET, EventImport.EVE_UNIVERSITY]:
+            EventImport.objects.create(
+                source=source,
+                host=self.host,
+                operation_type=self.category,
+                creator=self.user,
+            )
+        with patch(MODULE_PATH + ".import_npsi_source.apply_async") as mock_import:
+            tasks.import_all_npsi_fleets()
+        source_kwargs = [x[1]["kwargs"] for x in mock_import.call_args_list]
+        run_id = source_kwargs[0]["run_id"]
+        pending_key = tasks.NPSI_IMPORT_PENDING_KEY.format(run_id)
+        # when
+        with patch(MODULE_PATH + ".finalize_npsi_import.apply_async") as mock_finalize:
+            tasks.import_npsi_source(**source_kwargs[0])
+            finalized_early = mock_finalize.called
+            tasks.import_npsi_source(**source_kwargs[1])
+        # then
+        self.assertEqual(len(source_kwargs), 2)
+        self.assertFalse(finalized_early)
+        self.assertEqual(mock_finalize.call_count, 1)
+        self.assertEqual(mock_finalize.call_args[1]["kwargs"], {"run_id": run_id})
+        self.assertEqual(cache.get(pending_key), 0)
+        self.assertTrue(tasks.finalize_npsi_import(run_id))
+        self.assertIsNone(cache.get(pending_key))
+        self.assertEqual(Event.objects.count(), 2)
+
+    def test_should_send_one_summary_for_all_feeds(
+        self, mock_feedparser, requests_mocker
+    ):
+        # given
+        requests_mocker.register_uri("GET", url=OPCALENDAR_SPECTRE_URL, text="")
+        mock_feedparser.parse = lambda x: feedparser_parse(OPCALENDAR_SPECTRE_URL)
+        requests_mocker.register_uri(
+            "GET",
+            url="https://portal.eveuniversity.org/api/getcalendar",
+            text=generate_ical_string("eve_uni"),
+        )
+        webhook = WebHook.objects.create(name="Test", webhook_url="https://x.y/z")
+        visibility = EventVisibility.objects.create(
+            name="NPSI", webhook=webhook, ignore_past_fleets=False
+        )
+        for source in [EventImport.SPECTRE_FLEET, EventImport.EVE_UNIVERSITY]:
+            EventImport.objects.create(
+                source=source,
+                host=self.host,
+                operation_type=self.category,
+                creator=self.user,
+                event_visibility=visibility,
+            )
+        # when
+        with patch("opcalendar.importer.OPCALENDAR_NOTIFY_IMPORTS", True), patch(
+            "opcalendar.models.WebHook.send_embed"
+        ) as mock_send_embed:
+            run_npsi_import()
+        # then
+        self.assertEqual(mock_send_embed.call_count, 1)
+        embed = mock_send_embed.call_args[0][0]
+        self.assertIn("2 new", embed["title"])
+
+
+@patch(MODULE_PATH + ".update_events_for_owner")
+class TestUpdateAllIngameEvents(NoSocketsTestCase):
+    @patch(MODULE_PATH + ".OPCALENDAR_OWNER_SYNC_SPREAD", 240)
+    def test_should_spread_active_owners(self, mock_update_events_for_owner):
+        # given
+        owner_1 = Owner.objects.create()
+        owner_2 = Owner.objects.create()
+        Owner.objects.create(is_active=False)
+        # when
+        tasks.update_all_ingame_events()
+        # then
+        calls = mock_update_events_for_owner.apply_async.call_args_list
+        self.assertEqual(
+            [(x[1]["kwargs"]["owner_pk"], x[1]["countdown"]) for x in calls],
+            [(owner_1.pk, 0), (owner_2.pk, 120)],
+        )
+
+    def test_should_skip_owners_in_backoff(self, mock_update_events_for_owner):
+        # given
+        Owner.objects.create(
+            last_sync_at=now(),
+            last_error=Owner.ERROR_TOKEN_EXPIRED,
+            consecutive_failures=1,
+        )
+        # when
+        tasks.update_all_ingame_events()
+        # then
+        self.assertFalse(mock_update_events_for_owner.apply_async.called)
+
+
+@patch("opcalendar.models.WebHook.schedule_delivery")
+@requests_mock.Mocker()
+class TestSendWebhookMessages(NoSocketsTestCase):
+    def setUp(self) -> None:
+        cache.clear()
+        self.webhook = WebHook.objects.create(
+            name="Test", webhook_url="https://discord.com/api/webhooks/123/abc"
+        )
+        self.webhook.send_embed({"title": "Event"})
+
+    def test_should_send_queued_messages(self, mock_schedule, requests_mocker):
+        # given
+        requests_mocker.register_uri("POST", self.webhook.webhook_url, status_code=204)
+        # when
+        tasks.send_webhook_messages(self.webhook.pk)
+        # then
+        self.assertEqual(requests_mocker.call_count, 1)
+        self.assertFalse(mock_schedule.called)
+
+    def test_should_schedule_next_delivery_when_rate_limited(
+        self, mock_schedule, requests_mocker
+    ):
+        # given
+        requests_mocker.register_uri(
+            "POST",
+            self.webhook.webhook_url,
+            status_code=429,
+            json={"retry_after": 5.0},
+        )
+        # when
+        tasks.send_webhook_messages(self.webhook.pk)
+        # then
+        self.assertAlmostEqual(mock_schedule.call_args[1]["countdown"], 5, delta=1)
+
+    def test_should_skip_when_delivery_already_running(
+        self, mock_schedule, requests_mocker
+    ):
+        # given
+        lock_key = tasks.WEBHOOK_LOCK_KEY.format(self.webhook.pk)
+        cache.add(lock_key, True)
+        # when
+        tasks.send_webhook_messages(self.webhook.pk)
+        # then
+        self.assertFalse(requests_mocker.called)
+        self.assertFalse(mock_schedule.called)
+
+    def test_should_start_delivery_for_webhooks_with_queued_messages(
+        self, mock_schedule, requests_mocker
+    ):
+        # given
+        WebHook.objects.create(name="Empty", webhook_url="https://x.y/z")
+        # when
+        tasks.send_all_webhook_messages()
+        # then
+        self.assertEqual(mock_schedule.call_count, 1)
@@ -0,0 +1,374 @@
+import datetime as dt
+from unittest.mock import patch
+
+import icalendar
+
+from django.contrib.auth.models import Group
+from django.contrib.messages import get_messages
+from django.http import Http404
+from django.core.cache import cache
+from django.test import RequestFactory
+from django.urls import reverse
+from django.utils import timezone
+
+from allianceauth.tests.auth_utils import AuthUtils
+
+from ..models import (
+    Event,
+    EventCategory,
+    EventHost,
+    EventVisibility,
+    UserFeedToken,
+)
+from ..utils import NoSocketsTestCase
+from ..views import EventFeed, user_feed
+
+MODULE_PATH = "opcalendar.views"
+
+
+def create_event(title: str, start_time, user, **kwargs) -> Event:
+    return Event.objects.create(
+        operation_type=EventCategory.objects.get_or_create(name="PvP", ticker="PVP")[0],
+        title=title,
+        host=EventHost.objects.get_or_create(community="Test Host")[0],
+        doctrine="Ferox",
+        formup_system="Jita",
+        description="Bring ammo",
+        start_time=start_time,
+        end_time=start_time + dt.timedelta(hours=1),
+        fc="Bruce Wayne",
+        user=user,
+        **kwargs
+    )
+
+
+class TestCalendarEventsJson(NoSocketsTestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        super().setUpClass()
+        cls.user = AuthUtils.create_user("Bruce Wayne")
+        AuthUtils.add_main_character_2(cls.user, "Bruce Wayne", 1001)
+        cls.user = AuthUtils.add_permission_to_user_by_name(
+            "opcalendar.basic_access", cls.user
+        )
+        cls.group = Group.objects.create(name="Members")
+        cls.visibility = EventVisibility.objects.create(name="Members only")
+        cls.visibility.restricted_to_group.add(cls.group)
+        cls.start_time = timezone.make_aware(dt.datetime(2021, 6, 10, 18, 0))
+
+    def setUp(self) -> None:
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def _get(self, **kwargs):
+        headers = {
+            key: kwargs.pop(key) for key in list(kwargs) if key.startswith("HTTP_")
+        }
+        return self.client.get(
+            reverse("opcalendar:calendar_events_json"), kwargs, **headers
+        )
+
+    def _titles(self, response) -> list:
+        return [x["title"] for x in response.json()["events"]]
+
+    def test_should_return_events_in_range(self):
+        # given
+        create_event("June", self.start_time, self.user)
+        create_event("July", self.start_time + dt.timedelta(days=30), self.user)
+        # when
+        response = self._get(start="2021-06-01", end="2021-07-01")
+        # then
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self._titles(response), ["June"])
+        event = response.json()["events"][0]
+        self.assertEqual(event["type"], "event")
+        self.assertEqual(event["ticker"], "PVP")
+
+    def test_should_default_to_month_of_start(self):
+        # given
+        create_event("June", self.start_time, self.user)
+        create_event("July", self.start_time + dt.timedelta(days=30), self.user)
+        # when
+        response = self._get(start="2021-07-01T00:00:00Z")
+        # then
+        self.assertEqual(self._titles(response), ["July"])
+
+    def test_should_reject_invalid_dates(self):
+        response = self._get(start="tomorrow")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("error", response.json())
+
+    def test_should_reject_invalid_ranges(self):
+        for start, end in [
+            ("2021-06-10", "2021-06-01"),
+            ("2021-06-01", "2021-06-01"),
+            ("2021-01-01", "2021-12-31"),
+        ]:
+            with self.subTest(start=start, end=end):
+                response = self._get(start=start, end=end)
+                self.assertEqual(response.status_code, 400)
+
+    def test_should_only_return_visible_events(self):
+        # given
+        create_event("Open", self.start_time, self.user)
+        create_event(
+            "Restricted", self.start_time, self.user, event_visibility=self.visibility
+        )
+        # when
+        response = self._get(start="2021-06-01")
+        # then
+        self.assertEqual(self._titles(response), ["Open"])
+
+    def test_should_return_not_modified_for_unchanged_range(self):
+        # given
+        create_event("June", self.start_time, self.user)
+        etag = self._get(start="2021-06-01")["ETag"]
+        # when
+        response = self._get(start="2021-06-01", HTTP_IF_NONE_MATCH=etag)
+        # then
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+
+    def test_should_change_etag_when_event_in_range_changes(self):
+        # given
+        event = create_event("June", self.start_time, self.user)
+        etag = self._get(start="2021-06-01")["ETag"]
+        create_event("August", self.start_time + dt.timedelta(days=60), self.user)
+        self.assertEqual(self._get(start="2021-06-01")["ETag"], etag)
+        # when
+        event.title = "Changed"
+        event.save()
+        response = self._get(start="2021-06-01", HTTP_IF_NONE_MATCH=etag)
+        # then
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertEqual(self._titles(response), ["Changed"])
+
+
+class TestEventFeed(NoSocketsTestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        super().setUpClass()
+        cls.user = AuthUtils.create_user("Bruce Wayne")
+        cls.visibility = EventVisibility.objects.create(
+            name="Public", include_in_feed=True
+        )
+        cls.factory = RequestFactory()
+
+    def _create_events(self) -> None:
+        today = timezone.now()
+        for days in [-400, -5, 3, 30, 500]:
+            create_event(
+                "Event %s" % days,
+                today + dt.timedelta(days=days),
+                self.user,
+                event_visibility=self.visibility,
+            )
+        create_event("Not in feed", today, self.user)
+
+    def _get(self, **headers):
+        feed = EventFeed()
+        feed.chunk_size = 2
+        return feed(self.factory.get("/opcalendar/feed.ics", **headers))
+
+    def test_should_stream_events_within_time_window(self):
+        # given
+        self._create_events()
+        # when
+        response = self._get()
+        # then
+        self.assertTrue(response.streaming)
+        calendar = icalendar.Calendar.from_ical(b"".join(response.streaming_content))
+        self.assertCountEqual(
+            [str(x["summary"]) for x in calendar.walk("vevent")],
+            ["Event -5", "Event 3", "Event 30"],
+        )
+
+    def test_should_return_empty_calendar_without_events(self):
+        # when
+        content = b"".join(self._get().streaming_content)
+        # then
+        self.assertTrue(content.startswith(b"BEGIN:VCALENDAR"))
+        self.assertTrue(content.endswith(b"END:VCALENDAR\r\n"))
+        self.assertNotIn(b"BEGIN:VEVENT", content)
+
+    def test_should_return_not_modified_for_unchanged_feed(self):
+        # given
+        self._create_events()
+        response = self._get()
+        # when
+        by_etag = self._get(HTTP_IF_NONE_MATCH=response["ETag"])
+        by_date = self._get(HTTP_IF_MODIFIED_SINCE=response["Last-Modified"])
+        # then
+        self.assertEqual(by_etag.status_code, 304)
+        self.assertEqual(by_date.status_code, 304)
+
+    def test_should_return_feed_again_after_changes(self):
+        # given
+        self._create_events()
+        etag = self._get()["ETag"]
+        event = Event.objects.get(title="Event 3")
+        # when
+        event.title = "Changed"
+        event.save()
+        changed = self._get(HTTP_IF_NONE_MATCH=etag)
+        Event.objects.get(title="Event -5").delete()
+        deleted = self._get(HTTP_IF_NONE_MATCH=changed["ETag"])
+        # then
+        self.assertEqual(changed.status_code, 200)
+        self.assertEqual(deleted.status_code, 200)
+
+
+class TestUserFeed(NoSocketsTestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        super().setUpClass()
+        cls.group = Group.objects.create(name="Members")
+        cls.visibility = EventVisibility.objects.create(name="Members only")
+        cls.visibility.restricted_to_group.add(cls.group)
+        cls.start_time = timezone.now() + dt.timedelta(days=3)
+        creator = AuthUtils.create_user("Alfred Pennyworth")
+        create_event("Open", cls.start_time, creator)
+        create_event(
+            "Restricted", cls.start_time, creator, event_visibility=cls.visibility
+        )
+
+    def setUp(self) -> None:
+        cache.clear()
+        self.user = self._create_user("Bruce Wayne")
+
+    @staticmethod
+    def _create_user(name: str):
+        user = AuthUtils.create_user(name)
+        return AuthUtils.add_permission_to_user_by_name("opcalendar.basic_access", user)
+
+    def _get(self, token: str, **headers):
+        request = RequestFactory().get(
+            reverse("opcalendar:user_feed", args=[token]), **headers
+        )
+        return user_feed(request, token)
+
+    def _summaries(self, response) -> list:
+        calendar = icalendar.Calendar.from_ical(response.content)
+        return [str(x["summary"]) for x in calendar.walk("vevent")]
+
+    def test_should_return_feed_for_valid_token(self):
+        # given
+        feed_token = UserFeedToken.objects.create(user=self.user)
+        # when
+        response = self._get(feed_token.token)
+        # then
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "text/calendar; charset=utf8")
+        self.assertEqual(self._summaries(response), ["[PVP] Open"])
+
+    def test_should_return_404_for_unknown_token(self):
+        with self.assertRaises(Http404):
+            self._get("unknown")
+
+    def test_should_return_404_for_rotated_token(self):
+        # given
+        old_token = UserFeedToken.objects.create(user=self.user).token
+        UserFeedToken.objects.filter(user=self.user).delete()
+        new_token = UserFeedToken.objects.create(user=self.user).token
+        # when/then
+        with self.assertRaises(Http404):
+            self._get(old_token)
+        self.assertEqual(self._get(new_token).status_code, 200)
+
+    def test_should_return_404_for_user_without_access(self):
+        # given
+        user = AuthUtils.create_user("Clark Kent")
+        feed_token = UserFeedToken.objects.create(user=user)
+        # when/then
+        with self.assertRaises(Http404):
+            self._get(feed_token.token)
+
+    def test_should_only_show_events_visible_to_user(self):
+        # given
+        member = self._create_user("Clark Kent")
+        member.groups.add(self.group)
+        member_token = UserFeedToken.objects.create(user=member)
+        user_token = UserFeedToken.objects.create(user=self.user)
+        # when
+        member_response = self._get(member_token.token)
+        user_response = self._get(user_token.token)
+        # then
+        self.assertCountEqual(
+            self._summaries(member_response), ["[PVP] Open", "[PVP] Restricted"]
+        )
+        self.assertEqual(self._summaries(user_response), ["[PVP] Open"])
+        self.assertNotEqual(member_response["ETag"], user_response["ETag"])
+
+    def test_should_share_cached_feed_between_users_with_same_access(self):
+        # given
+        other_user = self._create_user("Clark Kent")
+        token = UserFeedToken.objects.create(user=self.user).token
+        other_token = UserFeedToken.objects.create(user=other_user).token
+        response = self._get(token)
+        # when
+        with patch(MODULE_PATH + "._render_feed") as mock_render_feed:
+            other_response = self._get(other_token)
+        # then
+        self.assertFalse(mock_render_feed.called)
+        self.assertEqual(other_response.content, response.content)
+        self.assertEqual(other_response["ETag"], response["ETag"])
+
+    def test_should_return_not_modified_for_unchanged_feed(self):
+        # given
+        token = UserFeedToken.objects.create(user=self.user).token
+        etag = self._get(token)["ETag"]
+        # when
+        response = self._get(token, HTTP_IF_NONE_MATCH=etag)
+        # then
+        self.assertEqual(response.status_code, 304)
+        self.assertIn("private", response["Cache-Control"])
+
+    def test_should_create_token_and_show_feed_url(self):
+        # given
+        AuthUtils.add_main_character_2(self.user, "Bruce Wayne", 1001)
+        self.client.force_login(self.user)
+        # when
+        response = self.client.get(reverse("opcalendar:user_feed_url"))
+        second_response = self.client.get(reverse("opcalendar:user_feed_url"))
+        # then
+        self.assertRedirects(
+            response, reverse("opcalendar:calendar"), fetch_redirect_response=False
+        )
+        self.assertEqual(second_response.status_code, 302)
+        feed_token = UserFeedToken.objects.get(user=self.user)
+        self.assertIn(
+            feed_token.get_absolute_url(),
+            str(list(get_messages(response.wsgi_request))[0]),
+        )
+
+    def test_should_reset_token(self):
+        # given
+        AuthUtils.add_main_character_2(self.user, "Bruce Wayne", 1001)
+        self.client.force_login(self.user)
+        old_token = UserFeedToken.objects.create(user=self.user).token
+        # when
+        response = self.client.post(reverse("opcalendar:user_feed_token_reset"))
+        # then
+        self.assertRedirects(
+            response, reverse("opcalendar:calendar"), fetch_redirect_response=False
+        )
+        feed_token = UserFeedToken.objects.get(user=self.user)
+        self.assertNotEqual(feed_token.token, old_token)
+        self.assertIn(
+            feed_token.get_absolute_url(),
+            str(list(get_messages(response.wsgi_request))[0]),
+        )
+        with self.assertRaises(Http404):
+            self._get(old_token)
+
+    def test_should_only_reset_token_on_post(self):
+        # given
+        AuthUtils.add_main_character_2(self.user, "Bruce Wayne", 1001)
+        self.client.force_login(self.user)
+        old_token = UserFeedToken.objects.create(user=self.user).token
+        # when
+        response = self.client.get(reverse("opcalendar:user_feed_token_reset"))
+        # then
+        self.assertEqual(response.status_code, 405)
+        self.assertEqual(UserFeedToken.objects.get(user=self.user).token, old_token)
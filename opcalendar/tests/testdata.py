@@ -46,6 +46,7 @@ class FeedsStub:
             self.title = entry.get("title", "")
             self.published = entry.get("published", "")
             self.description = entry.get("description", "")
+            self.id = entry.get("id", "")
 
     def __init__(self, feed) -> None:
         self.entries = (
@@ -7,6 +7,8 @@ app_name = "opcalendar"
 urlpatterns = [
     path("index", views.index, name="index"),
     path("", views.CalendarView.as_view(), name="calendar"),
+    path("events.json", views.calendar_events_json, name="calendar_events_json"),
+    path("styles.css", views.calendar_styles_css, name="calendar_styles"),
     path("event/new/", views.create_event, name="event_new"),
     path("add_ingame_calendar/", views.add_ingame_calendar, name="add_ingame_calendar"),
     path("event/edit/<int:event_id>/", views.EventEdit, name="event_edit"),
@@ -28,6 +30,9 @@ urlpatterns = [
         name="event_member_remove",
     ),
     path("feed.ics", views.EventFeed()),
+    path("feed/", views.user_feed_url, name="user_feed_url"),
+    path("feed/reset/", views.user_feed_token_reset, name="user_feed_token_reset"),
+    path("feed/<str:token>/events.ics", views.user_feed, name="user_feed"),
     path(
         "event/<int:event_id>/details/feed.ics",
         views.EventIcalView(),
@@ -1,6 +1,11 @@
 # cal/views.py
 import calendar
+import copy
 from datetime import datetime, date, timedelta
+import io
+import itertools
+
+import icalendar
 
 from allianceauth.authentication.models import CharacterOwnership
 from allianceauth.eveonline.models import EveCharacter, EveCorporationInfo
@@ -8,20 +13,35 @@ from allianceauth.services.hooks import get_extension_logger
 from django.contrib import messages
 from django.urls import reverse
 from django_ical.views import ICalFeed
-from django.http import JsonResponse
-from .app_settings import get_site_url, structuretimers_active, moonmining_active
+from django.core.cache import cache
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from .app_settings import (
+    get_site_url,
+    structuretimers_active,
+    OPCALENDAR_CALENDAR_CACHE_TIMEOUT,
+    moonmining_active,
+    OPCALENDAR_DISPLAY_STRUCTURETIMERS,
+    OPCALENDAR_DISPLAY_MOONMINING,
+    OPCALENDAR_FEED_LOOKAHEAD_DAYS,
+    OPCALENDAR_FEED_LOOKBACK_DAYS,
+)
+from django.views.decorators.http import require_POST
 from django.views.generic import ListView
 from django.shortcuts import render, redirect
 from django.http import HttpResponse, HttpResponseRedirect
 from django.shortcuts import get_object_or_404
 from django.contrib.auth.decorators import login_required, permission_required
 from django.contrib.auth.mixins import LoginRequiredMixin, PermissionRequiredMixin
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.dateparse import parse_date, parse_datetime
 from django.utils.html import format_html
+from django.utils.http import http_date
 from django.utils.safestring import mark_safe
 from django.utils.translation import gettext_lazy
 from django.utils.translation import ugettext_lazy as _
 from django.db import transaction
-from django.db.models import Q
+from django.db.models import Count, Max
 
 from esi.decorators import token_required
 from opcalendar.models import (
@@ -31,15 +51,30 @@ from opcalendar.models import (
     EventMember,
     IngameEvents,
     Owner,
+    UserFeedToken,
 )
 from django.core import serializers
 from . import tasks
 from .utils import messages_plus
+from .caching import fingerprint, last_modified, month_generation
 from .calendar import Calendar
 from .forms import EventForm
+from .styles import calendar_styles
+
+if structuretimers_active():
+    from structuretimers.models import Timer
+
+if moonmining_active():
+    from moonmining.models import Extraction
 
 logger = get_extension_logger(__name__)
 
+# Longest date range that can be requested from the JSON calendar API
+CALENDAR_API_MAX_DAYS = 93
+
+# Seconds browsers may cache a versioned stylesheet
+STYLES_MAX_AGE = 31536000
+
 
 @login_required(login_url="signup")
 def index(request):
@@ -155,6 +190,242 @@ class CalendarView(LoginRequiredMixin, PermissionRequiredMixin, ListView):
         return context
 
 
+def _parse_range_param(value):
+    """parses a date or datetime query parameter into an aware datetime"""
+    if not value:
+        return None
+    result = parse_datetime(value)
+    if result is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError("Invalid date: {}".format(value))
+        result = datetime.combine(day, datetime.min.time())
+    if timezone.is_naive(result):
+        result = timezone.make_aware(result)
+    return result
+
+
+def _months_in_range(start, end) -> list:
+    """returns all (year, month) tuples touched by the half-open range"""
+    start = timezone.localtime(start)
+    end = timezone.localtime(end - timedelta(microseconds=1))
+    months = []
+    year, month = start.year, start.month
+    while (year, month) <= (end.year, end.month):
+        months.append((year, month))
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return months
+
+
+def _calendar_records(user, start, end, timers) -> list:
+    """returns compact records for all events within the given range"""
+    records = []
+
+    for row in (
+        Event.objects.visible_to(user)
+        .filter(start_time__gte=start, start_time__lt=end)
+        .values(
+            "id",
+            "title",
+            "start_time",
+            "end_time",
+            "host__community",
+            "operation_type__name",
+            "operation_type__ticker",
+            "event_visibility__name",
+        )
+    ):
+        records.append(
+            {
+                "type": "event",
+                "id": row["id"],
+                "title": row["title"],
+                "start": row["start_time"],
+                "end": row["end_time"],
+                "host": row["host__community"],
+                "category": row["operation_type__name"],
+                "ticker": row["operation_type__ticker"],
+                "visibility": row["event_visibility__name"],
+                "url": reverse("opcalendar:event-detail", args=(row["id"],)),
+            }
+        )
+
+    for row in (
+        IngameEvents.objects.visible_to(user)
+        .filter(event_start_date__gte=start, event_start_date__lt=end)
+        .values(
+            "event_id",
+            "title",
+            "event_start_date",
+            "event_end_date",
+            "owner_name",
+            "owner__operation_type__name",
+            "owner__event_visibility__name",
+        )
+    ):
+        records.append(
+            {
+                "type": "ingame",
+                "id": row["event_id"],
+                "title": row["title"],
+                "start": row["event_start_date"],
+                "end": row["event_end_date"],
+                "host": row["owner_name"],
+                "category": row["owner__operation_type__name"],
+                "visibility": row["owner__event_visibility__name"],
+                "url": reverse(
+                    "opcalendar:ingame-event-detail", args=(row["event_id"],)
+                ),
+            }
+        )
+
+    if timers is not None:
+        for row in timers.values(
+            "id",
+            "date",
+            "objective",
+            "eve_solar_system__name",
+            "structure_type__name",
+        ):
+            records.append(
+                {
+                    "type": "structuretimer",
+                    "id": row["id"],
+                    "start": row["date"],
+                    "objective": row["objective"],
+                    "system": row["eve_solar_system__name"],
+                    "structure_type": row["structure_type__name"],
+                }
+            )
+
+    if (
+        moonmining_active()
+        and OPCALENDAR_DISPLAY_MOONMINING
+        and user.has_perm("moonmining.extractions_access")
+    ):
+        for row in Extraction.objects.filter(
+            chunk_arrival_at__gte=start, chunk_arrival_at__lt=end
+        ).values(
+            "id", "chunk_arrival_at", "refinery__name", "refinery__moon__eve_moon__name"
+        ):
+            records.append(
+                {
+                    "type": "moonmining",
+                    "id": row["id"],
+                    "start": row["chunk_arrival_at"],
+                    "refinery": row["refinery__name"],
+                    "moon": row["refinery__moon__eve_moon__name"],
+                    "url": "/moonmining/extraction/{}?new_page=yes".format(row["id"]),
+                }
+            )
+
+    return sorted(records, key=lambda x: x["start"])
+
+
+def _visible_timers(user, start, end):
+    """returns the structure timers the user can see within the range
+    or None if timers are not shown
+    """
+    if structuretimers_active() and OPCALENDAR_DISPLAY_STRUCTURETIMERS:
+        return (
+            Timer.objects.all()
+            .visible_to_user(user)
+            .filter(date__gte=start, date__lt=end)
+        )
+    return None
+
+
+def _calendar_etag(user, start, end, timers) -> str:
+    """ETag for all events the user can see within the range.
+
+    Derived from cache generations so unchanged ranges can be answered
+    without loading any events. Users with the same access share the same ETag.
+    """
+    etag_parts = [
+        start.isoformat(),
+        end.isoformat(),
+        fingerprint(EventVisibility.objects.visible_ids_for_user(user)),
+        str(int(user.has_perm("moonmining.extractions_access"))),
+    ]
+    etag_parts += [month_generation(*month) for month in _months_in_range(start, end)]
+    if timers is not None:
+        etag_parts.append(fingerprint(timers.values_list("pk", flat=True)))
+    return '"{}"'.format(fingerprint(etag_parts))
+
+
+@login_required
+@permission_required("opcalendar.basic_access")
+def calendar_events_json(request):
+    """Returns all events visible for the user between start and end as JSON.
+
+    Supports conditional requests with ETag and Last-Modified headers.
+    """
+    try:
+        start = _parse_range_param(request.GET.get("start"))
+        end = _parse_range_param(request.GET.get("end"))
+    except ValueError as ex:
+        return JsonResponse({"error": str(ex)}, status=400)
+
+    if start is None:
+        start = timezone.localtime().replace(
+            day=1, hour=0, minute=0, second=0, microsecond=0
+        )
+    if end is None:
+        end = start + timedelta(days=calendar.monthrange(start.year, start.month)[1])
+
+    if end <= start or end - start > timedelta(days=CALENDAR_API_MAX_DAYS):
+        return JsonResponse(
+            {
+                "error": "end must be after start and the range can not exceed %s days"
+                % CALENDAR_API_MAX_DAYS
+            },
+            status=400,
+        )
+
+    user = request.user
+
+    timers = _visible_timers(user, start, end)
+    etag = _calendar_etag(user, start, end, timers)
+    modified = int(last_modified().timestamp())
+
+    response = get_conditional_response(request, etag=etag, last_modified=modified)
+    if response is None:
+        response = JsonResponse(
+            {
+                "start": start,
+                "end": end,
+                "events": _calendar_records(user, start, end, timers),
+            }
+        )
+
+    response["ETag"] = etag
+    response["Last-Modified"] = http_date(modified)
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+@login_required
+@permission_required("opcalendar.basic_access")
+def calendar_styles_css(request):
+    """Returns the stylesheet for all visibility filters and categories.
+
+    Requests for the current version can be cached forever by browsers.
+    """
+    styles = calendar_styles()
+    etag = '"{}"'.format(styles["version"])
+
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = HttpResponse(styles["css"], content_type="text/css")
+
+    response["ETag"] = etag
+    if request.GET.get("v") == styles["version"]:
+        patch_cache_control(response, private=True, max_age=STYLES_MAX_AGE)
+    else:
+        patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
 @login_required
 @permission_required("opcalendar.create_event")
 def create_event(request):
@@ -214,22 +485,30 @@ def event_details(request, event_id):
 
     try:
         event = (
-            Event.objects.filter(
-                Q(event_visibility__restricted_to_group__in=request.user.groups.all())
-                | Q(event_visibility__restricted_to_group__isnull=True),
-            )
-            .filter(
-                Q(event_visibility__restricted_to_state=request.user.profile.state)
-                | Q(event_visibility__restricted_to_state__isnull=True),
-            )
+            Event.objects.visible_to(request.user)
+            .for_display()
+            .select_related("eve_character")
             .get(id=event_id)
         )
-        eventmember = EventMember.objects.filter(event=event)
-        memberlist = []
-        for member in eventmember:
-            memberlist.append(member.character.character_name)
+        is_signed_up = EventMember.objects.filter(
+            event=event, character=request.user.profile.main_character
+        ).exists()
+
+        # Only load the signups for users allowed to see them
+        if request.user.has_perm("opcalendar.see_signups"):
+            eventmember = (
+                EventMember.objects.filter(event=event)
+                .select_related("character")
+                .order_by("pk")
+            )
+        else:
+            eventmember = EventMember.objects.none()
 
-        context = {"event": event, "eventmember": eventmember, "memberlist": memberlist}
+        context = {
+            "event": event,
+            "eventmember": eventmember,
+            "is_signed_up": is_signed_up,
+        }
 
         return render(request, "opcalendar/event-details.html", context)
 
@@ -291,7 +570,7 @@ def EventEdit(request, event_id):
 @login_required
 @permission_required("opcalendar.basic_access")
 def ingame_event_details(request, event_id):
-    event = IngameEvents.objects.get(event_id=event_id)
+    event = IngameEvents.objects.for_display().get(event_id=event_id)
 
     context = {"event": event}
 
@@ -319,17 +598,22 @@ def EventDeleteView(request, event_id):
 @permission_required("opcalendar.basic_access")
 def EventMemberSignup(request, event_id):
 
-    event = Event.objects.get(id=event_id)
+    event = get_object_or_404(Event.objects.visible_to(request.user), id=event_id)
 
     character = request.user.profile.main_character
 
-    EventMember.objects.create(event=event, character=character)
-
-    messages.success(
-        request,
-        _("Succesfully signed up for event: %(event)s with %(character)s.")
-        % {"event": event, "character": character},
-    )
+    if event.signup(character):
+        messages.success(
+            request,
+            _("Succesfully signed up for event: %(event)s with %(character)s.")
+            % {"event": event, "character": character},
+        )
+    else:
+        messages.info(
+            request,
+            _("%(character)s is already signed up for event: %(event)s.")
+            % {"event": event, "character": character},
+        )
 
     return HttpResponseRedirect(request.META.get("HTTP_REFERER"))
 
@@ -338,13 +622,11 @@ def EventMemberSignup(request, event_id):
 @permission_required("opcalendar.basic_access")
 def EventMemberRemove(request, event_id):
 
-    event = Event.objects.get(id=event_id)
+    event = get_object_or_404(Event.objects.visible_to(request.user), id=event_id)
 
     character = request.user.profile.main_character
 
-    eventmember = EventMember.objects.filter(event=event, character=character)
-
-    eventmember.delete()
+    event.remove_signup(character)
 
     messages.error(
         request,
@@ -355,6 +637,130 @@ def EventMemberRemove(request, event_id):
     return HttpResponseRedirect(request.META.get("HTTP_REFERER"))
 
 
+def _feed_window() -> tuple:
+    """returns the time range of events included in ical feeds"""
+    today = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    return (
+        today - timedelta(days=OPCALENDAR_FEED_LOOKBACK_DAYS),
+        today + timedelta(days=OPCALENDAR_FEED_LOOKAHEAD_DAYS + 1),
+    )
+
+
+TIMER_OBJECTIVES = {
+    "HO": "Hostile",
+    "FR": "Friendly",
+    "NE": "Neutral",
+    "UN": "Undefined",
+}
+
+
+def _record_to_vevent(record: dict) -> icalendar.Event:
+    event = icalendar.Event()
+    event.add("uid", "{}-{}@opcalendar".format(record["type"], record["id"]))
+    event.add("dtstamp", timezone.now())
+    event.add("dtstart", record["start"])
+    event.add("dtend", record.get("end") or record["start"])
+
+    if record["type"] == "event":
+        summary = "[{}] {}".format(record["ticker"], record["title"])
+    elif record["type"] == "ingame":
+        summary = record["title"]
+    elif record["type"] == "structuretimer":
+        summary = "{} structure timer: {}".format(
+            TIMER_OBJECTIVES.get(record["objective"], "Undefined"),
+            record["structure_type"],
+        )
+        event.add("location", record["system"])
+    else:
+        summary = "Moon chunk arrival {}".format(record["moon"])
+        event.add("location", record["refinery"])
+    event.add("summary", summary)
+
+    if record.get("host"):
+        event.add("description", "Host: {}".format(record["host"]))
+    if record.get("url"):
+        event.add("url", get_site_url() + record["url"])
+    return event
+
+
+def _render_feed(records: list) -> bytes:
+    cal = icalendar.Calendar()
+    cal.add("version", "2.0")
+    cal.add("prodid", "-//{}//Opcalendar//FEED".format(get_site_url()))
+    cal.add("calscale", "GREGORIAN")
+    cal.add("method", "PUBLISH")
+    cal.add("x-wr-calname", "Opcalendar")
+    cal.add("x-wr-timezone", "UTC")
+    for record in records:
+        cal.add_component(_record_to_vevent(record))
+    return cal.to_ical()
+
+
+def user_feed(request, token):
+    """Personal ical feed with all events the owner of the token can see.
+
+    The token in the URL authenticates the user, so no login is required.
+    Users with the same access share the same cached feed.
+    """
+    feed_token = get_object_or_404(
+        UserFeedToken.objects.select_related("user__profile"), token=token
+    )
+    user = feed_token.user
+    if not user.is_active or not user.has_perm("opcalendar.basic_access"):
+        raise Http404("Feed does not exist")
+
+    start, end = _feed_window()
+    timers = _visible_timers(user, start, end)
+    etag = _calendar_etag(user, start, end, timers)
+
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        key = "opcalendar-user-feed-{}".format(etag.strip('"'))
+        body = cache.get(key)
+        if body is None:
+            body = _render_feed(_calendar_records(user, start, end, timers))
+            cache.set(key, body, OPCALENDAR_CALENDAR_CACHE_TIMEOUT)
+
+        response = HttpResponse(body, content_type="text/calendar; charset=utf8")
+        response["Content-Disposition"] = 'attachment; filename="events.ics"'
+
+    response["ETag"] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def _show_feed_url(request, feed_token: UserFeedToken) -> None:
+    messages.info(
+        request,
+        format_html(
+            "{} <code>{}</code>",
+            _("Your personal calendar feed. Keep this URL secret:"),
+            request.build_absolute_uri(feed_token.get_absolute_url()),
+        ),
+    )
+
+
+@login_required
+@permission_required("opcalendar.basic_access")
+def user_feed_url(request):
+    """Shows the URL of the personal ical feed of the user"""
+    feed_token, _created = UserFeedToken.objects.get_or_create(user=request.user)
+    _show_feed_url(request, feed_token)
+    return redirect("opcalendar:calendar")
+
+
+@login_required
+@permission_required("opcalendar.basic_access")
+@require_POST
+def user_feed_token_reset(request):
+    """Replaces the personal feed token of the user, so the old URL stops working"""
+    with transaction.atomic():
+        UserFeedToken.objects.filter(user=request.user).delete()
+        feed_token = UserFeedToken.objects.create(user=request.user)
+    _show_feed_url(request, feed_token)
+    return redirect("opcalendar:calendar")
+
+
 class EventFeed(ICalFeed):
     """
     A simple event calender
@@ -364,11 +770,79 @@ class EventFeed(ICalFeed):
     timezone = "UTC"
     file_name = "event.ics"
 
+    # Number of events rendered at once while streaming the feed
+    chunk_size = 200
+
+    # Events rendered by the current chunk, only set on copies of the feed
+    _chunk = None
+
+    def __call__(self, request, *args, **kwargs):
+        events = self.items()
+        stats = events.aggregate(count=Count("pk"), updated=Max("updated_date"))
+        window_start, window_end = _feed_window()
+
+        etag = '"{}"'.format(
+            fingerprint(
+                [
+                    window_start.isoformat(),
+                    window_end.isoformat(),
+                    str(stats["count"]),
+                    stats["updated"].isoformat() if stats["updated"] else "",
+                ]
+            )
+        )
+        modified = int(stats["updated"].timestamp()) if stats["updated"] else None
+
+        response = get_conditional_response(request, etag=etag, last_modified=modified)
+        if response is None:
+            response = StreamingHttpResponse(
+                self._stream(request, events),
+                content_type=self.feed_type.mime_type,
+            )
+            response["Content-Disposition"] = 'attachment; filename="%s"' % (
+                self.file_name
+            )
+
+        response["ETag"] = etag
+        if modified:
+            response["Last-Modified"] = http_date(modified)
+        return response
+
+    def _stream(self, request, events):
+        """renders the feed as chunks of VEVENTs without loading all events"""
+        feed = copy.copy(self)
+        calendar_end = b"END:VCALENDAR\r\n"
+
+        # Calendar header without any events
+        feed._chunk = []
+        header = io.BytesIO()
+        feed.get_feed(None, request).write(header, "utf-8")
+        yield header.getvalue()[: -len(calendar_end)]
+
+        iterator = events.iterator(chunk_size=self.chunk_size)
+        while True:
+            feed._chunk = list(itertools.islice(iterator, self.chunk_size))
+            if not feed._chunk:
+                break
+            calendar = icalendar.Calendar()
+            feed.get_feed(None, request).write_items(calendar)
+            yield b"".join(event.to_ical() for event in calendar.subcomponents)
+
+        yield calendar_end
+
     def items(self):
+        if self._chunk is not None:
+            return self._chunk
+
+        window_start, window_end = _feed_window()
         return (
             Event.objects.all()
             .order_by("-start_time")
-            .filter(event_visibility__include_in_feed=True)
+            .filter(
+                event_visibility__include_in_feed=True,
+                start_time__gte=window_start,
+                start_time__lt=window_end,
+            )
         )
 
     def item_guid(self, item):
@@ -393,6 +867,12 @@ class EventFeed(ICalFeed):
     def item_end_datetime(self, item):
         return item.end_time
 
+    def item_created(self, item):
+        return item.created_date
+
+    def item_updateddate(self, item):
+        return item.updated_date
+
     def item_link(self, item):
         return "{0}/opcalendar/event/{1}/details/".format(get_site_url(), item.id)
 
@@ -413,18 +893,9 @@ class EventIcalView(ICalFeed):
 
     def items(self, event_id):
         return (
-            Event.objects.all()
+            Event.objects.visible_to(self.request.user)
+            .for_display()
             .filter(id=self.event_id)
-            .filter(
-                Q(
-                    event_visibility__restricted_to_group__in=self.request.user.groups.all()
-                )
-                | Q(event_visibility__restricted_to_group__isnull=True),
-            )
-            .filter(
-                Q(event_visibility__restricted_to_state=self.request.user.profile.state)
-                | Q(event_visibility__restricted_to_state__isnull=True),
-            )
         )
 
     def item_guid(self, item):
@@ -262,7 +262,7 @@ SITE_NAME = "testauth"
 DEBUG = False
 
 # Add any additional apps to this list.
-INSTALLED_APPS += ["opcalendar"]
+INSTALLED_APPS += ["allianceauth.services.modules.discord", "opcalendar"]
 
 # Enter credentials to use MySQL/MariaDB. Comment out to use sqlite3
 """
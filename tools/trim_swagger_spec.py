@@ -0,0 +1,100 @@
+"""Trims an ESI swagger spec down to the operations used by opcalendar.
+
+Usage:
+    python tools/trim_swagger_spec.py SOURCE [DESTINATION]
+
+SOURCE can be a path or URL to a full ESI spec,
+e.g. https://esi.evetech.net/latest/swagger.json
+DESTINATION defaults to opcalendar/swagger.json
+"""
+import json
+from pathlib import Path
+import sys
+from urllib.request import urlopen
+
+# ESI operations used by opcalendar
+OPERATIONS = {
+    "get_alliances_alliance_id",
+    "get_characters_character_id_calendar",
+    "get_characters_character_id_calendar_event_id",
+    "get_corporations_corporation_id",
+    "post_universe_names",
+}
+
+DEFAULT_DESTINATION = Path(__file__).parent.parent / "opcalendar" / "swagger.json"
+
+
+def _refs(obj) -> set:
+    """returns all $ref values in obj"""
+    if isinstance(obj, dict):
+        refs = {obj["$ref"]} if isinstance(obj.get("$ref"), str) else set()
+        for value in obj.values():
+            refs |= _refs(value)
+        return refs
+
+    if isinstance(obj, list):
+        refs = set()
+        for value in obj:
+            refs |= _refs(value)
+        return refs
+
+    return set()
+
+
+def trim_spec(spec: dict) -> dict:
+    paths = dict()
+    for path, methods in spec["paths"].items():
+        kept = {
+            method: operation
+            for method, operation in methods.items()
+            if isinstance(operation, dict)
+            and operation.get("operationId") in OPERATIONS
+        }
+        if kept:
+            paths[path] = kept
+
+    missing = OPERATIONS - {
+        operation["operationId"]
+        for methods in paths.values()
+        for operation in methods.values()
+    }
+    if missing:
+        raise ValueError("Operations not found in spec: {}".format(missing))
+
+    trimmed = {key: value for key, value in spec.items() if key != "paths"}
+    trimmed["paths"] = paths
+
+    # Only keep shared parameters and definitions the operations refer to
+    for section in ("parameters", "definitions"):
+        prefix = "#/{}/".format(section)
+        used = {ref[len(prefix) :] for ref in _refs(paths) if ref.startswith(prefix)}
+        trimmed[section] = {
+            key: value for key, value in spec.get(section, {}).items() if key in used
+        }
+
+    return trimmed
+
+
+def main():
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+
+    source = sys.argv[1]
+    destination = Path(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_DESTINATION
+
+    if source.startswith("http"):
+        with urlopen(source) as response:
+            spec = json.load(response)
+    else:
+        with open(source, encoding="utf-8") as fp:
+            spec = json.load(fp)
+
+    with destination.open("w", encoding="utf-8") as fp:
+        json.dump(trim_spec(spec), fp, separators=(",", ":"), sort_keys=True)
+
+    print("Wrote {} operations to {}".format(len(OPERATIONS), destination))
+
+
+if __name__ == "__main__":
+    main()